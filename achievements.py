@@ -1,69 +1,106 @@
-from datetime import datetime
-from db import get_sleep_data, get_achievements, insert_achievement
-from utils import calculate_sleep_duration
-from config import ACHIEVEMENT_NAMES
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
 
+from db import SleepRow, UserSleepStats, get_user_stats, get_achievements, get_recent_sleep_data, insert_achievements
+from config import ACHIEVEMENT_NAMES, ACHIEVEMENT_CACHE_SIZE
 
-async def check_achievements(user_id):
-    user_data = await get_sleep_data(user_id)
-    achievements = await get_achievements(user_id)
 
-    new_achievements = []
+@dataclass(frozen=True)
+class AchievementRule:
+    """Правило достижения.
 
-    if len(user_data) >= 3 and ACHIEVEMENT_NAMES['newbie'] not in achievements:
-        new_achievements.append(ACHIEVEMENT_NAMES['newbie'])
+    window — сколько последних записей о сне нужно предикату (0 — хватает
+    строки статистики). Записи передаются в хронологическом порядке.
+    """
+    key: str
+    window: int
+    predicate: Callable[[UserSleepStats, Sequence[SleepRow]], bool]
 
-    if len(user_data) >= 7 and ACHIEVEMENT_NAMES['expert'] not in achievements:
-        new_achievements.append(ACHIEVEMENT_NAMES['expert'])
+    @property
+    def name(self) -> str:
+        return ACHIEVEMENT_NAMES[self.key]
 
-    if len(user_data) >= 30 and ACHIEVEMENT_NAMES['master'] not in achievements:
-        new_achievements.append(ACHIEVEMENT_NAMES['master'])
 
-    if len(user_data) >= 100 and ACHIEVEMENT_NAMES['lord'] not in achievements:
-        new_achievements.append(ACHIEVEMENT_NAMES['lord'])
+RULES = (
+    AchievementRule('newbie', 0, lambda stats, recent: stats.entry_count >= 3),
+    AchievementRule('expert', 0, lambda stats, recent: stats.entry_count >= 7),
+    AchievementRule('master', 0, lambda stats, recent: stats.entry_count >= 30),
+    AchievementRule('lord', 0, lambda stats, recent: stats.entry_count >= 100),
+    # Ранняя пташка: последние 5 записей с отходом, у которого час меньше 22
+    AchievementRule('early_bird', 0, lambda stats, recent: stats.entry_count >= 5 and stats.bed_max < 22 * 60),
+    # Ночная сова: последние 5 записей с поздним отходом (>= 00:30)
+    AchievementRule('night_owl', 0, lambda stats, recent: stats.entry_count >= 5 and stats.bed_min >= 30),
+    # Идеальный сон: продолжительность последнего сна от 7 до 9 часов
+    AchievementRule('perfect_sleep', 1, lambda stats, recent: 7 * 60 <= recent[-1][2] <= 9 * 60),
+    # "Стабильный режим": ложится и встает примерно в одно и то же время (разница не более 30 минут) 5 дней подряд.
+    AchievementRule('stable_regime', 0, lambda stats, recent: stats.schedule_streak >= 5),
+)
 
-    if len(user_data) >= 5 and all(datetime.strptime(entry[0], '%H:%M').hour < 22 for entry in user_data[-5:]) and ACHIEVEMENT_NAMES['early_bird'] not in achievements:
-        new_achievements.append(ACHIEVEMENT_NAMES['early_bird'])
+_RULE_BITS = {rule.name: 1 << i for i, rule in enumerate(RULES)}
+_ALL_EARNED = (1 << len(RULES)) - 1
 
-    # Ночная сова: последние 5 записей с поздним отходом (>= 00:30)
-    def is_late_bedtime(hhmm: str) -> bool:
-        t = datetime.strptime(hhmm, '%H:%M')
-        return t.hour > 0 or (t.hour == 0 and t.minute >= 30)
+# Битовые маски полученных достижений для недавно активных пользователей
+_earned_cache: 'OrderedDict[int, int]' = OrderedDict()
 
-    if len(user_data) >= 5 and all(is_late_bedtime(entry[0]) for entry in user_data[-5:]) and ACHIEVEMENT_NAMES['night_owl'] not in achievements:
-        new_achievements.append(ACHIEVEMENT_NAMES['night_owl'])
 
-    # Идеальный сон: продолжительность последнего сна от 7 до 9 часов
-    if user_data:
-        last_sleep_entry = user_data[-1]
-        sleep_duration = calculate_sleep_duration(
-            last_sleep_entry[0], last_sleep_entry[1])
-        if 7 <= sleep_duration <= 9 and ACHIEVEMENT_NAMES['perfect_sleep'] not in achievements:
-            new_achievements.append(ACHIEVEMENT_NAMES['perfect_sleep'])
+async def get_earned_mask(user_id: int) -> int:
+    """Битовая маска полученных достижений (бит i — RULES[i]); для активных пользователей без запроса к базе."""
+    mask = _earned_cache.get(user_id)
+    if mask is None:
+        mask = 0
+        for name in await get_achievements(user_id):
+            mask |= _RULE_BITS.get(name, 0)
+        _earned_cache[user_id] = mask
+        if len(_earned_cache) > ACHIEVEMENT_CACHE_SIZE:
+            _earned_cache.popitem(last=False)
+    else:
+        _earned_cache.move_to_end(user_id)
+    return mask
+
+
+def earned_rules(mask: int) -> List[AchievementRule]:
+    """Правила из маски get_earned_mask в порядке RULES."""
+    return [rule for rule in RULES if mask & _RULE_BITS[rule.name]]
 
-    # "Стабильный режим": ложится и встает примерно в одно и то же время (разница не более 30 минут) 5 дней подряд.
-    def time_to_minutes(hhmm: str) -> int:
-        t = datetime.strptime(hhmm, '%H:%M')
-        minutes = t.hour * 60 + t.minute
-        if t.hour < 12:  # Сдвигаем утренние часы вперед для корректного сравнения
-            minutes += 24 * 60
-        return minutes
 
-    if len(user_data) >= 5 and ACHIEVEMENT_NAMES['stable_regime'] not in achievements:
-        last_five_entries = user_data[-5:]
+def forget_user(user_id: int) -> None:
+    """Сбрасывает кэш достижений пользователя, если они менялись в обход check_achievements."""
+    _earned_cache.pop(user_id, None)
 
-        sleep_times_in_minutes = [time_to_minutes(
-            entry[0]) for entry in last_five_entries]
-        wake_times_in_minutes = [time_to_minutes(
-            entry[1]) for entry in last_five_entries]
 
-        sleep_diff = max(sleep_times_in_minutes) - min(sleep_times_in_minutes)
-        wake_diff = max(wake_times_in_minutes) - min(wake_times_in_minutes)
+async def check_achievements(user_id: int, new_entry: Optional[SleepRow] = None) -> List[str]:
+    """Проверяет еще не полученные достижения и сохраняет новые одной транзакцией.
 
-        if sleep_diff <= 30 and wake_diff <= 30:
-            new_achievements.append(ACHIEVEMENT_NAMES['stable_regime'])
+    new_entry — только что записанная строка (sleep_min, wake_min, duration_min, day);
+    если она передана, правилам с окном в одну запись не нужен запрос к базе.
+    """
+    earned = await get_earned_mask(user_id)
+    if earned == _ALL_EARNED:
+        return []
+    pending = [rule for rule in RULES if not earned & _RULE_BITS[rule.name]]
 
-    for achievement in new_achievements:
-        await insert_achievement(user_id, achievement)
+    stats = await get_user_stats(user_id)
+    if stats is None:
+        return []
+
+    window = max(rule.window for rule in pending)
+    if window == 0:
+        recent: Sequence[SleepRow] = ()
+    elif window == 1 and new_entry is not None:
+        recent = (new_entry,)
+    else:
+        recent = await get_recent_sleep_data(user_id, window)
+
+    new_achievements = []
+    for rule in pending:
+        if len(recent) < rule.window:
+            continue
+        if rule.predicate(stats, recent[len(recent) - rule.window:]):
+            new_achievements.append(rule.name)
+            earned |= _RULE_BITS[rule.name]
+
+    await insert_achievements(user_id, new_achievements)
+    _earned_cache[user_id] = earned
 
     return new_achievements
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import time
+from typing import List, Sequence, Tuple
+
+from telegram.ext import ContextTypes
+from analysis import ANALYSIS_WINDOW, choose_advice
+from config import ADVICE_BATCH_USERS
+from db import stream_sleep_windows, stream_short_history_users, save_advice
+
+logger = logging.getLogger(__name__)
+
+
+def compute_advice(rows: Sequence[Tuple[int, int, int, int, int]], window: int = ANALYSIS_WINDOW) -> List[Tuple[int, int, str]]:
+    """Считает советы для пачки из stream_sleep_windows сразу для всех пользователей.
+
+    Возвращает строки (user_id, data_version, tip) для advice_cache.
+    """
+    import numpy as np
+
+    data = np.asarray(rows, dtype=np.int64).reshape(-1, window, 5)
+    user_ids = data[:, 0, 0]
+    versions = data[:, 0, 1]
+    beds, wakes, durations = data[:, :, 2], data[:, :, 3], data[:, :, 4]
+
+    # Те же сигналы, что и в analyze_sleep_data, но по матрице пользователи x дни
+    avg_durations = durations.sum(axis=1) / window / 60
+    avg_diffs = np.abs(np.diff(wakes, axis=1)).sum(axis=1) / (window - 1) / 60
+    late_counts = ((beds >= 60) & (beds < 12 * 60)).sum(axis=1)
+
+    return [
+        (user_id, version, choose_advice(avg_duration, avg_diff, late_count))
+        for user_id, version, avg_duration, avg_diff, late_count in zip(
+            user_ids.tolist(), versions.tolist(), avg_durations.tolist(),
+            avg_diffs.tolist(), late_counts.tolist())
+    ]
+
+
+async def refresh_advice(batch_users: int = ADVICE_BATCH_USERS) -> int:
+    """Пересчитывает персональные советы всех пользователей. Возвращает число пользователей."""
+    started = time.perf_counter()
+    users = 0
+    async for rows in stream_sleep_windows(ANALYSIS_WINDOW, batch_users):
+        # NumPy считает пачку в отдельном потоке, чтобы не останавливать обработку обновлений
+        advice = await asyncio.to_thread(compute_advice, rows)
+        await save_advice(advice)
+        users += len(advice)
+
+    # Пустой совет запоминает, что данных для персонального совета пока мало
+    async for short_users in stream_short_history_users(ANALYSIS_WINDOW, batch_users):
+        await save_advice([(user_id, version, '') for user_id, version in short_users])
+        users += len(short_users)
+
+    logger.info(f"Advice refreshed for {users} users in {time.perf_counter() - started:.1f} s.")
+    return users
+
+
+async def refresh_advice_job(_: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задача JobQueue для периодического пересчета советов."""
+    try:
+        await refresh_advice()
+    except Exception as e:
+        logger.error(f"Advice batch failed: {e}", exc_info=True)
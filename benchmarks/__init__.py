@@ -0,0 +1,7 @@
+"""Бенчмарки обработчиков, анализа и слоя базы данных.
+
+Запуск: ``python -m benchmarks run --rows 100000 --out results.json``,
+сравнение двух прогонов: ``python -m benchmarks compare before.json after.json``,
+проверка времени холодного запуска: ``python -m benchmarks startup --rows small``,
+сквозная нагрузка через локальный Bot API: ``python -m benchmarks load --rows medium --users 10 50 100``.
+"""
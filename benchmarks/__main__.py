@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from benchmarks.datagen import generate_database
+from benchmarks.runner import OPERATIONS, run_benchmarks
+from benchmarks.coldstart import measure_cold_start, summarize
+from benchmarks.render import compare_renderers
+from benchmarks.loadgen import run_load, saturation_point
+from renderers import RENDERERS
+from config import STARTUP_BUDGET
+
+# Размеры баз по умолчанию: маленькая, средняя и большая
+PRESET_ROWS = {'small': 1_000, 'medium': 100_000, 'large': 10_000_000}
+
+
+def _database_path(directory: str, rows: int) -> str:
+    return os.path.join(directory, f'sleepbot_{rows}.db')
+
+
+def generate(args: argparse.Namespace) -> None:
+    os.makedirs(args.dir, exist_ok=True)
+    for rows in args.rows:
+        path = _database_path(args.dir, rows)
+        if os.path.exists(path) and not args.force:
+            print(f'{path} уже существует, пропускаем (используйте --force).')
+            continue
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        users = generate_database(path, rows, seed=args.seed)
+        print(f'{path}: {rows} записей, {users} пользователей.')
+
+
+def run(args: argparse.Namespace) -> None:
+    os.makedirs(args.dir, exist_ok=True)
+    report = {}
+    for rows in args.rows:
+        path = _database_path(args.dir, rows)
+        if not os.path.exists(path):
+            generate_database(path, rows, seed=args.seed)
+        report[str(rows)] = asyncio.run(run_benchmarks(
+            path, args.operations, args.iterations, args.concurrency, seed=args.seed, shards=args.shards))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+def compare(args: argparse.Namespace) -> None:
+    """Печатает изменение p50/p95/p99 и пропускной способности между двумя прогонами."""
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+
+    metrics = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_ops')
+    print(f"{'rows':>10} {'operation':<36}" + ''.join(f'{m:>18}' for m in metrics))
+    for rows, run_after in after.items():
+        run_before = before.get(rows)
+        if run_before is None:
+            continue
+        for name, result in run_after['results'].items():
+            old = run_before['results'].get(name)
+            if old is None:
+                continue
+            cells = []
+            for metric in metrics:
+                ratio = result[metric] / old[metric] if old[metric] else float('nan')
+                cells.append(f'{result[metric]:>9.2f} ({ratio:>4.2f}x)')
+            print(f'{rows:>10} {name:<36}' + ''.join(f'{c:>18}' for c in cells))
+
+
+def startup(args: argparse.Namespace) -> None:
+    """Измеряет холодный запуск и завершается с кодом 1, если медиана превышает бюджет."""
+    rows = args.rows[0]
+    os.makedirs(args.dir, exist_ok=True)
+    path = _database_path(args.dir, rows)
+    if not os.path.exists(path):
+        generate_database(path, rows, seed=args.seed)
+
+    summary = summarize(measure_cold_start(path, args.runs))
+    for name, seconds in summary['stages'].items():
+        print(f'{name:<40}{seconds * 1000:>10.1f} ms')
+    print(f"{'готов к работе (без старта интерпретатора)':<40}{summary['total_s'] * 1000:>10.1f} ms")
+    print(f"{'готов к работе (с момента запуска процесса)':<40}{summary['wall_s'] * 1000:>10.1f} ms")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    if summary['wall_s'] > args.budget:
+        print(f"Холодный запуск {summary['wall_s']:.2f} с превышает бюджет {args.budget:.2f} с.")
+        sys.exit(1)
+    print(f"Холодный запуск укладывается в бюджет {args.budget:.2f} с.")
+
+
+def render(args: argparse.Namespace) -> None:
+    """Сравнивает рендереры графиков: время одного графика и память процесса."""
+    reports = compare_renderers(args.renderers, args.charts, seed=args.seed)
+    print(f"{'renderer':<12}{'chart':<10}{'first ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'PNG KiB':>10}"
+          f"{'load ms':>10}{'RSS load':>10}{'RSS peak':>10}")
+    for renderer, report in reports.items():
+        for chart, result in report['charts'].items():
+            print(f"{report['renderer']:<12}{chart:<10}{result['first_ms']:>10.1f}{result['p50_ms']:>10.2f}"
+                  f"{result['p95_ms']:>10.2f}{result['png_kib']:>10.1f}{report['load_ms']:>10.0f}"
+                  f"{report['rss_loaded_mib']:>9.1f}M{report['rss_peak_mib']:>9.1f}M")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+def load(args: argparse.Namespace) -> None:
+    """Нагружает бота через локальный Bot API уровнями по --users пользователей и ищет точку насыщения."""
+    rows = args.rows[0]
+    os.makedirs(args.dir, exist_ok=True)
+    path = _database_path(args.dir, rows)
+    if not os.path.exists(path):
+        generate_database(path, rows, seed=args.seed)
+
+    report = asyncio.run(run_load(
+        path, args.users, args.duration, args.warmup, tuple(args.think), args.reply_timeout,
+        telegram_limits=args.telegram_limits, seed=args.seed, log_path=args.bot_log))
+    print(f"{'users':>6}{'actions/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+          f"{'API calls/s':>13}{'bot CPU':>9}")
+    for users, level in report.items():
+        total, meta = level['results']['all'], level['meta']
+        cpu = f"{meta['bot_cpu']:>8.0%}" if meta['bot_cpu'] is not None else f"{'-':>8}"
+        print(f"{users:>6}{total['throughput_ops']:>11.1f}{total['p50_ms']:>10.1f}{total['p95_ms']:>10.1f}"
+              f"{total['p99_ms']:>10.1f}{total['error_rate']:>9.1%}{meta['api_calls_per_s']:>13.1f} {cpu}")
+    saturation = saturation_point(report)
+    if saturation is None:
+        print('Пропускная способность росла на всех уровнях: насыщение не достигнуто.')
+    else:
+        print(f'Пропускная способность перестала расти на {saturation} пользователях.')
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Бенчмарки Sleep Bot.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_rows_argument(subparser: argparse.ArgumentParser) -> None:
+        subparser.add_argument('--rows', type=lambda v: PRESET_ROWS.get(v) or int(v), nargs='+',
+                               default=[PRESET_ROWS['small'], PRESET_ROWS['medium']],
+                               help='размеры баз: число строк или small/medium/large')
+        subparser.add_argument('--dir', default='bench_data', help='каталог для синтетических баз')
+        subparser.add_argument('--seed', type=int, default=0)
+
+    generate_parser = subparsers.add_parser('generate', help='создать синтетические базы')
+    add_rows_argument(generate_parser)
+    generate_parser.add_argument('--force', action='store_true', help='пересоздать существующие базы')
+    generate_parser.set_defaults(handler=generate)
+
+    run_parser = subparsers.add_parser('run', help='выполнить бенчмарки')
+    add_rows_argument(run_parser)
+    run_parser.add_argument('--operations', nargs='+', choices=sorted(OPERATIONS),
+                            default=list(OPERATIONS), help='какие операции измерять')
+    run_parser.add_argument('--iterations', type=int, default=200, help='вызовов на операцию')
+    run_parser.add_argument('--concurrency', type=int, default=1, help='одновременных вызовов')
+    run_parser.add_argument('--shards', type=int, default=1, help='на сколько шардов разложить базу')
+    run_parser.add_argument('--out', help='файл для результатов в JSON')
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser('compare', help='сравнить два JSON с результатами')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.set_defaults(handler=compare)
+
+    startup_parser = subparsers.add_parser(
+        'startup', help='измерить холодный запуск и проверить бюджет STARTUP_BUDGET')
+    add_rows_argument(startup_parser)
+    startup_parser.add_argument('--runs', type=int, default=5, help='сколько раз запускать бота')
+    startup_parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help='бюджет, секунды')
+    startup_parser.add_argument('--out', help='файл для результатов в JSON')
+    startup_parser.set_defaults(handler=startup)
+
+    render_parser = subparsers.add_parser('render', help='сравнить рендереры графиков по времени и памяти')
+    render_parser.add_argument('--renderers', nargs='+', choices=sorted(RENDERERS),
+                               default=list(RENDERERS), help='какие рендереры сравнивать')
+    render_parser.add_argument('--charts', type=int, default=100, help='графиков каждого вида')
+    render_parser.add_argument('--seed', type=int, default=0)
+    render_parser.add_argument('--out', help='файл для результатов в JSON')
+    render_parser.set_defaults(handler=render)
+
+    load_parser = subparsers.add_parser(
+        'load', help='сквозная нагрузка на бота через локальный Bot API')
+    add_rows_argument(load_parser)
+    load_parser.add_argument('--users', type=int, nargs='+', default=[10, 50, 100, 200],
+                             help='уровни нагрузки: сколько виртуальных пользователей')
+    load_parser.add_argument('--duration', type=float, default=30, help='длительность уровня, секунды')
+    load_parser.add_argument('--warmup', type=float, default=10, help='прогрев перед замерами, секунды')
+    load_parser.add_argument('--think', type=float, nargs=2, default=[1.0, 3.0], metavar=('MIN', 'MAX'),
+                             help='пауза пользователя между действиями, секунды')
+    load_parser.add_argument('--reply-timeout', type=float, default=10, help='сколько ждать ответа бота, секунды')
+    load_parser.add_argument('--telegram-limits', action='store_true',
+                             help='оставить общий лимит отправки Telegram (SENDER_GLOBAL_RATE)')
+    load_parser.add_argument('--bot-log', help='файл для лога бота')
+    load_parser.add_argument('--out', help='файл для результатов в JSON')
+    load_parser.set_defaults(handler=load)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
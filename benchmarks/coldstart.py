@@ -0,0 +1,73 @@
+"""Холодный запуск бота в отдельном процессе: время импортов, создания application,
+Application.initialize() и шагов post_init.
+
+Бот запускается без сети: getMe в Application.initialize() отвечает локальная
+заглушка Bot API (benchmarks/fake_api.py), поэтому замер отражает работу самого
+бота, включая загрузку диалогов из persistence.
+"""
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+_PROBE_CODE = 'from benchmarks.coldstart import probe; probe({path!r})'
+_PROBE_TOKEN = '123456:coldstart'
+
+
+def probe(path: str) -> None:
+    """Выполняется в дочернем процессе: запускает и останавливает бота, печатает отчет в JSON."""
+    # Таймер создается при импорте startup, до импорта telegram и модулей бота
+    from startup import startup_timer
+    import asyncio
+    import db
+    import main
+    from benchmarks.fake_api import FakeBotApi
+
+    db.DB_FILE = path
+
+    async def run() -> None:
+        api = FakeBotApi(_PROBE_TOKEN)
+        await api.start()
+        try:
+            application = main.build_application(_PROBE_TOKEN, base_url=api.base_url)
+            # Те же шаги, что и в run_polling: initialize, post_init, затем остановка
+            await application.initialize()
+            await main.post_init(application)
+            await main.post_stop(application)
+            await application.shutdown()
+            await main.post_shutdown(application)
+        finally:
+            await api.stop()
+
+    asyncio.run(run())
+    print(json.dumps(startup_timer.as_dict()))
+
+
+def measure_cold_start(path: str, runs: int) -> List[Dict[str, object]]:
+    """Запускает бота runs раз в новых процессах и возвращает отчеты о запуске.
+
+    wall_s — время от запуска процесса до готовности бота, включая старт интерпретатора.
+    """
+    reports = []
+    for _ in range(runs):
+        spawned = time.time()
+        completed = subprocess.run([sys.executable, '-c', _PROBE_CODE.format(path=path)],
+                                   capture_output=True, text=True, check=True)
+        report = json.loads(completed.stdout.strip().splitlines()[-1])
+        report['wall_s'] = report['finished_wall'] - spawned
+        reports.append(report)
+    return reports
+
+
+def summarize(reports: List[Dict[str, object]]) -> Dict[str, object]:
+    """Медианы по запускам: общее время и каждый этап."""
+    stages = {name: statistics.median(report['stages'][name] for report in reports)
+              for name in reports[0]['stages']}
+    return {
+        'runs': len(reports),
+        'wall_s': statistics.median(report['wall_s'] for report in reports),
+        'total_s': statistics.median(report['total_s'] for report in reports),
+        'stages': stages,
+    }
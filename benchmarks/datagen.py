@@ -0,0 +1,75 @@
+"""Генерация синтетических баз sleepbot.db с реалистичным распределением пользователей."""
+import asyncio
+import logging
+import random
+import sqlite3
+from typing import Iterator, List, Tuple
+
+import db
+from utils import sleep_duration_minutes, today_day
+
+logger = logging.getLogger(__name__)
+
+_INSERT_SQL = '''
+    INSERT INTO sleep_data (user_id, day, sleep_min, wake_min, duration_min)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+
+def user_history_lengths(rows: int, seed: int = 0) -> List[int]:
+    """Распределяет rows записей между пользователями.
+
+    Длина истории имеет тяжелый хвост: большинство пользователей записывают
+    сон несколько недель, немногие — годами (до 3 лет).
+    """
+    rng = random.Random(seed)
+    lengths = []
+    total = 0
+    while total < rows:
+        length = min(int(rng.paretovariate(1.2) * 7), 3 * 365, rows - total)
+        lengths.append(length)
+        total += length
+    return lengths
+
+
+def _user_rows(rng: random.Random, user_id: int, length: int, last_day: int) -> Iterator[Tuple[int, ...]]:
+    # У каждого пользователя свой привычный режим с ночным разбросом
+    usual_bed = rng.gauss(23 * 60 + 30, 60)
+    usual_wake = rng.gauss(7 * 60 + 30, 45)
+    for offset in range(length):
+        sleep_min = int(usual_bed + rng.gauss(0, 40)) % 1440
+        wake_min = int(usual_wake + rng.gauss(0, 30)) % 1440
+        yield (user_id, last_day - length + 1 + offset, sleep_min, wake_min,
+               sleep_duration_minutes(sleep_min, wake_min))
+
+
+def generate_database(path: str, rows: int, seed: int = 0) -> int:
+    """Создает базу path с rows записями о сне. Возвращает количество пользователей."""
+    asyncio.run(_create_schema(path))
+    lengths = user_history_lengths(rows, seed)
+    rng = random.Random(seed)
+    last_day = today_day() - 1
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    batch = []
+    for user_id, length in enumerate(lengths, start=1):
+        batch.extend(_user_rows(rng, user_id, length, last_day))
+        if len(batch) >= 50000:
+            conn.executemany(_INSERT_SQL, batch)
+            batch.clear()
+    conn.executemany(_INSERT_SQL, batch)
+    conn.commit()
+    conn.close()
+
+    # init_db сам заполнит user_sleep_stats, увидев данные без статистики
+    asyncio.run(_create_schema(path))
+    logger.info(f"Generated {rows} rows for {len(lengths)} users in {path}.")
+    return len(lengths)
+
+
+async def _create_schema(path: str) -> None:
+    db.DB_FILE = path
+    db.DB_SHARDS = 1
+    await db.init_db()
+    await db.close_db()
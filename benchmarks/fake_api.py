@@ -0,0 +1,273 @@
+"""Локальная замена Telegram Bot API для нагрузочных тестов.
+
+Сервер отдает боту обновления через getUpdates и принимает его ответы
+(sendMessage, sendPhoto, editMessageText, answerCallbackQuery,
+answerInlineQuery), не обращаясь к настоящему Telegram. Бот подключается
+к нему через TELEGRAM_API_URL в .env или base_url в main.build_application.
+Обновления добавляет генератор нагрузки (push_message, push_callback_query,
+push_inline_query), а ответы бота попадают в очередь пользователя, которому
+они адресованы.
+"""
+import asyncio
+import email.parser
+import email.policy
+import itertools
+import json
+import logging
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from http_server import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+# Дольше этого getUpdates не ждет новых обновлений, даже если бот просит больше
+MAX_POLL_TIMEOUT = 50.0
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'Sleep Bot', 'username': 'fake_sleep_bot',
+            'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': True}
+
+# Обработчик метода: получает параметры запроса и возвращает result (или корутину с ним)
+ApiMethod = Callable[['FakeBotApi', Dict[str, Any]], Any]
+
+
+class ApiError(Exception):
+    """Ошибка Bot API: возвращается боту как {"ok": false} с кодом и описанием."""
+
+    def __init__(self, code: int, description: str) -> None:
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+@dataclass
+class BotCall:
+    """Запрос бота к API, адресованный пользователю: метод, параметры и время получения."""
+    method: str
+    user_id: int
+    params: Dict[str, Any]
+    message_id: Optional[int] = None
+    received: float = field(default_factory=time.perf_counter)
+
+    @property
+    def text(self) -> str:
+        return str(self.params.get('text', ''))
+
+
+def _parse_params(request: Request) -> Dict[str, Any]:
+    """Параметры запроса в любом из форматов Bot API: form-urlencoded, multipart или JSON.
+
+    Составные значения в формах закодированы в JSON, строки передаются как есть.
+    """
+    content_type = request.headers.get('content-type', '')
+    if not request.body:
+        return dict(parse_qsl(request.query))
+    if content_type.startswith('application/json'):
+        return json.loads(request.body)
+    if content_type.startswith('multipart/form-data'):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1') + request.body)
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True)
+            # Файлы не нужны серверу целиком: достаточно знать, что файл загружен
+            params[name] = payload if part.get_filename() else payload.decode('utf-8')
+        return params
+    return dict(parse_qsl(request.body.decode('utf-8')))
+
+
+def _require(params: Dict[str, Any], *names: str) -> None:
+    for name in names:
+        if params.get(name) in (None, ''):
+            raise ApiError(400, f'Bad Request: {name} is empty')
+
+
+class FakeBotApi:
+    """Bot API на HttpServer: очередь обновлений для getUpdates и очереди ответов по пользователям."""
+
+    def __init__(self, token: str, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.token = token
+        self.http = HttpServer(host, port)
+        for method in self.METHODS:
+            self.http.route('POST', f'/bot{token}/{method}', self._dispatch)
+            self.http.route('GET', f'/bot{token}/{method}', self._dispatch)
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.polling = asyncio.Event()
+        self._updates: Deque[Dict[str, Any]] = deque()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._query_ids = itertools.count(1)
+        # Владельцы inline- и callback-запросов: ответы на них адресуются по id запроса
+        self._query_users: Dict[str, int] = {}
+        self._inboxes: Dict[int, asyncio.Queue] = {}
+        self._arrived = asyncio.Event()
+        self._closing = False
+
+    @property
+    def base_url(self) -> str:
+        """Значение для TELEGRAM_API_URL: токен дописывается к нему самим ботом."""
+        return f'http://{self.http.host}:{self.http.port}/bot'
+
+    async def start(self) -> None:
+        await self.http.start()
+
+    async def stop(self) -> None:
+        """Отпускает ждущий getUpdates и останавливает HTTP-сервер."""
+        self._closing = True
+        self._arrived.set()
+        await self.http.stop()
+
+    # Обновления от пользователей
+
+    @staticmethod
+    def _user(user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'username': f'user{user_id}'}
+
+    @staticmethod
+    def _chat(user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'type': 'private', 'first_name': f'User {user_id}', 'username': f'user{user_id}'}
+
+    def _push(self, kind: str, payload: Dict[str, Any]) -> None:
+        self._updates.append({'update_id': next(self._update_ids), kind: payload})
+        self._arrived.set()
+
+    def push_message(self, user_id: int, text: str) -> None:
+        message = {'message_id': next(self._message_ids), 'date': int(time.time()),
+                   'from': self._user(user_id), 'chat': self._chat(user_id), 'text': text}
+        if text.startswith('/'):
+            # Без сущности bot_command CommandHandler не распознает команду
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self._push('message', message)
+
+    def push_callback_query(self, user_id: int, data: str, message_id: int) -> None:
+        """Нажатие inline-кнопки под сообщением бота message_id."""
+        query_id = str(next(self._query_ids))
+        self._query_users[query_id] = user_id
+        message = {'message_id': message_id, 'date': int(time.time()), 'from': BOT_USER,
+                   'chat': self._chat(user_id), 'text': ''}
+        self._push('callback_query', {'id': query_id, 'from': self._user(user_id), 'message': message,
+                                      'chat_instance': str(user_id), 'data': data})
+
+    def push_inline_query(self, user_id: int, query: str) -> None:
+        query_id = str(next(self._query_ids))
+        self._query_users[query_id] = user_id
+        self._push('inline_query', {'id': query_id, 'from': self._user(user_id), 'query': query, 'offset': ''})
+
+    def inbox(self, user_id: int) -> asyncio.Queue:
+        """Очередь запросов бота, адресованных пользователю user_id (BotCall)."""
+        queue = self._inboxes.get(user_id)
+        if queue is None:
+            queue = self._inboxes[user_id] = asyncio.Queue()
+        return queue
+
+    def _deliver(self, method: str, user_id: int, params: Dict[str, Any], message_id: Optional[int] = None) -> None:
+        self.inbox(user_id).put_nowait(BotCall(method, user_id, params, message_id))
+
+    # Методы Bot API
+
+    async def _dispatch(self, request: Request) -> Response:
+        method = request.path.rsplit('/', 1)[1]
+        self.calls[method] += 1
+        try:
+            params = _parse_params(request)
+            result = self.METHODS[method](self, params)
+            if asyncio.iscoroutine(result):
+                result = await result
+            body, status = {'ok': True, 'result': result}, 200
+        except ApiError as e:
+            self.errors[method] += 1
+            body, status = {'ok': False, 'error_code': e.code, 'description': e.description}, e.code
+        except (ValueError, KeyError, TypeError) as e:
+            self.errors[method] += 1
+            body, status = {'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'}, 400
+        return Response(status, json.dumps(body, ensure_ascii=False).encode('utf-8'),
+                        content_type='application/json')
+
+    def _message(self, chat_id: int, message_id: Optional[int] = None, **content: Any) -> Dict[str, Any]:
+        return {'message_id': message_id or next(self._message_ids), 'date': int(time.time()),
+                'from': BOT_USER, 'chat': self._chat(chat_id), **content}
+
+    def _get_me(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return BOT_USER
+
+    def _true(self, params: Dict[str, Any]) -> bool:
+        return True
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = min(float(params.get('timeout') or 0), MAX_POLL_TIMEOUT)
+        # Обновления до offset бот подтвердил, их можно забыть
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        self.polling.set()
+        if not self._updates and timeout > 0 and not self._closing:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._updates, limit))
+
+    def _send_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        _require(params, 'chat_id', 'text')
+        if len(params['text']) > MAX_MESSAGE_LENGTH:
+            raise ApiError(400, 'Bad Request: message is too long')
+        chat_id = int(params['chat_id'])
+        message = self._message(chat_id, text=params['text'])
+        self._deliver('sendMessage', chat_id, params, message['message_id'])
+        return message
+
+    def _send_photo(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        _require(params, 'chat_id', 'photo')
+        chat_id = int(params['chat_id'])
+        photo = params['photo']
+        # Повторная отправка по file_id приходит строкой, новая загрузка — файлом
+        file_id = photo if isinstance(photo, str) else f'fake-photo-{next(self._file_ids)}'
+        sizes = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1000, 'height': 500}]
+        message = self._message(chat_id, photo=sizes)
+        self._deliver('sendPhoto', chat_id, params, message['message_id'])
+        return message
+
+    def _edit_message_text(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        _require(params, 'chat_id', 'message_id', 'text')
+        chat_id = int(params['chat_id'])
+        message = self._message(chat_id, int(params['message_id']), text=params['text'])
+        self._deliver('editMessageText', chat_id, params, message['message_id'])
+        return message
+
+    def _answer_query(self, method: str, id_param: str, params: Dict[str, Any]) -> bool:
+        _require(params, id_param)
+        user_id = self._query_users.pop(str(params[id_param]), None)
+        if user_id is None:
+            raise ApiError(400, 'Bad Request: query is too old and response timeout expired or query ID is invalid')
+        self._deliver(method, user_id, params)
+        return True
+
+    def _answer_callback_query(self, params: Dict[str, Any]) -> bool:
+        return self._answer_query('answerCallbackQuery', 'callback_query_id', params)
+
+    def _answer_inline_query(self, params: Dict[str, Any]) -> bool:
+        results = params.get('results')
+        if isinstance(results, str):
+            params['results'] = json.loads(results)
+        return self._answer_query('answerInlineQuery', 'inline_query_id', params)
+
+    METHODS: Dict[str, ApiMethod] = {
+        'getMe': _get_me,
+        'getUpdates': _get_updates,
+        'deleteWebhook': _true,
+        'sendMessage': _send_message,
+        'sendPhoto': _send_photo,
+        'editMessageText': _edit_message_text,
+        'answerCallbackQuery': _answer_callback_query,
+        'answerInlineQuery': _answer_inline_query,
+    }
@@ -0,0 +1,79 @@
+"""Заглушки Update/Context и бот, который записывает ответы вместо отправки."""
+import itertools
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+_file_ids = itertools.count(1)
+
+
+class FakeBot:
+    """Собирает все ответы обработчиков: (chat_id, метод, содержимое)."""
+
+    def __init__(self) -> None:
+        self.sent: List[Tuple[int, str, Any]] = []
+
+    def record(self, chat_id: int, method: str, payload: Any) -> None:
+        self.sent.append((chat_id, method, payload))
+
+    def clear(self) -> None:
+        self.sent.clear()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any) -> 'FakeMessage':
+        self.record(chat_id, 'sendMessage', text)
+        return FakeMessage(self, FakeUser(chat_id), text=text)
+
+
+@dataclass
+class FakeUser:
+    id: int
+    username: Optional[str] = None
+
+
+@dataclass
+class FakeMessage:
+    bot: FakeBot
+    from_user: FakeUser
+    text: str = ''
+    photo: List[SimpleNamespace] = field(default_factory=list)
+
+    @property
+    def chat_id(self) -> int:
+        return self.from_user.id
+
+    async def reply_text(self, text: str, **kwargs: Any) -> 'FakeMessage':
+        self.bot.record(self.chat_id, 'sendMessage', text)
+        return FakeMessage(self.bot, self.from_user, text=text)
+
+    async def reply_photo(self, photo: Any, **kwargs: Any) -> 'FakeMessage':
+        self.bot.record(self.chat_id, 'sendPhoto', photo)
+        file_id = photo if isinstance(photo, str) else f'fake-file-{next(_file_ids)}'
+        return FakeMessage(self.bot, self.from_user, photo=[SimpleNamespace(file_id=file_id)])
+
+
+@dataclass
+class FakeUpdate:
+    message: FakeMessage
+
+    @property
+    def effective_user(self) -> FakeUser:
+        return self.message.from_user
+
+    @property
+    def effective_chat(self) -> SimpleNamespace:
+        return SimpleNamespace(id=self.message.chat_id)
+
+
+@dataclass
+class FakeApplication:
+    bot: FakeBot
+
+
+@dataclass
+class FakeContext:
+    bot: FakeBot
+    user_data: Dict[str, Any] = field(default_factory=dict)
+
+
+def make_update(bot: FakeBot, user_id: int, text: str = '') -> FakeUpdate:
+    return FakeUpdate(FakeMessage(bot, FakeUser(user_id, f'user{user_id}'), text=text))
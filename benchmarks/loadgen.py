@@ -0,0 +1,354 @@
+"""Сквозная нагрузка: бот в отдельном процессе работает с FakeBotApi вместо Telegram.
+
+Виртуальные пользователи проходят типичные сценарии (запись сна, отчеты,
+советы, выбор времени пробуждения, inline-режим) и замеряют время от
+появления обновления в getUpdates до ответа бота. Пользователи работают в
+замкнутом цикле «действие — ответ — пауза», поэтому с ростом их числа
+пропускная способность сначала растет, а после насыщения бота перестает, и
+растет только задержка.
+"""
+import asyncio
+import itertools
+import os
+import platform
+import random
+import shutil
+import signal
+import sqlite3
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from benchmarks.fake_api import BotCall, FakeBotApi
+from benchmarks.runner import _git_revision, _percentile
+from config import SLEEP_SCHEDULE, SENDER_GLOBAL_RATE, SENDER_GLOBAL_BURST
+from utils import today_day
+
+TOKEN = '123456:load-test'
+# Общий лимит отправки задается до импорта модулей бота: TelegramRateLimiter читает его из config при импорте sender
+_BOT_CODE = ('import config; config.SENDER_GLOBAL_RATE, config.SENDER_GLOBAL_BURST = {rate!r}, {burst!r}; '
+             'from benchmarks.loadgen import serve_bot; serve_bot({path!r}, {base_url!r})')
+# Общий лимит без --telegram-limits: он уперся бы в 25 сообщений в секунду раньше, чем нагрузка в бота.
+# Лимиты на чат остаются: виртуальный пользователь — это один чат.
+_UNLIMITED_RATE = 1e6
+
+# Ответы бота, которые означают отказ в обслуживании, а не результат действия
+_OVERLOAD_REPLIES = ('Сейчас строится слишком много графиков',)
+# Считать, что насыщение наступило, если пропускная способность выросла меньше чем на 10%
+_SATURATION_GROWTH = 1.1
+
+
+def serve_bot(path: str, base_url: str) -> None:
+    """Выполняется в дочернем процессе: запускает бота в режиме polling до SIGTERM."""
+    import logging
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    import db
+    import main
+
+    db.DB_FILE = path
+    main.build_application(TOKEN, base_url).run_polling()
+
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+    """Процессорное время процесса (user + system) по /proc; None, если /proc недоступен."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class LoadStats:
+    """Задержки и ошибки по действиям за один уровень нагрузки."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Counter] = {}
+
+    def record(self, action: str, latency_s: float) -> None:
+        self.latencies.setdefault(action, []).append(latency_s * 1000)
+        self.errors.setdefault(action, Counter())
+
+    def record_error(self, action: str, kind: str) -> None:
+        self.latencies.setdefault(action, [])
+        self.errors.setdefault(action, Counter())[kind] += 1
+
+    @staticmethod
+    def _summary(latencies: List[float], errors: Counter, wall: float) -> Dict[str, object]:
+        latencies = sorted(latencies)
+        failed = sum(errors.values())
+        total = len(latencies) + failed
+        return {
+            'count': len(latencies),
+            'errors': failed,
+            'error_kinds': dict(errors),
+            'error_rate': failed / total if total else 0.0,
+            'mean_ms': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p50_ms': _percentile(latencies, 0.50),
+            'p95_ms': _percentile(latencies, 0.95),
+            'p99_ms': _percentile(latencies, 0.99),
+            'throughput_ops': len(latencies) / wall if wall else 0.0,
+        }
+
+    def results(self, wall: float) -> Dict[str, Dict[str, object]]:
+        """Сводка по каждому действию и по всем вместе ('all')."""
+        results = {action: self._summary(self.latencies[action], self.errors[action], wall)
+                   for action in sorted(self.latencies)}
+        results['all'] = self._summary(list(itertools.chain.from_iterable(self.latencies.values())),
+                                       sum(self.errors.values(), Counter()), wall)
+        return results
+
+
+class LoadSession:
+    """Действия виртуальных пользователей: обновление в FakeBotApi и ожидание ответа бота."""
+
+    def __init__(self, api: FakeBotApi, rng: random.Random, fresh_users: Iterator[int],
+                 reply_timeout: float) -> None:
+        self.api = api
+        self.rng = rng
+        self.reply_timeout = reply_timeout
+        self.stats = LoadStats()
+        # Пользователи, которые сегодня еще не записывали сон
+        self._fresh_users = fresh_users
+
+    def fresh_user(self) -> int:
+        return next(self._fresh_users)
+
+    async def _exchange(self, user_id: int, action: str, push: Callable[[], None],
+                        done: Optional[Callable[[BotCall], bool]]) -> Optional[List[BotCall]]:
+        """Отправляет обновление и ждет ответов, пока done не вернет True (по умолчанию — первого).
+
+        Возвращает ответы или None, если бот не ответил вовремя или отказал из-за перегрузки.
+        """
+        inbox = self.api.inbox(user_id)
+        # Поздние ответы на прошлое действие, которое не дождалось их
+        while not inbox.empty():
+            inbox.get_nowait()
+        started = time.perf_counter()
+        push()
+        replies: List[BotCall] = []
+        try:
+            while True:
+                call = await asyncio.wait_for(inbox.get(), started + self.reply_timeout - time.perf_counter())
+                replies.append(call)
+                if call.text.startswith(_OVERLOAD_REPLIES):
+                    self.stats.record_error(action, 'overloaded')
+                    return None
+                if done is None or done(call):
+                    break
+        except asyncio.TimeoutError:
+            self.stats.record_error(action, 'timeout')
+            return None
+        self.stats.record(action, replies[-1].received - started)
+        return replies
+
+    async def message(self, user_id: int, text: str, action: str,
+                      done: Optional[Callable[[BotCall], bool]] = None) -> Optional[List[BotCall]]:
+        return await self._exchange(user_id, action, lambda: self.api.push_message(user_id, text), done)
+
+    async def callback(self, user_id: int, data: str, message_id: int, action: str,
+                       done: Optional[Callable[[BotCall], bool]] = None) -> Optional[List[BotCall]]:
+        return await self._exchange(
+            user_id, action, lambda: self.api.push_callback_query(user_id, data, message_id), done)
+
+    async def inline(self, user_id: int, query: str, action: str) -> Optional[List[BotCall]]:
+        return await self._exchange(user_id, action, lambda: self.api.push_inline_query(user_id, query), None)
+
+
+# Сценарии виртуальных пользователей
+
+Script = Callable[[LoadSession, int], Awaitable[None]]
+
+_REPORT_BUTTONS = (('За неделю', 'weekly'), ('За месяц', 'monthly'), ('За квартал', 'quarterly'),
+                   ('За год', 'yearly'), ('За все время', 'all_time'))
+
+
+def _report_done(call: BotCall) -> bool:
+    """Отчет состоит из текста и графика; без графика бот отвечает одним сообщением о нехватке данных."""
+    return call.method == 'sendPhoto' or call.text.startswith('Недостаточно')
+
+
+async def _log_sleep(session: LoadSession, user_id: int) -> None:
+    # Записать сон можно раз в день, поэтому каждый диалог ведет новый пользователь
+    user_id = session.fresh_user()
+    replies = await session.message(user_id, 'Записать сон', 'log_sleep.start')
+    if replies is None or not replies[-1].text.startswith('Пожалуйста'):
+        return
+    bed = f'{session.rng.choice((22, 23, 0))}:{session.rng.randrange(0, 60, 5):02d}'
+    if await session.message(user_id, bed, 'log_sleep.bed') is None:
+        return
+    wake = f'{session.rng.randint(6, 8)}:{session.rng.randrange(0, 60, 5):02d}'
+    await session.message(user_id, wake, 'log_sleep.wake')
+
+
+async def _reports(session: LoadSession, user_id: int) -> None:
+    if await session.message(user_id, 'Графики сна', 'reports.menu') is None:
+        return
+    button, period = session.rng.choice(_REPORT_BUTTONS)
+    await session.message(user_id, button, f'reports.{period}', done=_report_done)
+
+
+async def _tips(session: LoadSession, user_id: int) -> None:
+    await session.message(user_id, 'Советы', 'tips')
+
+
+async def _wake_time(session: LoadSession, user_id: int) -> None:
+    # После таймаута в очередь могут прийти запоздавшие ответы, поэтому ждем именно клавиатуру
+    replies = await session.message(user_id, 'Старт', 'wake_time.keyboard',
+                                    done=lambda call: call.text.startswith('Выберите время'))
+    if replies is None:
+        return
+    await session.callback(user_id, session.rng.choice(list(SLEEP_SCHEDULE)), replies[-1].message_id,
+                           'wake_time.pick', done=lambda call: call.method == 'editMessageText')
+
+
+async def _share(session: LoadSession, user_id: int) -> None:
+    await session.inline(user_id, session.rng.choice(('', 'achievement', 'статистика')), 'share.inline')
+
+
+# Сценарий и его вес: как часто пользователи выбирают его
+SCRIPTS: Dict[str, Tuple[Script, int]] = {
+    'log_sleep': (_log_sleep, 2),
+    'reports': (_reports, 3),
+    'tips': (_tips, 2),
+    'wake_time': (_wake_time, 1),
+    'share': (_share, 2),
+}
+
+
+async def _run_level(session: LoadSession, user_ids: Sequence[int], duration: float,
+                     think: Tuple[float, float]) -> float:
+    """Гоняет сценарии от имени user_ids в течение duration секунд; возвращает фактическую длительность."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    names = list(SCRIPTS)
+    weights = [SCRIPTS[name][1] for name in names]
+
+    async def virtual_user(user_id: int) -> None:
+        # Разнесенный старт, чтобы пользователи не приходили одной волной
+        await asyncio.sleep(session.rng.uniform(0, think[1]))
+        while loop.time() < deadline:
+            script = SCRIPTS[session.rng.choices(names, weights)[0]][0]
+            await script(session, user_id)
+            await asyncio.sleep(session.rng.uniform(*think))
+
+    started = loop.time()
+    await asyncio.gather(*(virtual_user(user_id) for user_id in user_ids))
+    return loop.time() - started
+
+
+def _load_users(path: str) -> List[Tuple[int, bool]]:
+    """Пользователи базы и признак того, что сегодня они уже записали сон."""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT user_id, MAX(day) >= ? FROM sleep_data GROUP BY user_id ORDER BY user_id',
+                            (today_day(),)).fetchall()
+    finally:
+        conn.close()
+
+
+def _remove_database(path: str) -> None:
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+async def run_load(path: str, levels: Sequence[int], duration: float, warmup: float,
+                   think: Tuple[float, float], reply_timeout: float, telegram_limits: bool = False,
+                   seed: int = 0, log_path: Optional[str] = None) -> Dict[str, Dict[str, object]]:
+    """Запускает бота на копии базы path и нагружает его уровнями по levels пользователей.
+
+    Результат в формате runner.run_benchmarks по ключам-уровням, поэтому два
+    прогона можно сравнить через ``python -m benchmarks compare``.
+    """
+    users = _load_users(path)
+    if len(users) < max(levels):
+        raise ValueError(f'В базе {len(users)} пользователей, меньше чем {max(levels)} виртуальных.')
+    rng = random.Random(seed)
+    virtual_users = rng.sample([user_id for user_id, _ in users], max(levels))
+    # Запись сна ведут остальные пользователи базы, еще не записавшие сон сегодня, а когда они закончатся — новые
+    chosen = set(virtual_users)
+    fresh = [user_id for user_id, logged in users if not logged and user_id not in chosen]
+    rng.shuffle(fresh)
+    fresh_users = itertools.chain(fresh, itertools.count(users[-1][0] + 1))
+
+    # Бот пишет в базу, поэтому каждый прогон начинается с одной и той же копии
+    work_path = os.path.splitext(path)[0] + '.load.db'
+    _remove_database(work_path)
+    shutil.copyfile(path, work_path)
+
+    api = FakeBotApi(TOKEN)
+    await api.start()
+    log = open(log_path, 'w') if log_path else None
+    rate, burst = (SENDER_GLOBAL_RATE, SENDER_GLOBAL_BURST) if telegram_limits else (_UNLIMITED_RATE, _UNLIMITED_RATE)
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, '-c', _BOT_CODE.format(rate=rate, burst=burst, path=work_path, base_url=api.base_url),
+        stdout=asyncio.subprocess.DEVNULL, stderr=log or asyncio.subprocess.DEVNULL)
+    report: Dict[str, Dict[str, object]] = {}
+    try:
+        polling = asyncio.create_task(api.polling.wait())
+        exited = asyncio.create_task(bot.wait())
+        await asyncio.wait({polling, exited}, timeout=60, return_when=asyncio.FIRST_COMPLETED)
+        if not polling.done():
+            polling.cancel()
+            exited.cancel()
+            raise RuntimeError(f'Бот не начал получать обновления (код выхода {bot.returncode}), см. {log_path}.')
+        exited.cancel()
+
+        session = LoadSession(api, rng, fresh_users, reply_timeout)
+        if warmup:
+            # Прогрев: процессы графиков, кэши и соединения; результаты не учитываются
+            await _run_level(session, virtual_users[:min(levels)], warmup, think)
+
+        for users in levels:
+            session.stats = LoadStats()
+            calls_before, errors_before = Counter(api.calls), Counter(api.errors)
+            cpu_before = _cpu_seconds(bot.pid)
+            wall = await _run_level(session, virtual_users[:users], duration, think)
+            cpu_after = _cpu_seconds(bot.pid)
+            calls, api_errors = api.calls - calls_before, api.errors - errors_before
+            calls.pop('getUpdates', None)
+
+            report[str(users)] = {
+                'meta': {
+                    'database': path,
+                    'users': users,
+                    'duration_s': wall,
+                    'think_s': list(think),
+                    'telegram_limits': telegram_limits,
+                    'bot_cpu': (cpu_after - cpu_before) / wall if cpu_before is not None else None,
+                    'api_calls_per_s': sum(calls.values()) / wall,
+                    'api_errors': dict(api_errors),
+                    'revision': _git_revision(),
+                    'python': platform.python_version(),
+                    'timestamp': datetime.now().isoformat(timespec='seconds'),
+                },
+                'results': session.stats.results(wall),
+            }
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(bot.wait(), 30)
+            except asyncio.TimeoutError:
+                bot.kill()
+                await bot.wait()
+        await api.stop()
+        if log:
+            log.close()
+        _remove_database(work_path)
+    return report
+
+
+def saturation_point(report: Dict[str, Dict[str, object]]) -> Optional[int]:
+    """Первый уровень, на котором пропускная способность почти не выросла по сравнению с предыдущим."""
+    previous = None
+    for users, level in report.items():
+        throughput = level['results']['all']['throughput_ops']
+        if previous is not None and throughput < previous * _SATURATION_GROWTH:
+            return int(users)
+        previous = throughput
+    return None
@@ -0,0 +1,89 @@
+"""Сравнение рендереров графиков: время одного графика и память процесса.
+
+Каждый рендерер измеряется в отдельном процессе, чтобы пиковая память
+одного не смешивалась с другим и с самим бенчмарком.
+"""
+import json
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+_PROBE_CODE = 'from benchmarks.render import probe; probe({renderer!r}, {charts!r}, {seed!r})'
+
+# Те же графики, что строит reports.py
+CHARTS = {
+    'weekly': (7, 'Продолжительность сна за последнюю неделю', list(range(1, 8))),
+    'monthly': (30, 'Продолжительность сна за последний месяц', list(range(1, 31, 2))),
+}
+
+
+def _rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def probe(renderer: str, charts: int, seed: int) -> None:
+    """Выполняется в дочернем процессе: загружает рендерер, строит графики, печатает отчет в JSON."""
+    from renderers import create_renderer
+
+    rss_start = _rss_mib()
+    started = time.perf_counter()
+    chart_renderer = create_renderer(renderer)
+    load_s = time.perf_counter() - started
+    rss_loaded = _rss_mib()
+
+    rng = random.Random(seed)
+    report: Dict[str, object] = {
+        'renderer': chart_renderer.name,
+        'load_ms': load_s * 1000,
+        'rss_start_mib': rss_start,
+        'rss_loaded_mib': rss_loaded,
+        'charts': {},
+    }
+    for name, (days, title, xticks) in CHARTS.items():
+        # Первый график строит фон и загружает шрифты, его время считается отдельно
+        started = time.perf_counter()
+        chart_renderer.render_durations([rng.uniform(4, 10) for _ in range(days)], title, xticks)
+        first_ms = (time.perf_counter() - started) * 1000
+
+        latencies: List[float] = []
+        png_bytes = 0
+        for _ in range(charts):
+            durations = [rng.uniform(4, 10) for _ in range(days)]
+            started = time.perf_counter()
+            png = chart_renderer.render_durations(durations, title, xticks)
+            latencies.append((time.perf_counter() - started) * 1000)
+            png_bytes += len(png)
+
+        # Память Python-объектов, выделенная во время одного графика
+        tracemalloc.start()
+        chart_renderer.render_durations([rng.uniform(4, 10) for _ in range(days)], title, xticks)
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        latencies.sort()
+        report['charts'][name] = {
+            'first_ms': first_ms,
+            'p50_ms': latencies[len(latencies) // 2],
+            'p95_ms': latencies[min(len(latencies) - 1, round(0.95 * (len(latencies) - 1)))],
+            'mean_ms': statistics.fmean(latencies),
+            'png_kib': png_bytes / charts / 1024,
+            'traced_peak_kib': traced_peak / 1024,
+        }
+    report['rss_peak_mib'] = _rss_mib()
+    print(json.dumps(report))
+
+
+def compare_renderers(renderers: List[str], charts: int, seed: int = 0) -> Dict[str, Dict[str, object]]:
+    """Запускает probe для каждого рендерера в новом процессе и возвращает отчеты."""
+    reports = {}
+    for renderer in renderers:
+        completed = subprocess.run(
+            [sys.executable, '-c', _PROBE_CODE.format(renderer=renderer, charts=charts, seed=seed)],
+            capture_output=True, text=True, check=True)
+        reports[renderer] = json.loads(completed.stdout.strip().splitlines()[-1])
+    return reports
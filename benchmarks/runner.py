@@ -0,0 +1,217 @@
+"""Прогон операций бота на синтетической базе и сбор метрик задержки."""
+import asyncio
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Sequence
+
+import db
+import rebalance
+import achievements
+import analysis
+import charts
+import handlers
+import log_sleep
+import reports
+import sender
+from report_cache import report_cache
+from content import content_store
+from utils import today_day
+from benchmarks.fakes import FakeApplication, FakeBot, FakeContext, make_update
+
+Operation = Callable[[int, FakeBot], Awaitable[object]]
+
+
+async def _weekly_report(user_id: int, bot: FakeBot) -> None:
+    report_cache.invalidate_user(user_id)
+    await reports.send_weekly_report(make_update(bot, user_id), FakeContext(bot))
+
+
+async def _weekly_report_cached(user_id: int, bot: FakeBot) -> None:
+    await reports.send_weekly_report(make_update(bot, user_id), FakeContext(bot))
+
+
+async def _monthly_report(user_id: int, bot: FakeBot) -> None:
+    report_cache.invalidate_user(user_id)
+    await reports.send_monthly_report(make_update(bot, user_id), FakeContext(bot))
+
+
+async def _send_tips(user_id: int, bot: FakeBot) -> None:
+    await handlers.send_tips(make_update(bot, user_id), FakeContext(bot))
+
+
+async def _save_sleep_data(user_id: int, bot: FakeBot) -> None:
+    context = FakeContext(bot, user_data={'sleep_time': '23:15'})
+    await log_sleep.save_sleep_data(make_update(bot, user_id, text='07:05'), context)
+
+
+OPERATIONS: Dict[str, Operation] = {
+    'db.get_user_stats': lambda user_id, bot: db.get_user_stats(user_id),
+    'db.get_recent_sleep_data_30': lambda user_id, bot: db.get_recent_sleep_data(user_id, 30),
+    'db.count_sleep_data': lambda user_id, bot: db.count_sleep_data(user_id),
+    'db.sleep_data_exists_for_date': lambda user_id, bot: db.sleep_data_exists_for_date(user_id, today_day()),
+    'db.get_sleep_data': lambda user_id, bot: db.get_sleep_data(user_id),
+    'db.get_achievements': lambda user_id, bot: db.get_achievements(user_id),
+    'db.insert_sleep_data': lambda user_id, bot: db.insert_sleep_data(user_id, 23 * 60, 7 * 60, today_day()),
+    'check_achievements': lambda user_id, bot: achievements.check_achievements(user_id),
+    'analyze_sleep_data': lambda user_id, bot: analysis.analyze_sleep_data(user_id),
+    'handlers.send_tips': _send_tips,
+    'log_sleep.save_sleep_data': _save_sleep_data,
+    'reports.send_weekly_report': _weekly_report,
+    'reports.send_weekly_report_cached': _weekly_report_cached,
+    'reports.send_monthly_report': _monthly_report,
+}
+
+# Операции, которые измеряются на прогретом кэше: каждый пользователь вызывается один раз заранее
+WARMED_OPERATIONS = {'reports.send_weekly_report_cached'}
+
+# Операции, которые меняют базу: каждая выполняется на своей свежей копии,
+# чтобы остальные операции и следующие прогоны измеряли исходные данные
+WRITE_OPERATIONS = {'db.insert_sleep_data', 'log_sleep.save_sleep_data', 'check_achievements'}
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _peak_rss_kib() -> int:
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children)
+
+
+async def _measure(operation: Operation, user_ids: List[int], concurrency: int, bot: FakeBot) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    queue = iter(user_ids)
+
+    async def worker() -> None:
+        nonlocal errors
+        for user_id in queue:
+            started = time.perf_counter()
+            try:
+                await operation(user_id, bot)
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall_started
+    bot.clear()
+
+    latencies.sort()
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'mean_ms': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50_ms': _percentile(latencies, 0.50),
+        'p95_ms': _percentile(latencies, 0.95),
+        'p99_ms': _percentile(latencies, 0.99),
+        'throughput_ops': len(latencies) / wall if wall else 0.0,
+        'peak_rss_kib': _peak_rss_kib(),
+    }
+
+
+def _copy_database(path: str, files: Sequence[str], directory: str) -> str:
+    """Копирует файлы базы path (или ее шардов) в directory и возвращает путь копии для db.DB_FILE."""
+    os.makedirs(directory)
+    for file in files:
+        for suffix in ('', '-wal'):
+            if os.path.exists(file + suffix):
+                shutil.copyfile(file + suffix, os.path.join(directory, os.path.basename(file) + suffix))
+    return os.path.join(directory, os.path.basename(path))
+
+
+async def _reopen_db(path: str) -> None:
+    """Переключает бота на базу path; кэши, заполненные по прежней базе, сбрасываются."""
+    await db.close_db()
+    report_cache.clear()
+    achievements._earned_cache.clear()
+    db.DB_FILE = path
+    await db.init_db()
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run_benchmarks(path: str, operations: Sequence[str], iterations: int,
+                         concurrency: int, seed: int = 0, shards: int = 1) -> Dict[str, object]:
+    """Выполняет операции над базой path и возвращает результаты в виде словаря для JSON.
+
+    При shards > 1 база path один раз раскладывается по шардам рядом с ней.
+    Сама база не меняется: операции выполняются на ее временной копии, а
+    каждая операция из WRITE_OPERATIONS — на отдельной свежей копии.
+    """
+    db.DB_FILE = path
+    db.DB_SHARDS = shards
+    if shards > 1 and not all(os.path.exists(shard) for shard in rebalance.layout_files(shards)):
+        await rebalance.rebalance(1, shards)
+    sources = rebalance.layout_files(shards)
+    work = tempfile.TemporaryDirectory(prefix='sleepbot-bench-')
+    read_copy = _copy_database(path, sources, os.path.join(work.name, 'read'))
+    db.DB_FILE = read_copy
+    await db.init_db()
+    await charts.start_chart_service()
+    await content_store.load()
+    try:
+        all_users = []
+        rows = 0
+        for manager in db._get_managers():
+            async with manager.reader() as conn:
+                cursor = await conn.execute('SELECT user_id FROM user_sleep_stats')
+                all_users.extend(row[0] for row in await cursor.fetchall())
+                cursor = await conn.execute('SELECT COUNT(*) FROM sleep_data')
+                rows += (await cursor.fetchone())[0]
+        all_users.sort()
+
+        rng = random.Random(seed)
+        bot = FakeBot()
+        await sender.start_sender(FakeApplication(bot))
+        results = {}
+        for index, name in enumerate(operations):
+            user_ids = [rng.choice(all_users) for _ in range(iterations)]
+            if name in WRITE_OPERATIONS:
+                await _reopen_db(_copy_database(path, sources, os.path.join(work.name, f'write-{index}')))
+            if name in WARMED_OPERATIONS:
+                for user_id in set(user_ids):
+                    await OPERATIONS[name](user_id, bot)
+            results[name] = await _measure(OPERATIONS[name], user_ids, concurrency, bot)
+            if name in WRITE_OPERATIONS:
+                write_copy = os.path.dirname(db.DB_FILE)
+                await _reopen_db(read_copy)
+                shutil.rmtree(write_copy)
+    finally:
+        await sender.stop_sender()
+        await charts.stop_chart_service()
+        await db.close_db()
+        work.cleanup()
+
+    return {
+        'meta': {
+            'database': path,
+            'rows': rows,
+            'users': len(all_users),
+            'iterations': iterations,
+            'concurrency': concurrency,
+            'shards': shards,
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
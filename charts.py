@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Sequence
+
+from telegram.ext import Application
+from config import CHART_WORKERS, CHART_QUEUE_SIZE, CHART_RENDERER
+from metrics import Gauge
+from renderers import ChartRenderer, create_renderer
+
+logger = logging.getLogger(__name__)
+
+
+class ChartQueueFullError(Exception):
+    """Очередь рендеринга графиков переполнена, запрос нужно отклонить."""
+
+
+# Рендерер рабочего процесса; создается в _init_worker или при первом графике
+_renderer: Optional[ChartRenderer] = None
+
+
+def _init_worker(renderer: str = CHART_RENDERER) -> None:
+    """Загружает рендерер в рабочем процессе заранее, до первого графика."""
+    global _renderer
+    _renderer = create_renderer(renderer)
+
+
+def _warm_up() -> str:
+    """Рисует пустой график, чтобы рабочий процесс загрузил шрифты; возвращает имя рендерера."""
+    _render_duration_chart([0.0], '', [1])
+    return _renderer.name
+
+
+def _render_duration_chart(durations: Sequence[float], title: str, xticks: Sequence[int],
+                           xlabels: Optional[Sequence[str]] = None, xlabel: str = 'Дни') -> bytes:
+    """Рисует график продолжительности сна и возвращает PNG. Выполняется в рабочем процессе."""
+    if _renderer is None:
+        _init_worker()
+    return _renderer.render_durations(durations, title, xticks, xlabels, xlabel)
+
+
+class ChartService:
+    """Рендерит графики в пуле процессов, не блокируя цикл событий бота.
+
+    Одновременно принимается не больше queue_size запросов (включая
+    выполняющиеся); остальные сразу получают ChartQueueFullError.
+    """
+
+    def __init__(self, workers: int = CHART_WORKERS, queue_size: int = CHART_QUEUE_SIZE,
+                 renderer: str = CHART_RENDERER) -> None:
+        self.workers = workers
+        self.renderer = renderer
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(workers)
+        self._pending = 0
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.renderer,)
+        )
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def prewarm(self) -> None:
+        """Запускает рабочие процессы заранее.
+
+        Пул создает процессы при первых задачах, поэтому без прогрева первый
+        график ждет запуска процесса, импорта рендерера и загрузки шрифтов.
+        """
+        if self._executor is None:
+            raise RuntimeError('Chart service is not started.')
+        loop = asyncio.get_running_loop()
+        names = await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_up) for _ in range(self.workers)))
+        if self.renderer not in names:
+            logger.warning(f"Chart workers use {', '.join(sorted(set(names)))} instead of {self.renderer}.")
+
+    async def render_durations(self, durations: Sequence[float], title: str, xticks: Sequence[int],
+                               xlabels: Optional[Sequence[str]] = None, xlabel: str = 'Дни') -> bytes:
+        """Возвращает PNG графика продолжительности сна; xlabels — подписи делений xticks."""
+        if self._executor is None:
+            raise RuntimeError('Chart service is not started.')
+        if self._pending >= self.queue_size:
+            raise ChartQueueFullError(f'{self._pending} charts are already queued.')
+        self._pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, _render_duration_chart, list(durations), title, list(xticks),
+                    list(xlabels) if xlabels is not None else None, xlabel)
+        finally:
+            self._pending -= 1
+
+
+_service: Optional[ChartService] = None
+
+
+def chart_queue_depth() -> int:
+    """Количество графиков в очереди и в работе."""
+    return len(_service) if _service is not None else 0
+
+
+Gauge('sleepbot_chart_queue_depth', 'Графики в очереди рендеринга и в работе', callback=chart_queue_depth)
+
+
+def get_chart_service() -> ChartService:
+    if _service is None:
+        raise RuntimeError('Chart service is not started. Call start_chart_service() first.')
+    return _service
+
+
+async def start_chart_service(_: Optional[Application] = None) -> None:
+    """Запускает пул процессов для рендеринга графиков."""
+    global _service
+    if _service is not None:
+        return
+    _service = ChartService()
+    _service.start()
+    logger.info(f"Chart service started with {_service.workers} {_service.renderer} workers.")
+
+
+async def stop_chart_service(_: Optional[Application] = None) -> None:
+    """Останавливает пул процессов рендеринга."""
+    global _service
+    if _service is None:
+        return
+    service, _service = _service, None
+    await asyncio.get_running_loop().run_in_executor(None, service.stop)
+    logger.info("Chart service stopped.")
@@ -12,6 +12,14 @@ SLEEP_SCHEDULE = {
     '9:30': ['00:15', '01:45']
 }
 
+# Тексты бота: имя -> (файл, 'lines' — по строке на элемент, 'text' — целиком)
+CONTENT_FILES = {
+    'tips': ('sleep_tips.txt', 'lines'),
+    'exercises': ('sleep_exercises.txt', 'lines'),
+    'help': ('help.txt', 'text'),
+}
+CONTENT_RELOAD_INTERVAL = 10     # Как часто проверять изменения файлов с текстами, секунды
+
 # Названия достижений
 ACHIEVEMENT_NAMES = {
     'newbie': 'Сонный новичок',
@@ -23,3 +31,89 @@ ACHIEVEMENT_NAMES = {
     'perfect_sleep': 'Идеальный сон',
     'stable_regime': 'Стабильный режим'
 }
+
+ACHIEVEMENT_CACHE_SIZE = 10000   # Для скольких пользователей держать полученные достижения в памяти
+
+# Inline-режим: карточки для репоста достижений и статистики
+INLINE_CACHE_TIME = 300          # Сколько Telegram может отдавать ответ на inline-запрос из своего кэша, секунды
+INLINE_CACHE_SIZE = 10000        # Для скольких пользователей держать готовые карточки в памяти
+
+# Настройки базы данных
+DB_SHARDS = 1                    # На сколько файлов SQLite делятся данные пользователей; менять через manage.py rebalance
+DB_READER_POOL_SIZE = 4          # Количество соединений для чтения
+DB_CACHE_SIZE_KIB = 8192         # Размер страничного кэша SQLite на соединение, КиБ
+DB_STATEMENT_CACHE_SIZE = 128    # Количество подготовленных выражений, кэшируемых на соединение
+DB_WRITE_FLUSH_INTERVAL = 0.005  # Сколько ждать соседние записи перед коммитом, секунды
+DB_WRITE_BATCH_SIZE = 500        # Максимум строк в одной транзакции очереди записи
+
+# Импорт и экспорт истории сна
+IMPORT_MAX_FILE_SIZE = 2 * 1024 ** 2  # Максимальный размер загружаемого файла, байты
+IMPORT_MAX_ROWS = 20000          # Максимум записей в одном импорте
+IMPORT_CHUNK_SIZE = 500          # Сколько записей импортировать одной транзакцией
+EXPORT_FETCH_SIZE = 1000         # Сколько строк читать из базы за раз при экспорте
+
+# Состояние пользователей и диалогов
+PERSISTENCE_HOT_USERS = 10000    # Для скольких недавно активных пользователей держать user_data в памяти
+PERSISTENCE_FLUSH_INTERVAL = 30  # Как часто записывать изменившееся состояние в базу, секунды
+PERSISTENCE_CONVERSATION_TTL = 24 * 60 * 60  # Сколько хранить незавершенный диалог, секунды
+
+# Статистика сна
+STATS_RECENT_ENTRIES = 5         # По скольким последним записям считать min/max времени сна
+
+# Исходящие сообщения (лимиты Telegram: ~30 сообщений в секунду, 1 в секунду в чат, 20 в минуту в группу)
+SENDER_GLOBAL_RATE = 25          # Сообщений в секунду на весь бот
+SENDER_GLOBAL_BURST = 25         # Сколько сообщений можно отправить разом после паузы
+SENDER_CHAT_RATE = 1.0           # Сообщений в секунду в один личный чат
+SENDER_CHAT_BURST = 3            # Запас сообщений в личный чат
+SENDER_GROUP_RATE = 20 / 60      # Сообщений в секунду в одну группу
+SENDER_GROUP_BURST = 3           # Запас сообщений в группу
+SENDER_MAX_RETRIES = 3           # Сколько раз повторять запрос после RetryAfter
+SENDER_MAX_CHAT_BUCKETS = 10000  # Сколько лимитов по чатам хранить, прежде чем чистить неактивные
+
+# Напоминания
+REMINDER_LEAD_MINUTES = 15       # За сколько минут до рекомендованного времени напоминать о сне
+REMINDER_LOG_DELAY_MINUTES = 60  # Через сколько минут после пробуждения напоминать записать сон
+REMINDER_SPREAD_SECONDS = 45     # За сколько секунд равномерно рассылать напоминания одной минуты
+REMINDER_MAX_PER_SECOND = 20     # Максимальная скорость рассылки напоминаний, сообщений в секунду
+REMINDER_CATCH_UP_MINUTES = 5    # Сколько пропущенных минут досылать после задержки или перезапуска
+
+# Пакетный расчет советов
+ADVICE_BATCH_INTERVAL = 6 * 60 * 60  # Как часто пересчитывать советы для всех пользователей, секунды
+ADVICE_BATCH_FIRST = 60          # Задержка первого пересчета после запуска, секунды
+ADVICE_BATCH_USERS = 2000        # Сколько пользователей обрабатывать за одну пачку
+
+# Рендеринг графиков
+CHART_WORKERS = 2                # Количество процессов для рендеринга графиков
+CHART_QUEUE_SIZE = 16            # Сколько графиков может ждать рендеринга одновременно
+CHART_RENDERER = 'pillow'        # Рендерер графиков: 'pillow' (быстрый) или 'matplotlib'
+CHART_FONT = None                # Путь к TTF-шрифту с кириллицей для pillow; None — DejaVuSans из matplotlib
+
+# Кэш отчетов
+REPORT_CACHE_MAX_ENTRIES = 10000        # Максимум отчетов в кэше
+REPORT_CACHE_MAX_BYTES = 64 * 1024 ** 2  # Максимальный объем кэша, байты
+
+# Кэш истории сна активных пользователей
+HISTORY_CACHE_NIGHTS = 100       # Сколько последних ночей пользователя держать в памяти
+HISTORY_CACHE_MAX_BYTES = 32 * 1024 ** 2  # Максимальный объем кэша, байты
+
+# Обработка обновлений
+UPDATE_CONCURRENCY = 16          # Сколько обновлений разных пользователей обрабатывать одновременно
+UPDATE_MAX_PENDING = 10000       # Сколько обновлений может ждать обработки, прежде чем чтение очереди приостановится
+
+# Запуск
+STARTUP_BUDGET = 3.0             # Допустимое время запуска до готовности бота, секунды
+STARTUP_PREWARM = True           # Прогревать графики и NumPy в фоне после запуска
+STARTUP_PREWARM_DELAY = 5        # Через сколько секунд после запуска начинать прогрев
+
+# Метрики и профилирование
+METRICS_HOST = '127.0.0.1'       # Адрес HTTP-эндпоинта /metrics
+METRICS_PORT = None              # Порт эндпоинта /metrics; None — не запускать
+PROFILER_ENABLED = False         # Сэмплирующий профилировщик медленных обработчиков
+PROFILER_INTERVAL = 0.005        # Интервал между снимками стека, секунды
+PROFILER_SLOWEST = 20            # Сколько самых медленных обработок хранить
+
+# Режим вебхука (включается в .env: BOT_MODE=webhook)
+WEBHOOK_LISTEN = '0.0.0.0'       # Адрес, на котором слушает встроенный HTTP-сервер
+WEBHOOK_PORT = 8443              # Порт встроенного HTTP-сервера
+WEBHOOK_PATH = '/telegram'       # Путь, на который Telegram присылает обновления
+WEBHOOK_MAX_CONNECTIONS = 40     # Максимум одновременных соединений от Telegram (1-100)
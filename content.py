@@ -0,0 +1,150 @@
+import logging
+import math
+import os
+import random
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+
+import aiofiles
+from telegram.ext import Application, ContextTypes
+from config import CONTENT_FILES, CONTENT_RELOAD_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Состояние колоды пользователя упаковано в одно целое число:
+# позиция (младшие биты), затем зерно перестановки и версия контента
+_POSITION_BITS = 20
+_SEED_BITS = 32
+# Старший бит зерна: колода сдвинута на одну карту, и первая карта выдается последней
+_ROTATED = 1 << (_SEED_BITS - 1)
+
+
+@dataclass(frozen=True)
+class Asset:
+    """Загруженный файл контента: строки (советы, упражнения) или цельный текст (справка)."""
+    value: Union[Tuple[str, ...], str]
+    mtime_ns: int
+    # crc32 содержимого: не зависит от процесса, поэтому колоды переживают перезапуск,
+    # пока файл не изменился
+    version: int
+    # Шаги аффинных перестановок, взаимно простые с количеством строк
+    steps: Tuple[int, ...] = ()
+
+
+def _coprime_steps(count: int) -> Tuple[int, ...]:
+    return tuple(step for step in range(1, max(count, 2)) if math.gcd(step, count) == 1) or (1,)
+
+
+class ContentStore:
+    """Тексты бота в памяти с перезагрузкой при изменении файлов.
+
+    Файл перечитывается целиком и подменяется одним присваиванием, поэтому
+    обработчики всегда видят либо старую, либо новую версию.
+    """
+
+    def __init__(self, files: Dict[str, Tuple[str, str]] = CONTENT_FILES) -> None:
+        # name -> (путь, 'lines' или 'text')
+        self.files = files
+        self._assets: Dict[str, Asset] = {}
+
+    async def _read(self, name: str) -> Optional[Asset]:
+        path, kind = self.files[name]
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            async with aiofiles.open(path, 'r', encoding='utf-8') as file:
+                raw = await file.read()
+        except FileNotFoundError:
+            return None
+        if kind == 'lines':
+            lines = tuple(line.strip() for line in raw.splitlines() if line.strip())
+            version = zlib.crc32('\n'.join(lines).encode('utf-8'))
+            return Asset(lines, mtime_ns, version, _coprime_steps(len(lines)))
+        return Asset(raw, mtime_ns, zlib.crc32(raw.encode('utf-8')))
+
+    async def load(self) -> None:
+        """Загружает все файлы; отсутствующий файл дает пустой контент."""
+        for name, (path, kind) in self.files.items():
+            asset = await self._read(name)
+            if asset is None:
+                logger.warning(f"Content file {path} not found.")
+                asset = Asset(() if kind == 'lines' else '', 0, 0)
+            self._assets[name] = asset
+
+    async def reload_changed(self) -> None:
+        """Перечитывает файлы, у которых изменилось время модификации."""
+        for name, (path, _) in self.files.items():
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if mtime_ns == self._assets[name].mtime_ns:
+                continue
+            asset = await self._read(name)
+            # Файл мог исчезнуть между stat и чтением (например, при замене редактором)
+            if asset is not None:
+                self._assets[name] = asset
+                logger.info(f"Reloaded {path}.")
+
+    def text(self, name: str) -> str:
+        return self._assets[name].value
+
+    def lines(self, name: str) -> Tuple[str, ...]:
+        return self._assets[name].value
+
+    def draw(self, name: str, state: Optional[int]) -> Tuple[Optional[str], Optional[int]]:
+        """Следующая строка из перемешанной колоды пользователя и новое состояние колоды.
+
+        Колода — перестановка i -> (a * i + b) mod n с a, взаимно простым с n:
+        строки не повторяются, пока колода не закончится, а для выдачи нужны
+        только зерно и позиция. После изменения файла колода начинается заново.
+        """
+        asset = self._assets[name]
+        count = len(asset.value)
+        if count == 0:
+            return None, state
+
+        previous = None
+        if state is not None:
+            position = state & ((1 << _POSITION_BITS) - 1)
+            seed = (state >> _POSITION_BITS) & ((1 << _SEED_BITS) - 1)
+            version = state >> (_POSITION_BITS + _SEED_BITS)
+            if version != asset.version:
+                state = None
+            elif position >= count:
+                previous = self._card(asset, seed, count - 1)
+                state = None
+        if state is None:
+            seed = random.getrandbits(_SEED_BITS - 1)
+            position = 0
+            # Новая колода не должна начинаться с только что выданной строки: она уходит в конец
+            if count > 1 and self._card(asset, seed, 0) == previous:
+                seed |= _ROTATED
+
+        card = self._card(asset, seed, position)
+        new_state = ((asset.version << _SEED_BITS | seed) << _POSITION_BITS) | (position + 1)
+        return asset.value[card], new_state
+
+    @staticmethod
+    def _card(asset: Asset, seed: int, position: int) -> int:
+        count = len(asset.value)
+        if seed & _ROTATED:
+            seed &= ~_ROTATED
+            position = (position + 1) % count
+        step = asset.steps[seed % len(asset.steps)]
+        offset = (seed >> 8) % count
+        return (step * position + offset) % count
+
+
+content_store = ContentStore()
+
+
+async def _reload_job(_: ContextTypes.DEFAULT_TYPE) -> None:
+    await content_store.reload_changed()
+
+
+async def load_content(application: Application) -> None:
+    """Загружает тексты и запускает проверку изменений файлов."""
+    await content_store.load()
+    application.job_queue.run_repeating(
+        _reload_job, interval=CONTENT_RELOAD_INTERVAL, first=CONTENT_RELOAD_INTERVAL, name='content_reload')
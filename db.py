@@ -1,20 +1,759 @@
 from telegram.ext import Application
 import aiosqlite
-from typing import List, Tuple
+import asyncio
+import glob
+import logging
+import os
+import zlib
+from contextlib import asynccontextmanager
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from config import (DB_SHARDS, DB_READER_POOL_SIZE, DB_CACHE_SIZE_KIB, DB_STATEMENT_CACHE_SIZE,
+                    DB_WRITE_FLUSH_INTERVAL, DB_WRITE_BATCH_SIZE, STATS_RECENT_ENTRIES)
+from utils import shift_morning_minutes, sleep_duration_minutes
+from metrics import instrument_db, Gauge
+from history_cache import UserHistory, history_cache
 
 DB_FILE = 'sleepbot.db'
 
+logger = logging.getLogger(__name__)
 
-async def create_tables(_: Application) -> None:
-    """Асинхронно создает таблицы в базе данных, если они не существуют."""
-    async with aiosqlite.connect(DB_FILE) as db:
+# Настройки, применяемые к каждому соединению. WAL позволяет читателям работать
+# параллельно с единственным писателем; читателям достаточно synchronous=NORMAL.
+_CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA cache_size=-{DB_CACHE_SIZE_KIB}',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+)
+# Писатель делает fsync журнала на каждом коммите: запись, о которой сообщили
+# вызывающему, переживает отключение питания. Коммиты групповые (WriteQueue),
+# поэтому fsync приходится на пачку записей, а не на каждую.
+_WRITER_PRAGMAS = (
+    'PRAGMA synchronous=FULL',
+)
+
+# Тексты запросов вынесены в константы: sqlite3 кэширует подготовленные
+# выражения по точному тексту SQL, поэтому повторные вызовы не компилируют их заново.
+# Время хранится в минутах от полуночи, дата — номером дня от 1970-01-01,
+# длительность сна в минутах вычисляется при записи. Строки выборок имеют вид
+# (sleep_min, wake_min, duration_min, day).
+SCHEMA_VERSION = 1
+
+_UPSERT_SLEEP_SQL = '''
+        INSERT INTO sleep_data (user_id, day, sleep_min, wake_min, duration_min)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            sleep_min=excluded.sleep_min,
+            wake_min=excluded.wake_min,
+            duration_min=excluded.duration_min
+        '''
+
+_SELECT_SLEEP_SQL = '''
+        SELECT sleep_min, wake_min, duration_min, day
+        FROM sleep_data
+        WHERE user_id = ?
+        ORDER BY day ASC
+        '''
+
+# Все выборки ниже идут по индексу idx_sleep_unique_user_date (user_id, day),
+# поэтому их стоимость зависит от размера результата, а не от длины истории.
+_EXISTS_SLEEP_SQL = '''
+        SELECT 1 FROM sleep_data
+        WHERE user_id = ? AND day = ?
+        LIMIT 1
+        '''
+
+_SELECT_RECENT_SLEEP_SQL = '''
+        SELECT sleep_min, wake_min, duration_min, day FROM (
+            SELECT sleep_min, wake_min, duration_min, day
+            FROM sleep_data
+            WHERE user_id = ?
+            ORDER BY day DESC
+            LIMIT ?
+        )
+        ORDER BY day ASC
+        '''
+
+_SELECT_SLEEP_RANGE_SQL = '''
+        SELECT sleep_min, wake_min, duration_min, day
+        FROM sleep_data
+        WHERE user_id = ? AND day BETWEEN ? AND ?
+        ORDER BY day ASC
+        '''
+
+_COUNT_SLEEP_SQL = '''
+        SELECT COUNT(*) FROM sleep_data
+        WHERE user_id = ?
+        '''
+
+# Выгрузка всех пользователей (manage.py export) идет по индексу (user_id, day)
+_SELECT_ALL_SLEEP_SQL = '''
+        SELECT user_id, sleep_min, wake_min, duration_min, day
+        FROM sleep_data
+        ORDER BY user_id, day
+        '''
+
+# Долгосрочные отчеты: агрегаты считаются в SQLite, в Python попадают только точки графика.
+# Отход ко сну до полудня сдвигается на сутки вперед, чтобы 00:30 было позже 23:30.
+_SHIFTED_BED_SQL = 'CASE WHEN sleep_min < 720 THEN sleep_min + 1440 ELSE sleep_min END'
+
+# Процентили по ближайшему рангу: наименьшее значение, ранг которого не меньше p * total
+_SELECT_SLEEP_SUMMARY_SQL = f'''
+        WITH nights AS (
+            SELECT day, duration_min,
+                   {_SHIFTED_BED_SQL} AS bed,
+                   wake_min AS wake,
+                   ROW_NUMBER() OVER (ORDER BY {_SHIFTED_BED_SQL}) AS bed_rank,
+                   ROW_NUMBER() OVER (ORDER BY wake_min) AS wake_rank,
+                   COUNT(*) OVER () AS total
+            FROM sleep_data
+            WHERE user_id = ? AND day >= ?
+        )
+        SELECT COUNT(*), MIN(day), AVG(duration_min), AVG(duration_min BETWEEN 420 AND 540),
+               MIN(CASE WHEN bed_rank >= 0.25 * total THEN bed END),
+               MIN(CASE WHEN bed_rank >= 0.5 * total THEN bed END),
+               MIN(CASE WHEN bed_rank >= 0.75 * total THEN bed END),
+               MIN(CASE WHEN wake_rank >= 0.25 * total THEN wake END),
+               MIN(CASE WHEN wake_rank >= 0.5 * total THEN wake END),
+               MIN(CASE WHEN wake_rank >= 0.75 * total THEN wake END)
+        FROM nights
+        '''
+
+# Номер недели (с понедельника: 1970-01-01 — четверг), месяца (год * 12 + месяц - 1) и квартала
+_MONTH_BUCKET_SQL = ("CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) * 12"
+                     " + CAST(strftime('%m', day * 86400, 'unixepoch') AS INTEGER) - 1")
+TREND_BUCKETS = {
+    'week': '(day + 3) / 7',
+    'month': _MONTH_BUCKET_SQL,
+    'quarter': f'({_MONTH_BUCKET_SQL}) / 3',
+}
+
+_SELECT_SLEEP_TREND_SQL = {
+    bucket: f'''
+        SELECT {expression} AS bucket, COUNT(*), AVG(duration_min)
+        FROM sleep_data
+        WHERE user_id = ? AND day >= ?
+        GROUP BY bucket
+        ORDER BY bucket
+        '''
+    for bucket, expression in TREND_BUCKETS.items()
+}
+
+_SELECT_EXISTING_DATES_SQL = '''
+        SELECT user_id, day FROM sleep_data
+        WHERE (user_id, day) IN (VALUES {})
+        '''
+
+# Статистика хранит агрегаты по последним записям пользователя и обновляется
+# в той же транзакции, что и сами записи. Окно в 30 записей покрывает все агрегаты.
+STATS_WINDOW = 30
+
+_SELECT_STATS_SQL = '''
+        SELECT user_id, entry_count, duration_sum_7, duration_sum_30, last_duration,
+               schedule_streak, bed_min, bed_max, wake_min, wake_max,
+               wake_delta_sum_7, late_bed_count_7, data_version
+        FROM user_sleep_stats
+        WHERE user_id = ?
+        '''
+
+_SELECT_STATS_COUNTERS_SQL = '''
+        SELECT entry_count, data_version FROM user_sleep_stats
+        WHERE user_id = ?
+        '''
+
+_UPSERT_STATS_SQL = '''
+        INSERT OR REPLACE INTO user_sleep_stats (
+            user_id, entry_count, duration_sum_7, duration_sum_30, last_duration,
+            schedule_streak, bed_min, bed_max, wake_min, wake_max,
+            wake_delta_sum_7, late_bed_count_7, data_version
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+
+_INSERT_ACHIEVEMENT_SQL = '''
+        INSERT OR IGNORE INTO achievements (user_id, achievement)
+        VALUES (?, ?)
+        '''
+
+_SELECT_ACHIEVEMENTS_SQL = '''
+        SELECT achievement FROM achievements
+        WHERE user_id = ?
+        ORDER BY id
+        '''
+
+
+# Последние `window` записей каждого пользователя, у которого их не меньше `window`
+_SELECT_SLEEP_WINDOWS_SQL = '''
+        WITH ranked AS (
+            SELECT user_id, day, sleep_min, wake_min, duration_min,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day DESC) AS rn
+            FROM sleep_data
+        )
+        SELECT r.user_id, s.data_version, r.sleep_min, r.wake_min, r.duration_min
+        FROM ranked r
+        JOIN user_sleep_stats s ON s.user_id = r.user_id
+        WHERE r.rn <= :window AND s.entry_count >= :window
+        ORDER BY r.user_id, r.day
+        '''
+
+_SELECT_SHORT_HISTORY_USERS_SQL = '''
+        SELECT user_id, data_version FROM user_sleep_stats
+        WHERE entry_count < ?
+        ORDER BY user_id
+        '''
+
+_UPSERT_ADVICE_SQL = '''
+        INSERT INTO advice_cache (user_id, data_version, tip)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            data_version = excluded.data_version,
+            tip = excluded.tip
+        '''
+
+# Совет актуален, только если после его расчета данные пользователя не менялись
+_SELECT_ADVICE_SQL = '''
+        SELECT a.tip FROM advice_cache a
+        JOIN user_sleep_stats s ON s.user_id = a.user_id AND s.data_version = a.data_version
+        WHERE a.user_id = ?
+        '''
+
+_UPSERT_REMINDER_SQL = '''
+        INSERT INTO reminders (user_id, chat_id, wake_min, bed_min, log_min)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            chat_id = excluded.chat_id,
+            wake_min = excluded.wake_min,
+            bed_min = excluded.bed_min,
+            log_min = excluded.log_min
+        '''
+
+_DELETE_REMINDER_SQL = '''
+        DELETE FROM reminders WHERE user_id = ?
+        '''
+
+_SELECT_REMINDER_SQL = '''
+        SELECT bed_min, log_min FROM reminders WHERE user_id = ?
+        '''
+
+_SELECT_BEDTIME_REMINDERS_SQL = '''
+        SELECT user_id, chat_id, wake_min, bed_min FROM reminders
+        WHERE bed_min = ?
+        '''
+
+# Напоминание записать сон не нужно тем, кто уже записал его сегодня
+_SELECT_LOG_REMINDERS_SQL = '''
+        SELECT r.user_id, r.chat_id FROM reminders r
+        WHERE r.log_min = ?
+          AND NOT EXISTS (SELECT 1 FROM sleep_data s WHERE s.user_id = r.user_id AND s.day = ?)
+        '''
+
+_COUNT_BEDTIME_BUCKETS_SQL = '''
+        SELECT bed_min, COUNT(*) FROM reminders GROUP BY bed_min
+        '''
+
+_COUNT_LOG_BUCKETS_SQL = '''
+        SELECT log_min, COUNT(*) FROM reminders GROUP BY log_min
+        '''
+
+
+_SELECT_USER_STATE_SQL = '''
+        SELECT data FROM user_state WHERE user_id = ?
+        '''
+
+_UPSERT_USER_STATE_SQL = '''
+        INSERT INTO user_state (user_id, data)
+        VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET data = excluded.data
+        '''
+
+_DELETE_USER_STATE_SQL = '''
+        DELETE FROM user_state WHERE user_id = ?
+        '''
+
+_SELECT_CONVERSATIONS_SQL = '''
+        SELECT key, state FROM conversation_state
+        WHERE name = ? AND updated_at >= ?
+        '''
+
+_UPSERT_CONVERSATION_SQL = '''
+        INSERT INTO conversation_state (name, key, state, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(name, key) DO UPDATE SET
+            state = excluded.state,
+            updated_at = excluded.updated_at
+        '''
+
+_DELETE_CONVERSATION_SQL = '''
+        DELETE FROM conversation_state WHERE name = ? AND key = ?
+        '''
+
+_DELETE_STALE_CONVERSATIONS_SQL = '''
+        DELETE FROM conversation_state WHERE name = ? AND updated_at < ?
+        '''
+
+class UserSleepStats(NamedTuple):
+    """Строка таблицы user_sleep_stats. Длительности и время указаны в минутах."""
+    user_id: int
+    entry_count: int
+    duration_sum_7: int      # Сумма длительностей последних 7 записей
+    duration_sum_30: int     # Сумма длительностей последних 30 записей
+    last_duration: int       # Длительность последнего сна
+    schedule_streak: int     # Сколько последних записей подряд укладываются в 30 минут разброса
+    bed_min: int             # Минимум и максимум времени отхода ко сну
+    bed_max: int             # за последние STATS_RECENT_ENTRIES записей
+    wake_min: int            # То же для времени пробуждения
+    wake_max: int
+    wake_delta_sum_7: int    # Сумма сдвигов времени пробуждения между соседними из последних 7 записей
+    late_bed_count_7: int    # Сколько из последних 7 раз лег спать между 01:00 и 12:00
+    data_version: int        # Увеличивается при каждом изменении данных о сне пользователя
+
+
+SleepRow = Tuple[int, int, int, int]
+
+
+class SleepSummary(NamedTuple):
+    """Сводка за период. Время в минутах; отход ко сну после полуночи больше 1440."""
+    nights: int
+    first_day: int
+    avg_duration: float      # Средняя продолжительность сна, минуты
+    target_share: float      # Доля ночей с 7–9 часами сна
+    bed_p25: int
+    bed_p50: int
+    bed_p75: int
+    wake_p25: int
+    wake_p50: int
+    wake_p75: int
+
+
+def _summarize_window(rows: Sequence[SleepRow]) -> Tuple[int, ...]:
+    """Считает агрегаты статистики по последним записям (в хронологическом порядке)."""
+    beds = [row[0] for row in rows]
+    wakes = [row[1] for row in rows]
+    durations = [row[2] for row in rows]
+
+    # Серия стабильного режима: отход и подъем в пределах 30 минут
+    streak = 0
+    bed_lo = wake_lo = float('inf')
+    bed_hi = wake_hi = float('-inf')
+    for bed, wake in zip(reversed(beds), reversed(wakes)):
+        bed, wake = shift_morning_minutes(bed), shift_morning_minutes(wake)
+        bed_lo, bed_hi = min(bed_lo, bed), max(bed_hi, bed)
+        wake_lo, wake_hi = min(wake_lo, wake), max(wake_hi, wake)
+        if bed_hi - bed_lo > 30 or wake_hi - wake_lo > 30:
+            break
+        streak += 1
+
+    recent_beds = beds[-STATS_RECENT_ENTRIES:]
+    recent_wakes = wakes[-STATS_RECENT_ENTRIES:]
+    week_wakes = wakes[-7:]
+    return (
+        sum(durations[-7:]),
+        sum(durations[-30:]),
+        durations[-1],
+        streak,
+        min(recent_beds),
+        max(recent_beds),
+        min(recent_wakes),
+        max(recent_wakes),
+        sum(abs(week_wakes[i + 1] - week_wakes[i]) for i in range(len(week_wakes) - 1)),
+        sum(1 for bed in beds[-7:] if 60 <= bed < 12 * 60),
+    )
+
+
+async def _refresh_user_stats(db: aiosqlite.Connection, added: Dict[int, Optional[int]]) -> None:
+    """Пересчитывает статистику пользователей внутри текущей транзакции.
+
+    added содержит количество новых записей для каждого пользователя;
+    None означает, что количество нужно пересчитать по таблице sleep_data.
+    """
+    stats_rows = []
+    for user_id, new_entries in added.items():
+        cursor = await db.execute(_SELECT_RECENT_SLEEP_SQL, (user_id, STATS_WINDOW))
+        window = await cursor.fetchall()
+        if not window:
+            continue
+        cursor = await db.execute(_SELECT_STATS_COUNTERS_SQL, (user_id,))
+        counters = await cursor.fetchone()
+        if counters is None or new_entries is None:
+            cursor = await db.execute(_COUNT_SLEEP_SQL, (user_id,))
+            entry_count = (await cursor.fetchone())[0]
+        else:
+            entry_count = counters[0] + new_entries
+        data_version = counters[1] + 1 if counters is not None else 1
+        stats_rows.append((user_id, entry_count, *_summarize_window(window), data_version))
+    await db.executemany(_UPSERT_STATS_SQL, stats_rows)
+
+
+async def _upsert_sleep_rows(db: aiosqlite.Connection, rows: List[Sequence]) -> None:
+    """Записывает данные о сне и обновляет статистику в одной транзакции."""
+    keys = list(dict.fromkeys((row[0], row[1]) for row in rows))
+    existing = set()
+    # Ограничение SQLite на число параметров в запросе
+    for start in range(0, len(keys), 400):
+        chunk = keys[start:start + 400]
+        sql = _SELECT_EXISTING_DATES_SQL.format(', '.join(['(?, ?)'] * len(chunk)))
+        cursor = await db.execute(sql, [value for key in chunk for value in key])
+        existing.update(await cursor.fetchall())
+
+    added: Dict[int, Optional[int]] = {}
+    for key in keys:
+        added[key[0]] = added.get(key[0], 0) + (key not in existing)
+
+    await db.executemany(_UPSERT_SLEEP_SQL, rows)
+    await _refresh_user_stats(db, added)
+
+
+class ConnectionManager:
+    """Долгоживущие соединения с базой: один писатель и пул читателей."""
+
+    def __init__(self, path: str, readers: int = DB_READER_POOL_SIZE) -> None:
+        self.path = path
+        self.readers = readers
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock = asyncio.Lock()
+        self._reader_pool: asyncio.Queue = asyncio.Queue()
+        self._all_readers: List[aiosqlite.Connection] = []
+
+    async def _connect(self, writer: bool = False) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path, cached_statements=DB_STATEMENT_CACHE_SIZE)
+        for pragma in _CONNECTION_PRAGMAS + (_WRITER_PRAGMAS if writer else ()):
+            await conn.execute(pragma)
+        return conn
+
+    async def start(self) -> None:
+        """Открывает соединение писателя и заполняет пул читателей."""
+        self._writer = await self._connect(writer=True)
+        for _ in range(self.readers):
+            conn = await self._connect()
+            self._all_readers.append(conn)
+            self._reader_pool.put_nowait(conn)
+        logger.info(f"Database {self.path} opened with {self.readers} reader connections.")
+
+    async def close(self) -> None:
+        """Закрывает все соединения."""
+        async with self._writer_lock:
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+        for conn in self._all_readers:
+            await conn.close()
+        self._all_readers.clear()
+        self._reader_pool = asyncio.Queue()
+        logger.info(f"Database {self.path} closed.")
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Выдает свободное соединение для чтения и возвращает его в пул."""
+        conn = await self._reader_pool.get()
+        try:
+            yield conn
+        finally:
+            self._reader_pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Выдает соединение писателя; одновременно им пользуется только одна корутина."""
+        async with self._writer_lock:
+            if self._writer is None:
+                raise RuntimeError('Database connection manager is not started.')
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+
+class WriteQueue:
+    """Очередь отложенной записи: объединяет записи многих пользователей в одну транзакцию.
+
+    Каждая запись возвращает future, который завершается, когда транзакция,
+    в которую она попала, закоммичена и сброшена на диск (synchronous=FULL).
+    """
+
+    def __init__(self, manager: ConnectionManager,
+                 flush_interval: float = DB_WRITE_FLUSH_INTERVAL,
+                 batch_size: int = DB_WRITE_BATCH_SIZE) -> None:
+        self.manager = manager
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: Deque[Tuple[str, List[Sequence], asyncio.Future]] = deque()
+        self._pending_rows = 0
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._pending_rows
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает накопленные записи и останавливает очередь."""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def submit(self, sql: str, rows: Iterable[Sequence]) -> asyncio.Future:
+        """Ставит строки в очередь на запись одним запросом sql."""
+        if self._closing:
+            raise RuntimeError('Write queue is closed.')
+        future = asyncio.get_running_loop().create_future()
+        rows = list(rows)
+        self._pending.append((sql, rows, future))
+        self._pending_rows += len(rows)
+        self._wakeup.set()
+        return future
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Короткая пауза, чтобы в одну транзакцию попали записи соседних запросов
+                await asyncio.sleep(self.flush_interval)
+            while self._pending:
+                await self._flush(self._take_batch())
+            self._wakeup.clear()
+            if self._closing:
+                return
+
+    def _take_batch(self) -> List[Tuple[str, List[Sequence], asyncio.Future]]:
+        batch = []
+        taken = 0
+        while self._pending and (not batch or taken + len(self._pending[0][1]) <= self.batch_size):
+            item = self._pending.popleft()
+            batch.append(item)
+            taken += len(item[1])
+        self._pending_rows -= taken
+        return batch
+
+    async def _flush(self, batch: List[Tuple[str, List[Sequence], asyncio.Future]]) -> None:
+        # Подряд идущие строки с одинаковым запросом пишутся одним executemany;
+        # разные запросы выполняются в порядке постановки в очередь
+        runs: List[Tuple[str, List[Sequence]]] = []
+        for sql, rows, _ in batch:
+            if runs and runs[-1][0] == sql:
+                runs[-1][1].extend(rows)
+            else:
+                runs.append((sql, list(rows)))
+        try:
+            async with self.manager.writer() as db:
+                for sql, rows in runs:
+                    if sql == _UPSERT_SLEEP_SQL:
+                        await _upsert_sleep_rows(db, rows)
+                    else:
+                        await db.executemany(sql, rows)
+                await db.commit()
+        except Exception as e:
+            if len(batch) > 1:
+                # Повторяем запросы по одному, чтобы ошибка одного не отменила остальные
+                logger.warning(f"Batch of {len(batch)} writes failed ({e}), retrying one by one.")
+                for item in batch:
+                    await self._flush([item])
+                return
+            logger.error(f"Failed to write {batch[0][0].split()[0]} request: {e}", exc_info=True)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+def shard_index(key: object, shards: int) -> int:
+    """Номер шарда для user_id или ключа диалога.
+
+    crc32 от текстового вида ключа не зависит от запуска и версии Python,
+    поэтому пользователь всегда попадает в один и тот же файл.
+    """
+    if shards == 1:
+        return 0
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def shard_path(index: int, shards: int) -> str:
+    """Файл шарда: при одном шарде — DB_FILE, иначе <имя>.<index>-of-<shards>.db рядом с ним."""
+    if shards == 1:
+        return DB_FILE
+    root, ext = os.path.splitext(DB_FILE)
+    return f'{root}.{index}-of-{shards}{ext}'
+
+
+def _existing_layouts() -> List[int]:
+    """Количества шардов, для которых на диске уже есть файлы баз."""
+    layouts = {1} if os.path.exists(DB_FILE) else set()
+    root, ext = os.path.splitext(DB_FILE)
+    for path in glob.glob(f'{glob.escape(root)}.*-of-*{ext}'):
+        count = path[len(root) + 1:len(path) - len(ext)].partition('-of-')[2]
+        if count.isdigit():
+            layouts.add(int(count))
+    return sorted(layouts)
+
+
+# Соединения и очереди записи по шардам; индекс в списке — номер шарда
+_managers: List[ConnectionManager] = []
+_write_queues: List[WriteQueue] = []
+
+
+def _get_manager(key: object) -> ConnectionManager:
+    """Соединения шарда, в котором лежат данные user_id (или диалога) key."""
+    if not _managers:
+        raise RuntimeError('Database is not initialized. Call init_db() first.')
+    return _managers[shard_index(key, len(_managers))]
+
+
+def _get_managers() -> List[ConnectionManager]:
+    """Соединения всех шардов по порядку — для запросов по всем пользователям."""
+    if not _managers:
+        raise RuntimeError('Database is not initialized. Call init_db() first.')
+    return list(_managers)
+
+
+def write_queue_depth() -> int:
+    """Количество строк, ожидающих записи, во всех шардах."""
+    return sum(len(write_queue) for write_queue in _write_queues)
+
+
+Gauge('sleepbot_db_write_queue_rows', 'Строки в очереди записи', callback=write_queue_depth)
+Gauge('sleepbot_db_shards', 'Количество открытых шардов базы', callback=lambda: len(_managers))
+
+
+def _get_write_queue(key: object) -> WriteQueue:
+    """Очередь записи шарда, в котором лежат данные user_id (или диалога) key."""
+    if not _write_queues:
+        raise RuntimeError('Database is not initialized. Call init_db() first.')
+    return _write_queues[shard_index(key, len(_write_queues))]
+
+
+async def _submit_to_shards(sql: str, rows: Iterable[Sequence]) -> None:
+    """Раскладывает строки по шардам по первому столбцу (user_id) и ждет записи во всех.
+
+    Каждый шард пишет свою часть одной транзакцией; общей транзакции между шардами нет.
+    """
+    if not _write_queues:
+        raise RuntimeError('Database is not initialized. Call init_db() first.')
+    by_shard: Dict[int, List[Sequence]] = {}
+    for row in rows:
+        by_shard.setdefault(shard_index(row[0], len(_write_queues)), []).append(row)
+    await asyncio.gather(*(_write_queues[index].submit(sql, shard_rows)
+                           for index, shard_rows in by_shard.items()))
+
+
+async def _fetch_all_shards(sql: str, parameters: Sequence) -> List[tuple]:
+    """Выполняет запрос во всех шардах одновременно и объединяет строки (шарды по порядку)."""
+    async def fetch(manager: ConnectionManager) -> List[tuple]:
+        async with manager.reader() as db:
+            cursor = await db.execute(sql, parameters)
+            return await cursor.fetchall()
+
+    results = await asyncio.gather(*(fetch(manager) for manager in _get_managers()))
+    return [row for rows in results for row in rows]
+
+
+async def _open_shard(path: str) -> Tuple[ConnectionManager, WriteQueue]:
+    manager = ConnectionManager(path)
+    await manager.start()
+    await create_tables(manager)
+    if await _stats_need_rebuild(manager):
+        logger.info(f"Sleep statistics table in {path} is empty, rebuilding it from sleep_data.")
+        await _rebuild_shard_stats(manager, DB_WRITE_BATCH_SIZE)
+    write_queue = WriteQueue(manager)
+    write_queue.start()
+    return manager, write_queue
+
+
+async def init_db(_: Optional[Application] = None) -> None:
+    """Открывает соединения со всеми шардами базы данных и создает таблицы."""
+    global _managers, _write_queues
+    if _managers:
+        return
+    paths = [shard_path(index, DB_SHARDS) for index in range(DB_SHARDS)]
+    layouts = _existing_layouts()
+    if layouts and DB_SHARDS not in layouts:
+        logger.warning(f"Found databases for {layouts} shard(s), but DB_SHARDS = {DB_SHARDS}: "
+                       f"existing data will not be visible. Run 'python manage.py rebalance' first.")
+    shards = await asyncio.gather(*(_open_shard(path) for path in paths))
+    _managers = [manager for manager, _ in shards]
+    _write_queues = [write_queue for _, write_queue in shards]
+
+
+async def close_db(_: Optional[Application] = None) -> None:
+    """Дописывает очереди записи и закрывает соединения со всеми шардами."""
+    global _managers, _write_queues
+    if not _managers:
+        return
+    write_queues, _write_queues = _write_queues, []
+    await asyncio.gather(*(write_queue.stop() for write_queue in write_queues))
+    managers, _managers = _managers, []
+    await asyncio.gather(*(manager.close() for manager in managers))
+    history_cache.clear()
+
+
+def _sql_hhmm_to_minutes(column: str) -> str:
+    """SQL-выражение, переводящее текст 'ЧЧ:ММ' из column в минуты от полуночи."""
+    return (f"CAST(substr({column}, 1, instr({column}, ':') - 1) AS INTEGER) * 60"
+            f" + CAST(substr({column}, instr({column}, ':') + 1) AS INTEGER)")
+
+
+async def _migrate_schema(db: aiosqlite.Connection) -> None:
+    """Переводит старую базу на текущую схему прямо в файле базы."""
+    cursor = await db.execute('PRAGMA user_version')
+    version = (await cursor.fetchone())[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    cursor = await db.execute('PRAGMA table_info(sleep_data)')
+    columns = {row[1] for row in await cursor.fetchall()}
+    if 'sleep_time' in columns:
+        # Версия 0 -> 1: время 'ЧЧ:ММ' и дата 'ГГГГ-ММ-ДД' в TEXT становятся целыми числами.
+        # Таблица пересобирается в одной транзакции, индексы создаются заново после нее.
+        logger.info("Migrating sleep_data to integer time encoding.")
+        sleep_min = _sql_hhmm_to_minutes('sleep_time')
+        wake_min = _sql_hhmm_to_minutes('wake_time')
+        await db.execute('BEGIN')
+        await db.execute('''
+        CREATE TABLE sleep_data_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            sleep_min INTEGER NOT NULL,
+            wake_min INTEGER NOT NULL,
+            duration_min INTEGER NOT NULL
+        )
+        ''')
+        await db.execute(f'''
+        INSERT INTO sleep_data_new (id, user_id, day, sleep_min, wake_min, duration_min)
+        SELECT id, user_id,
+               CAST(julianday(date) - julianday('1970-01-01') AS INTEGER),
+               {sleep_min}, {wake_min},
+               (({wake_min}) - ({sleep_min}) + 1440) % 1440
+        FROM sleep_data
+        ''')
+        await db.execute('DROP TABLE sleep_data')
+        await db.execute('ALTER TABLE sleep_data_new RENAME TO sleep_data')
+        # Статистика пересчитается при запуске по новой таблице
+        await db.execute('DELETE FROM user_sleep_stats')
+
+    await db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    await db.commit()
+
+
+async def create_tables(manager: ConnectionManager) -> None:
+    """Асинхронно создает таблицы в базе данных шарда, если они не существуют."""
+    async with manager.writer() as db:
         await db.execute('''
         CREATE TABLE IF NOT EXISTS sleep_data (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            sleep_time TEXT NOT NULL,
-            wake_time TEXT NOT NULL,
-            date TEXT NOT NULL
+            day INTEGER NOT NULL,
+            sleep_min INTEGER NOT NULL,
+            wake_min INTEGER NOT NULL,
+            duration_min INTEGER NOT NULL
         )
         ''')
 
@@ -26,9 +765,65 @@ async def create_tables(_: Application) -> None:
         )
         ''')
 
+        await db.execute('''
+        CREATE TABLE IF NOT EXISTS user_sleep_stats (
+            user_id INTEGER PRIMARY KEY,
+            entry_count INTEGER NOT NULL,
+            duration_sum_7 INTEGER NOT NULL,
+            duration_sum_30 INTEGER NOT NULL,
+            last_duration INTEGER NOT NULL,
+            schedule_streak INTEGER NOT NULL,
+            bed_min INTEGER NOT NULL,
+            bed_max INTEGER NOT NULL,
+            wake_min INTEGER NOT NULL,
+            wake_max INTEGER NOT NULL,
+            wake_delta_sum_7 INTEGER NOT NULL,
+            late_bed_count_7 INTEGER NOT NULL,
+            data_version INTEGER NOT NULL
+        )
+        ''')
+
+        await db.execute('''
+        CREATE TABLE IF NOT EXISTS advice_cache (
+            user_id INTEGER PRIMARY KEY,
+            data_version INTEGER NOT NULL,
+            tip TEXT NOT NULL
+        )
+        ''')
+
+        await db.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            user_id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            wake_min INTEGER NOT NULL,
+            bed_min INTEGER NOT NULL,
+            log_min INTEGER NOT NULL
+        )
+        ''')
+
+        # Состояние пользователей и диалогов для persistence.py (JSON)
+        await db.execute('''
+        CREATE TABLE IF NOT EXISTS user_state (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        )
+        ''')
+
+        await db.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (name, key)
+        )
+        ''')
+
+        await _migrate_schema(db)
+
         await db.execute('''
         CREATE UNIQUE INDEX IF NOT EXISTS idx_sleep_unique_user_date
-        ON sleep_data(user_id, date)
+        ON sleep_data(user_id, day)
         ''')
 
         await db.execute('''
@@ -40,53 +835,360 @@ async def create_tables(_: Application) -> None:
         CREATE UNIQUE INDEX IF NOT EXISTS idx_achievements_unique
         ON achievements(user_id, achievement)
         ''')
-        await db.commit()
 
+        # Напоминания выбираются по минуте суток
+        await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_bed
+        ON reminders(bed_min)
+        ''')
 
-async def insert_sleep_data(user_id: int, sleep_time: str, wake_time: str, date: str) -> None:
-    """Асинхронно вставляет или обновляет данные о сне."""
-    async with aiosqlite.connect(DB_FILE) as db:
         await db.execute('''
-        INSERT INTO sleep_data (user_id, sleep_time, wake_time, date)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(user_id, date) DO UPDATE SET
-            sleep_time=excluded.sleep_time,
-            wake_time=excluded.wake_time
-        ''', (user_id, sleep_time, wake_time, date))
+        CREATE INDEX IF NOT EXISTS idx_reminders_log
+        ON reminders(log_min)
+        ''')
         await db.commit()
 
 
-async def get_sleep_data(user_id: int) -> List[Tuple[str, str, str]]:
-    """Асинхронно получает данные о сне пользователя."""
-    async with aiosqlite.connect(DB_FILE) as db:
+async def _stats_need_rebuild(manager: ConnectionManager) -> bool:
+    """Проверяет, есть ли данные о сне без рассчитанной статистики (база до появления таблицы)."""
+    async with manager.reader() as db:
         cursor = await db.execute('''
-        SELECT sleep_time, wake_time, date
-        FROM sleep_data
-        WHERE user_id = ?
-        ORDER BY date ASC
-        ''', (user_id,))
+        SELECT EXISTS(SELECT 1 FROM sleep_data)
+           AND NOT EXISTS(SELECT 1 FROM user_sleep_stats)
+        ''')
+        return bool((await cursor.fetchone())[0])
+
+
+async def _rebuild_shard_stats(manager: ConnectionManager, batch_size: int) -> int:
+    async with manager.reader() as db:
+        cursor = await db.execute('SELECT DISTINCT user_id FROM sleep_data')
+        user_ids = [row[0] for row in await cursor.fetchall()]
+
+    for start in range(0, len(user_ids), batch_size):
+        async with manager.writer() as db:
+            await _refresh_user_stats(db, dict.fromkeys(user_ids[start:start + batch_size]))
+            await db.commit()
+    logger.info(f"Rebuilt sleep statistics for {len(user_ids)} users in {manager.path}.")
+    return len(user_ids)
+
+
+@instrument_db
+async def rebuild_user_stats(batch_size: int = DB_WRITE_BATCH_SIZE) -> int:
+    """Пересчитывает таблицу user_sleep_stats по sleep_data во всех шардах. Возвращает число пользователей."""
+    counts = await asyncio.gather(*(_rebuild_shard_stats(manager, batch_size) for manager in _get_managers()))
+    return sum(counts)
+
+
+@instrument_db
+async def get_user_stats(user_id: int) -> Optional[UserSleepStats]:
+    """Возвращает статистику сна пользователя или None, если записей еще нет."""
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_STATS_SQL, (user_id,))
+        row = await cursor.fetchone()
+        return UserSleepStats(*row) if row is not None else None
+
+
+async def stream_sleep_windows(window: int, batch_users: int) -> AsyncIterator[List[Tuple[int, int, int, int, int]]]:
+    """Отдает последние window записей всех пользователей, у которых их не меньше window.
+
+    Шарды обходятся по очереди. Строки (user_id, data_version, sleep_min,
+    wake_min, duration_min) внутри шарда идут по возрастанию user_id и дня;
+    каждая пачка содержит ровно window строк на пользователя для не более
+    чем batch_users пользователей одного шарда.
+    """
+    for manager in _get_managers():
+        async with manager.reader() as db:
+            cursor = await db.execute(_SELECT_SLEEP_WINDOWS_SQL, {'window': window})
+            while True:
+                rows = await cursor.fetchmany(window * batch_users)
+                if not rows:
+                    break
+                yield rows
+            await cursor.close()
+
+
+async def stream_short_history_users(min_entries: int, batch_users: int) -> AsyncIterator[List[Tuple[int, int]]]:
+    """Отдает (user_id, data_version) пользователей, у которых меньше min_entries записей, по шардам."""
+    for manager in _get_managers():
+        async with manager.reader() as db:
+            cursor = await db.execute(_SELECT_SHORT_HISTORY_USERS_SQL, (min_entries,))
+            while True:
+                rows = await cursor.fetchmany(batch_users)
+                if not rows:
+                    break
+                yield rows
+            await cursor.close()
+
+
+@instrument_db
+async def save_advice(rows: Sequence[Tuple[int, int, str]]) -> None:
+    """Сохраняет рассчитанные советы (user_id, data_version, tip)."""
+    if not rows:
+        return
+    await _submit_to_shards(_UPSERT_ADVICE_SQL, rows)
+
+
+@instrument_db
+async def get_cached_advice(user_id: int) -> Optional[str]:
+    """Возвращает актуальный совет из advice_cache.
+
+    None — совета нет или данные изменились после расчета; пустая строка —
+    данных для персонального совета недостаточно.
+    """
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_ADVICE_SQL, (user_id,))
+        row = await cursor.fetchone()
+        return row[0] if row is not None else None
+
+
+@instrument_db
+async def insert_sleep_data(user_id: int, sleep_min: int, wake_min: int, day: int) -> None:
+    """Асинхронно вставляет или обновляет данные о сне (время в минутах от полуночи)."""
+    duration_min = sleep_duration_minutes(sleep_min, wake_min)
+    await _get_write_queue(user_id).submit(
+        _UPSERT_SLEEP_SQL, [(user_id, day, sleep_min, wake_min, duration_min)])
+    history_cache.upsert(user_id, (sleep_min, wake_min, duration_min, day))
+
+
+
+async def import_sleep_rows(rows: Sequence[Tuple[int, int, int, int]]) -> None:
+    """Записывает пачку (user_id, day, sleep_min, wake_min), заменяя записи за те же дни.
+
+    Строки каждого шарда пишутся одной транзакцией.
+    """
+    if not rows:
+        return
+    try:
+        await _submit_to_shards(_UPSERT_SLEEP_SQL, [
+            (user_id, day, sleep_min, wake_min, sleep_duration_minutes(sleep_min, wake_min))
+            for user_id, day, sleep_min, wake_min in rows
+        ])
+    finally:
+        # Импорт может дописать старые ночи в середину истории — проще загрузить ее заново
+        for user_id in {row[0] for row in rows}:
+            history_cache.invalidate_user(user_id)
+
+
+async def stream_sleep_data(user_id: Optional[int], batch_size: int) -> AsyncIterator[List[Tuple[int, int, int, int, int]]]:
+    """Отдает историю сна пачками строк (user_id, sleep_min, wake_min, duration_min, day) по возрастанию дня.
+
+    user_id=None — все пользователи: шарды по очереди, внутри шарда по возрастанию user_id.
+    """
+    managers = _get_managers() if user_id is None else [_get_manager(user_id)]
+    for manager in managers:
+        async with manager.reader() as db:
+            if user_id is None:
+                cursor = await db.execute(_SELECT_ALL_SLEEP_SQL)
+            else:
+                cursor = await db.execute(_SELECT_SLEEP_SQL, (user_id,))
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [row if user_id is None else (user_id, *row) for row in rows]
+            await cursor.close()
+
+async def _get_history(user_id: int) -> UserHistory:
+    """Последние HISTORY_CACHE_NIGHTS ночей пользователя: из кэша истории или одним запросом с записью в кэш."""
+    history = history_cache.get(user_id)
+    if history is not None:
+        return history
+    history_cache.begin_load(user_id)
+    rows = None
+    try:
+        async with _get_manager(user_id).reader() as db:
+            cursor = await db.execute(_SELECT_RECENT_SLEEP_SQL, (user_id, history_cache.nights))
+            rows = await cursor.fetchall()
+    finally:
+        history = history_cache.end_load(user_id, rows)
+    return history
+
+
+@instrument_db
+async def get_sleep_data(user_id: int) -> List[SleepRow]:
+    """Асинхронно получает данные о сне пользователя."""
+    history = history_cache.peek(user_id)
+    if history is not None and history.complete:
+        return history.all()
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_SLEEP_SQL, (user_id,))
         rows = await cursor.fetchall()
         return rows
 
 
+@instrument_db
+async def sleep_data_exists_for_date(user_id: int, day: int) -> bool:
+    """Проверяет, есть ли у пользователя запись о сне за указанный день."""
+    cached = (await _get_history(user_id)).exists(day)
+    if cached is not None:
+        return cached
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_EXISTS_SLEEP_SQL, (user_id, day))
+        row = await cursor.fetchone()
+        return row is not None
+
+
+@instrument_db
+async def get_recent_sleep_data(user_id: int, n: int) -> List[SleepRow]:
+    """Возвращает последние n записей о сне в хронологическом порядке."""
+    if n <= history_cache.nights:
+        cached = (await _get_history(user_id)).recent(n)
+        if cached is not None:
+            return cached
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_RECENT_SLEEP_SQL, (user_id, n))
+        rows = await cursor.fetchall()
+        return rows
+
+
+@instrument_db
+async def get_sleep_data_range(user_id: int, start_day: int, end_day: int) -> List[SleepRow]:
+    """Возвращает записи о сне за дни от start_day до end_day включительно."""
+    cached = (await _get_history(user_id)).range(start_day, end_day)
+    if cached is not None:
+        return cached
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_SLEEP_RANGE_SQL, (user_id, start_day, end_day))
+        rows = await cursor.fetchall()
+        return rows
+
+
+@instrument_db
+async def count_sleep_data(user_id: int) -> int:
+    """Возвращает количество записей о сне пользователя."""
+    history = history_cache.peek(user_id)
+    if history is not None and history.complete:
+        return history.count()
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_COUNT_SLEEP_SQL, (user_id,))
+        row = await cursor.fetchone()
+        return row[0]
+
+
+@instrument_db
+async def get_sleep_summary(user_id: int, start_day: int) -> Optional[SleepSummary]:
+    """Сводка по ночам начиная с start_day, посчитанная одним запросом; None — ночей нет."""
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_SLEEP_SUMMARY_SQL, (user_id, start_day))
+        row = await cursor.fetchone()
+        return SleepSummary(*row) if row[0] else None
+
+
+@instrument_db
+async def get_sleep_trend(user_id: int, start_day: int, bucket: str) -> List[Tuple[int, int, float]]:
+    """Средняя продолжительность сна по неделям, месяцам или кварталам начиная с start_day.
+
+    Возвращает (номер периода из TREND_BUCKETS, ночей, средняя длительность в минутах)
+    только для периодов, в которых есть записи.
+    """
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_SLEEP_TREND_SQL[bucket], (user_id, start_day))
+        return await cursor.fetchall()
+
+
 async def insert_achievement(user_id: int, achievement: str) -> None:
-    """Асинхронно вставляет новое достижение."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute('''
-        INSERT OR IGNORE INTO achievements (user_id, achievement)
-        VALUES (?, ?)
-        ''', (user_id, achievement))
-        await db.commit()
+    """Асинхронно вставляет новое достижение (метрики пишет insert_achievements)."""
+    await insert_achievements(user_id, [achievement])
+
+
+@instrument_db
+async def insert_achievements(user_id: int, achievements: List[str]) -> None:
+    """Асинхронно вставляет несколько достижений одной транзакцией."""
+    if not achievements:
+        return
+    await _get_write_queue(user_id).submit(
+        _INSERT_ACHIEVEMENT_SQL, [(user_id, achievement) for achievement in achievements])
 
 
+@instrument_db
 async def get_achievements(user_id: int) -> List[str]:
     """Асинхронно получает достижения пользователя."""
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute('''
-        SELECT achievement FROM achievements
-        WHERE user_id = ?
-        ORDER BY id DESC
-        LIMIT 1
-        ''', (user_id,))
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_ACHIEVEMENTS_SQL, (user_id,))
         rows = await cursor.fetchall()
         return [row[0] for row in rows]
+
+
+@instrument_db
+async def get_reminder(user_id: int) -> Optional[Tuple[int, int]]:
+    """Возвращает минуты напоминаний (bed_min, log_min) пользователя или None."""
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_REMINDER_SQL, (user_id,))
+        return await cursor.fetchone()
+
+
+@instrument_db
+async def upsert_reminder(user_id: int, chat_id: int, wake_min: int, bed_min: int, log_min: int) -> None:
+    """Включает или меняет напоминания пользователя."""
+    await _get_write_queue(user_id).submit(_UPSERT_REMINDER_SQL, [(user_id, chat_id, wake_min, bed_min, log_min)])
+
+
+@instrument_db
+async def delete_reminder(user_id: int) -> None:
+    """Отключает напоминания пользователя."""
+    await _get_write_queue(user_id).submit(_DELETE_REMINDER_SQL, [(user_id,)])
+
+
+@instrument_db
+async def get_bedtime_reminders(minute: int) -> List[Tuple[int, int, int, int]]:
+    """Возвращает (user_id, chat_id, wake_min, bed_min) напоминаний о сне на минуту суток."""
+    return await _fetch_all_shards(_SELECT_BEDTIME_REMINDERS_SQL, (minute,))
+
+
+@instrument_db
+async def get_log_reminders(minute: int, day: int) -> List[Tuple[int, int]]:
+    """Возвращает (user_id, chat_id) тех, кому в эту минуту пора напомнить записать сон за day."""
+    return await _fetch_all_shards(_SELECT_LOG_REMINDERS_SQL, (minute, day))
+
+
+async def count_reminder_buckets() -> Tuple[Dict[int, int], Dict[int, int]]:
+    """Количество напоминаний в каждой минуте суток: (о сне, о записи сна)."""
+    bedtime: Dict[int, int] = {}
+    for minute, count in await _fetch_all_shards(_COUNT_BEDTIME_BUCKETS_SQL, ()):
+        bedtime[minute] = bedtime.get(minute, 0) + count
+    log: Dict[int, int] = {}
+    for minute, count in await _fetch_all_shards(_COUNT_LOG_BUCKETS_SQL, ()):
+        log[minute] = log.get(minute, 0) + count
+    return bedtime, log
+
+
+@instrument_db
+async def get_user_state(user_id: int) -> Optional[str]:
+    """Возвращает сохраненный JSON user_data пользователя или None."""
+    async with _get_manager(user_id).reader() as db:
+        cursor = await db.execute(_SELECT_USER_STATE_SQL, (user_id,))
+        row = await cursor.fetchone()
+        return row[0] if row is not None else None
+
+
+@instrument_db
+async def save_user_states(rows: Sequence[Tuple[int, str]]) -> None:
+    """Сохраняет user_data (user_id, JSON) одной транзакцией очереди записи."""
+    if not rows:
+        return
+    await _submit_to_shards(_UPSERT_USER_STATE_SQL, rows)
+
+
+@instrument_db
+async def delete_user_state(user_id: int) -> None:
+    """Удаляет сохраненный user_data пользователя."""
+    await _get_write_queue(user_id).submit(_DELETE_USER_STATE_SQL, [(user_id,)])
+
+
+async def get_conversation_states(name: str, since: int) -> List[Tuple[str, str]]:
+    """Возвращает (key, state) диалога name, менявшиеся не раньше since (unix time); более старые удаляет."""
+    await asyncio.gather(*(write_queue.submit(_DELETE_STALE_CONVERSATIONS_SQL, [(name, since)])
+                           for write_queue in _write_queues))
+    return await _fetch_all_shards(_SELECT_CONVERSATIONS_SQL, (name, since))
+
+
+@instrument_db
+async def save_conversation_state(name: str, key: str, state: Optional[str], updated_at: int) -> None:
+    """Сохраняет состояние диалога; state=None — диалог завершен, строка удаляется.
+
+    Диалоги раскладываются по шардам по ключу key.
+    """
+    if state is None:
+        await _get_write_queue(key).submit(_DELETE_CONVERSATION_SQL, [(name, key)])
+    else:
+        await _get_write_queue(key).submit(_UPSERT_CONVERSATION_SQL, [(name, key, state, updated_at)])
@@ -1,30 +1,16 @@
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, InlineQueryResultArticle, InputTextMessageContent
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 import logging
-import aiofiles
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
 from analysis import analyze_sleep_data
-from db import get_achievements
-from utils import load_tips, load_exercises, choose_random_non_repeating
-from keyboards import get_main_keyboard, get_wake_time_keyboard, get_reports_keyboard
+from db import get_achievements, get_cached_advice
+from content import content_store
+from keyboards import get_main_keyboard, get_wake_time_keyboard, get_reports_keyboard, get_reminder_keyboard
 import reports
 import log_sleep
 from config import SLEEP_SCHEDULE
 import textwrap
 
 logger = logging.getLogger(__name__)
-sleep_tips = []
-sleep_exercises = []
-
-# Словари для хранения последних отправленных элементов
-last_exercise = {}
-last_tip = {}
-
-
-async def load_data(_):
-    """Асинхронно загружает советы и упражнения."""
-    global sleep_tips, sleep_exercises
-    sleep_tips = await load_tips()
-    sleep_exercises = await load_exercises()
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -54,7 +40,7 @@ async def show_times(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     sleep_times = SLEEP_SCHEDULE.get(wake_time, [])
 
     response_text = f'Чтобы проснуться в {wake_time}, рекомендуется лечь спать в {" или ".join(sleep_times)}. В этом случае цикл сна завершится удачно, и пробуждение будет легким.'
-    await query.edit_message_text(text=response_text)
+    await query.edit_message_text(text=response_text, reply_markup=get_reminder_keyboard(wake_time, sleep_times))
 
 
 async def send_tips(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -62,8 +48,10 @@ async def send_tips(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.message.from_user.id
     logger.info(f"User {user_id} requested a sleep tip.")
 
-    # Попытка получить персональный совет
-    personalized_tip = await analyze_sleep_data(user_id)
+    # Совет из пакетного расчета; если данные изменились после него, считаем на лету
+    personalized_tip = await get_cached_advice(user_id)
+    if personalized_tip is None:
+        personalized_tip = await analyze_sleep_data(user_id)
 
     if personalized_tip:
         tip = personalized_tip
@@ -72,7 +60,7 @@ async def send_tips(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         # Если персональный совет недоступен, отправить случайный
         logger.info(
             f"Not enough data for personalized tip for user {user_id}. Sending random tip.")
-        tip = choose_random_non_repeating(last_tip, user_id, sleep_tips)
+        tip, context.user_data['tip_deck'] = content_store.draw('tips', context.user_data.get('tip_deck'))
         if tip is None:
             logger.warning("No random sleep tips available.")
             await update.message.reply_text('Нет доступных советов сейчас. Добавьте записи в sleep_tips.txt.')
@@ -86,8 +74,8 @@ async def send_exercises(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Отправляет случайное упражнение для расслабления."""
     user_id = update.message.from_user.id
     logger.info(f"User {user_id} requested a sleep exercise.")
-    exercise = choose_random_non_repeating(
-        last_exercise, user_id, sleep_exercises)
+    exercise, context.user_data['exercise_deck'] = content_store.draw(
+        'exercises', context.user_data.get('exercise_deck'))
     if exercise is None:
         logger.warning("No sleep exercises available.")
         await update.message.reply_text('Нет доступных упражнений сейчас. Добавьте записи в sleep_exercises.txt.')
@@ -102,13 +90,12 @@ async def send_help_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Отправляет справочное сообщение."""
     user_id = update.message.from_user.id
     logger.info(f"User {user_id} requested help.")
-    try:
-        async with aiofiles.open('help.txt', 'r', encoding='utf-8') as f:
-            help_text = await f.read()
-        await update.message.reply_text(help_text)
-    except FileNotFoundError:
+    help_text = content_store.text('help')
+    if not help_text:
         logger.error("Help file not found.")
         await update.message.reply_text('Справочная информация не найдена.')
+        return
+    await update.message.reply_text(help_text)
 
 
 async def show_reports_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -132,7 +119,8 @@ async def show_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE)
     for achievement in user_achievements:
         share_button = InlineKeyboardButton(
             f"Поделиться: {achievement}",
-            switch_inline_query=f"Я получил новое достижение '{achievement}' в боте для отслеживания сна!"
+            # Inline-режим находит готовую карточку достижения по названию
+            switch_inline_query=achievement
         )
         keyboard.append([share_button])
 
@@ -153,20 +141,7 @@ def get_log_sleep_conv_handler():
             log_sleep.LOGGING_WAKE: [MessageHandler(filters.TEXT & ~filters.COMMAND, log_sleep.save_sleep_data)],
         },
         fallbacks=[CommandHandler('log_sleep', log_sleep.log_sleep)],
+        # Незавершенная запись сна переживает перезапуск бота
+        name='log_sleep',
+        persistent=True,
     )
-
-
-async def share_achievement(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Обрабатывает inline-запросы для репоста достижений."""
-    query = update.inline_query.query
-    if not query:
-        return
-
-    results = [
-        InlineQueryResultArticle(
-            id=query.upper(),
-            title="Поделиться достижением",
-            input_message_content=InputTextMessageContent(f"🎉 {query}")
-        )
-    ]
-    await update.inline_query.answer(results)
@@ -0,0 +1,200 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from config import HISTORY_CACHE_NIGHTS, HISTORY_CACHE_MAX_BYTES
+from metrics import Gauge, CallbackCounter
+
+# (sleep_min, wake_min, duration_min, day) — как строки выборок db.py
+SleepRow = Tuple[int, int, int, int]
+
+# Примерный размер объекта истории и записи в OrderedDict без самих массивов, байты
+_ENTRY_OVERHEAD = 160
+
+
+class UserHistory:
+    """Последние ночи пользователя по столбцам в хронологическом порядке.
+
+    Минуты суток помещаются в 'H' (2 байта), номер дня — в 'i' (4 байта).
+    complete — в кэше вся история пользователя, а не только последние ночи.
+    """
+    __slots__ = ('beds', 'wakes', 'durations', 'days', 'complete')
+
+    def __init__(self, rows: Sequence[SleepRow], complete: bool) -> None:
+        self.beds = array('H', [row[0] for row in rows])
+        self.wakes = array('H', [row[1] for row in rows])
+        self.durations = array('H', [row[2] for row in rows])
+        self.days = array('i', [row[3] for row in rows])
+        self.complete = complete
+
+    @property
+    def size(self) -> int:
+        return (_ENTRY_OVERHEAD + sys.getsizeof(self.beds) + sys.getsizeof(self.wakes)
+                + sys.getsizeof(self.durations) + sys.getsizeof(self.days))
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List[SleepRow]:
+        return list(zip(self.beds[start:stop], self.wakes[start:stop],
+                        self.durations[start:stop], self.days[start:stop]))
+
+    def covers(self, day: int) -> bool:
+        """Можно ли по кэшу судить о дне day: он не старше первой хранимой ночи."""
+        return self.complete or (len(self.days) > 0 and day >= self.days[0])
+
+    # Методы ниже возвращают None, если ответ нужно брать из базы: окно кэша его не покрывает
+
+    def recent(self, n: int) -> Optional[List[SleepRow]]:
+        """Последние n ночей."""
+        if n > len(self.days) and not self.complete:
+            return None
+        return self.rows(max(0, len(self.days) - n))
+
+    def all(self) -> Optional[List[SleepRow]]:
+        return self.rows() if self.complete else None
+
+    def count(self) -> Optional[int]:
+        return len(self.days) if self.complete else None
+
+    def range(self, start_day: int, end_day: int) -> Optional[List[SleepRow]]:
+        """Ночи с start_day по end_day включительно."""
+        if not self.covers(start_day):
+            return None
+        return self.rows(bisect_left(self.days, start_day), bisect_right(self.days, end_day))
+
+    def exists(self, day: int) -> Optional[bool]:
+        if not self.covers(day):
+            return None
+        index = bisect_left(self.days, day)
+        return index < len(self.days) and self.days[index] == day
+
+    def upsert(self, row: SleepRow, nights: int) -> None:
+        bed, wake, duration, day = row
+        index = bisect_left(self.days, day)
+        if index < len(self.days) and self.days[index] == day:
+            self.beds[index], self.wakes[index], self.durations[index] = bed, wake, duration
+            return
+        if index == 0 and not self.complete:
+            # Ночь старше хранимого окна: последние ночи не меняются
+            return
+        self.beds.insert(index, bed)
+        self.wakes.insert(index, wake)
+        self.durations.insert(index, duration)
+        self.days.insert(index, day)
+        if len(self.days) > nights:
+            del self.beds[0], self.wakes[0], self.durations[0], self.days[0]
+            self.complete = False
+
+
+class HistoryCache:
+    """LRU последних ночей активных пользователей с ограничением по памяти.
+
+    Заполняется при чтении (db.py загружает последние nights ночей одним
+    запросом) и обновляется при записи через upsert после коммита, поэтому
+    повторные чтения активного пользователя не обращаются к базе. Записи в
+    базу в обход процесса бота (manage.py import) кэш не видит, пока
+    пользователь не будет вытеснен.
+    """
+
+    def __init__(self, nights: int = HISTORY_CACHE_NIGHTS, max_bytes: int = HISTORY_CACHE_MAX_BYTES) -> None:
+        self.nights = nights
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[int, UserHistory]' = OrderedDict()
+        self._bytes = 0
+        # Загрузки из базы, которые сейчас идут, и пользователи, записавшие сон во время загрузки:
+        # такая загрузка могла прочитать данные до записи, и ее результат не сохраняется
+        self._loading: Dict[int, int] = {}
+        self._stale: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int) -> Optional[UserHistory]:
+        """История пользователя из кэша или None, если ее нужно загрузить из базы."""
+        history = self._entries.get(user_id)
+        if history is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return history
+
+    def peek(self, user_id: int) -> Optional[UserHistory]:
+        """История пользователя из кэша без учета в hits/misses: для чтений, которые кэш не заполняют."""
+        return self._entries.get(user_id)
+
+    def begin_load(self, user_id: int) -> None:
+        self._loading[user_id] = self._loading.get(user_id, 0) + 1
+
+    def end_load(self, user_id: int, rows: Optional[Sequence[SleepRow]]) -> Optional[UserHistory]:
+        """Сохраняет загруженные последние nights ночей; rows=None — загрузка не удалась.
+
+        Возвращает историю по загруженным строкам, даже если она не попала в кэш.
+        """
+        pending = self._loading.pop(user_id) - 1
+        stale = user_id in self._stale
+        if pending:
+            self._loading[user_id] = pending
+        else:
+            self._stale.discard(user_id)
+        if rows is None:
+            return None
+        history = UserHistory(rows, complete=len(rows) < self.nights)
+        if not stale:
+            self._remove(user_id)
+            self._entries[user_id] = history
+            self._bytes += history.size
+            self._evict()
+        return history
+
+    def upsert(self, user_id: int, row: SleepRow) -> None:
+        """Применяет записанную ночь к кэшу пользователя, если он в кэше."""
+        if user_id in self._loading:
+            self._stale.add(user_id)
+        history = self._entries.get(user_id)
+        if history is None:
+            return
+        self._entries.move_to_end(user_id)
+        self._bytes -= history.size
+        history.upsert(row, self.nights)
+        self._bytes += history.size
+        self._evict()
+
+    def invalidate_user(self, user_id: int) -> None:
+        if user_id in self._loading:
+            self._stale.add(user_id)
+        self._remove(user_id)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self._stale.update(self._loading)
+
+    def _remove(self, user_id: int) -> None:
+        history = self._entries.pop(user_id, None)
+        if history is not None:
+            self._bytes -= history.size
+
+    def _evict(self) -> None:
+        while self._entries and self._bytes > self.max_bytes:
+            _, history = self._entries.popitem(last=False)
+            self._bytes -= history.size
+
+
+history_cache = HistoryCache()
+
+CallbackCounter('sleepbot_history_cache_hits_total', 'Чтения истории сна из кэша', callback=lambda: history_cache.hits)
+CallbackCounter('sleepbot_history_cache_misses_total', 'Чтения истории сна мимо кэша', callback=lambda: history_cache.misses)
+Gauge('sleepbot_history_cache_users', 'Пользователи в кэше истории сна', callback=lambda: len(history_cache))
+Gauge('sleepbot_history_cache_bytes', 'Объем кэша истории сна, байты', callback=lambda: history_cache.size_bytes)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ограничение на тело запроса: обновления Telegram и служебные запросы заметно меньше
+MAX_BODY_SIZE = 1024 * 1024
+# Сколько ждать очередную строку или тело запроса от клиента, секунды
+READ_TIMEOUT = 10.0
+# Сколько stop() дает начатым запросам на завершение, прежде чем закрыть соединения, секунды
+STOP_TIMEOUT = 5.0
+
+_REASONS = {
+    200: 'OK', 204: 'No Content', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 408: 'Request Timeout', 413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: str
+    headers: Dict[str, str]
+    body: bytes = b''
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b''
+    content_type: str = 'text/plain; charset=utf-8'
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    """Минимальный асинхронный HTTP/1.1 сервер для служебных эндпоинтов бота.
+
+    Поддерживает только то, что нужно метрикам, проверке здоровья и вебхуку:
+    маршрутизацию по методу и пути и тело с Content-Length.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Задачи обработки соединений и их писатели: stop() закрывает зависшие соединения
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server listening on {self.host}:{self.port}.")
+
+    async def stop(self) -> None:
+        """Перестает принимать соединения и дожидается уже начатых запросов.
+
+        Запросы, не завершившиеся за STOP_TIMEOUT, прерываются, а их соединения закрываются.
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        if self._connections:
+            _, pending = await asyncio.wait(list(self._connections), timeout=STOP_TIMEOUT)
+            if pending:
+                logger.warning(f"Closing {len(pending)} HTTP connections that did not finish in time.")
+                for task in pending:
+                    self._connections[task].close()
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            try:
+                response = await self._read_and_dispatch(reader)
+            except asyncio.TimeoutError:
+                response = Response(408, b'Request timeout')
+            except ValueError:
+                # StreamReader.readline сообщает о строке длиннее лимита буфера через ValueError
+                response = Response(431, b'Request header too large')
+            await self._write_response(writer, response)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    async def _readline(reader: asyncio.StreamReader) -> str:
+        return (await asyncio.wait_for(reader.readline(), READ_TIMEOUT)).decode('latin-1')
+
+    async def _read_and_dispatch(self, reader: asyncio.StreamReader) -> Response:
+        request_line = (await self._readline(reader)).strip()
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            return Response(400, b'Malformed request line')
+
+        headers = {}
+        while True:
+            line = await self._readline(reader)
+            if line in ('\r\n', '\n', ''):
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            return Response(400, b'Invalid Content-Length')
+        if length < 0:
+            return Response(400, b'Invalid Content-Length')
+        if length > MAX_BODY_SIZE:
+            return Response(413, b'Payload too large')
+        body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b''
+
+        path, _, query = target.partition('?')
+        handler = self._routes.get((method.upper(), path))
+        if handler is None:
+            allowed = any(route_path == path for _, route_path in self._routes)
+            return Response(405 if allowed else 404, b'')
+        try:
+            return await handler(Request(method.upper(), path, query, headers, body))
+        except Exception as e:
+            logger.error(f"HTTP handler for {method} {path} failed: {e}", exc_info=True)
+            return Response(500, b'Internal error')
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, response: Response) -> None:
+        reason = _REASONS.get(response.status, '')
+        head = [f'HTTP/1.1 {response.status} {reason}',
+                f'Content-Type: {response.content_type}',
+                f'Content-Length: {len(response.body)}',
+                'Connection: close']
+        head.extend(f'{name}: {value}' for name, value in response.headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + response.body)
+        await writer.drain()
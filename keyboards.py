@@ -19,10 +19,19 @@ def get_wake_time_keyboard(sleep_schedule):
     return InlineKeyboardMarkup(inline_keyboard)
 
 
+def get_reminder_keyboard(wake_time, sleep_times):
+    """Возвращает inline-клавиатуру для включения напоминаний о рекомендуемом времени сна."""
+    inline_keyboard = [[InlineKeyboardButton(
+        f"Напоминать лечь в {sleep_time}", callback_data=f"remind:{wake_time}|{sleep_time}")] for sleep_time in sleep_times]
+    return InlineKeyboardMarkup(inline_keyboard)
+
+
 def get_reports_keyboard():
     """Возвращает клавиатуру для выбора отчета."""
     reply_keyboard = [
         [KeyboardButton("За неделю"), KeyboardButton("За месяц")],
+        [KeyboardButton("За квартал"), KeyboardButton("За год")],
+        [KeyboardButton("За все время")],
         [KeyboardButton("Назад")]
     ]
     return ReplyKeyboardMarkup(reply_keyboard, resize_keyboard=True)
@@ -1,8 +1,9 @@
-from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
-from db import insert_sleep_data, get_sleep_data
-from utils import is_valid_time
+from db import insert_sleep_data, sleep_data_exists_for_date
+from utils import is_valid_time, time_to_minutes, today_day, sleep_duration_minutes
+from report_cache import report_cache
+from sender import get_sender
 import achievements
 
 # Состояния для ConversationHandler
@@ -10,9 +11,7 @@ LOGGING_SLEEP, LOGGING_WAKE = range(2)
 
 
 async def has_sleep_data_for_today(user_id):
-    today = datetime.now().date().isoformat()
-    sleep_data = await get_sleep_data(user_id)
-    return any(entry[2] == today for entry in sleep_data)
+    return await sleep_data_exists_for_date(user_id, today_day())
 
 
 async def log_sleep(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -55,11 +54,16 @@ async def save_sleep_data(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text('Ошибка: не найдено время, когда вы легли спать.')
         return ConversationHandler.END
 
-    await insert_sleep_data(user_id, sleep_time, wake_time, datetime.now().date().isoformat())
+    sleep_min, wake_min, day = time_to_minutes(sleep_time), time_to_minutes(wake_time), today_day()
+    await insert_sleep_data(user_id, sleep_min, wake_min, day)
+    report_cache.invalidate_user(user_id)
 
-    new_achievements = await achievements.check_achievements(user_id)
+    new_entry = (sleep_min, wake_min, sleep_duration_minutes(sleep_min, wake_min), day)
+    new_achievements = await achievements.check_achievements(user_id, new_entry)
+    # Оба текста ставятся в очередь до первого await и уходят одним сообщением
+    sender = get_sender()
+    chat_id = update.effective_chat.id
     if new_achievements:
-        await update.message.reply_text(f'Поздравляем! Вы получили новое достижение: {", ".join(new_achievements)}')
-
-    await update.message.reply_text(f'Данные о сне сохранены:\nЛегли спать в {sleep_time}, проснулись в {wake_time}.')
+        sender.send_text(chat_id, f'Поздравляем! Вы получили новое достижение: {", ".join(new_achievements)}')
+    await sender.send_text(chat_id, f'Данные о сне сохранены:\nЛегли спать в {sleep_time}, проснулись в {wake_time}.')
     return ConversationHandler.END
@@ -1,12 +1,159 @@
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, InlineQueryHandler
+from startup import startup_timer
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, InlineQueryHandler, ContextTypes
 from telegram.error import InvalidToken
 
+startup_timer.lap('import telegram')
+
+import asyncio
+import importlib
 import logging
-from utils import get_token_from_dotenv_file
-from handlers import load_data
+from typing import Optional
+from utils import get_token_from_dotenv_file, get_api_url_from_dotenv_file
+from content import load_content
 import handlers
 import reports
-from db import create_tables
+import reminders
+import transfer
+import share
+from db import init_db, close_db
+from charts import start_chart_service, stop_chart_service, get_chart_service
+import metrics
+from update_processor import get_update_processor
+from persistence import get_persistence
+from sender import TelegramRateLimiter, start_sender, stop_sender
+from batch_analysis import refresh_advice_job
+from config import ADVICE_BATCH_INTERVAL, ADVICE_BATCH_FIRST, STARTUP_BUDGET, STARTUP_PREWARM, STARTUP_PREWARM_DELAY
+from webhook import get_webhook_settings_from_dotenv_file, run_webhook
+
+startup_timer.lap('import bot modules')
+
+logger = logging.getLogger(__name__)
+
+# Шаги post_init по порядку; время каждого попадает в отчет о запуске
+_POST_INIT_STEPS = (init_db, start_chart_service, load_content, start_sender,
+                    reminders.start_reminders, metrics.start_metrics)
+
+
+async def post_init(application: Application) -> None:
+    """Открывает соединения с базой данных, запускает рендеринг графиков, загружает тексты и восстанавливает напоминания."""
+    # Application.initialize(): getMe и загрузка диалогов из persistence
+    startup_timer.lap('application.initialize')
+    for step in _POST_INIT_STEPS:
+        await step(application)
+        startup_timer.lap(f'{step.__module__}.{step.__name__}')
+    startup_timer.finish(STARTUP_BUDGET)
+
+    if STARTUP_PREWARM:
+        # Задачи JobQueue начинают выполняться, когда бот уже принимает обновления
+        application.job_queue.run_once(prewarm, when=STARTUP_PREWARM_DELAY, name='prewarm')
+
+
+async def prewarm(_: ContextTypes.DEFAULT_TYPE) -> None:
+    """Заранее загружает то, что иначе загрузилось бы при первом запросе: процессы графиков и NumPy."""
+    started = asyncio.get_running_loop().time()
+    # NumPy импортируется в потоке, чтобы не останавливать цикл событий на время импорта
+    await asyncio.gather(get_chart_service().prewarm(), asyncio.to_thread(importlib.import_module, 'numpy'))
+    logger.info(f"Prewarm finished in {asyncio.get_running_loop().time() - started:.1f} s.")
+
+
+async def post_stop(application: Application) -> None:
+    """Досылает сообщения из очереди, пока бот еще работает."""
+    await stop_sender(application)
+
+
+async def post_shutdown(application: Application) -> None:
+    """Останавливает метрики и рендеринг графиков, закрывает соединения с базой данных."""
+    await metrics.stop_metrics(application)
+    await stop_chart_service(application)
+    await close_db(application)
+
+
+def register_handlers(application: Application) -> None:
+    """Регистрирует обработчики; используется и в режиме polling, и в режиме вебхука."""
+    application.add_handler(CommandHandler('start', handlers.start))
+    application.add_handler(MessageHandler(filters.Regex(
+        '^Старт$'), handlers.show_wake_time_keyboard))
+    application.add_handler(CommandHandler('tips', handlers.send_tips))
+    application.add_handler(MessageHandler(
+        filters.Regex('^Советы$'), handlers.send_tips))
+    application.add_handler(CommandHandler(
+        'exercises', handlers.send_exercises))
+    application.add_handler(MessageHandler(
+        filters.Regex('^Упражнения$'), handlers.send_exercises))
+    application.add_handler(MessageHandler(filters.Regex(
+        '^Графики сна$'), handlers.show_reports_menu))
+    application.add_handler(CommandHandler(
+        'weekly_report', reports.send_weekly_report))
+    application.add_handler(MessageHandler(
+        filters.Regex('^За неделю$'), reports.send_weekly_report))
+    application.add_handler(CommandHandler(
+        'monthly_report', reports.send_monthly_report))
+    application.add_handler(MessageHandler(
+        filters.Regex('^За месяц$'), reports.send_monthly_report))
+    application.add_handler(CommandHandler(
+        'quarterly_report', reports.send_quarterly_report))
+    application.add_handler(MessageHandler(
+        filters.Regex('^За квартал$'), reports.send_quarterly_report))
+    application.add_handler(CommandHandler(
+        'yearly_report', reports.send_yearly_report))
+    application.add_handler(MessageHandler(
+        filters.Regex('^За год$'), reports.send_yearly_report))
+    application.add_handler(CommandHandler(
+        'all_time_report', reports.send_all_time_report))
+    application.add_handler(MessageHandler(
+        filters.Regex('^За все время$'), reports.send_all_time_report))
+    application.add_handler(MessageHandler(
+        filters.Regex('^Назад$'), handlers.start))
+    application.add_handler(CommandHandler(
+        'help', handlers.send_help_message))
+    application.add_handler(CommandHandler(
+        'achievements', handlers.show_achievements))
+    application.add_handler(MessageHandler(
+        filters.Regex('^Достижения$'), handlers.show_achievements))
+    application.add_handler(CommandHandler(
+        'reminders_off', reminders.reminders_off))
+    application.add_handler(CommandHandler('export', transfer.export_data))
+
+    # Добавление ConversationHandler для логирования сна
+    application.add_handler(handlers.get_log_sleep_conv_handler())
+    application.add_handler(transfer.get_import_conv_handler())
+
+    # Обработчик для inline-кнопок
+    application.add_handler(CallbackQueryHandler(
+        reminders.enable_reminder, pattern=f'^{reminders.CALLBACK_PREFIX}'))
+    application.add_handler(CallbackQueryHandler(handlers.show_times))
+    application.add_handler(InlineQueryHandler(share.share_achievement))
+
+    # Метрики времени обработки и ошибок для всех обработчиков
+    metrics.instrument_application(application)
+
+
+def build_application(token: str, base_url: Optional[str] = None) -> Application:
+    """Создает application с параллельной обработкой пользователей, лимитами отправки, хранением состояния, инициализацией и остановкой ресурсов.
+
+    base_url — адрес Bot API, к которому дописывается токен; None — api.telegram.org.
+    """
+    persistence = get_persistence()
+    builder = Application.builder()
+    if base_url:
+        builder.base_url(base_url)
+    application = (
+        builder
+        .token(token)
+        .persistence(persistence)
+        .concurrent_updates(get_update_processor())
+        .rate_limiter(TelegramRateLimiter())
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    persistence.set_application(application)
+    register_handlers(application)
+    application.job_queue.run_repeating(
+        refresh_advice_job, interval=ADVICE_BATCH_INTERVAL, first=ADVICE_BATCH_FIRST, name='refresh_advice')
+    startup_timer.lap('build application')
+    return application
 
 
 def main() -> None:
@@ -18,54 +165,18 @@ def main() -> None:
             logging.StreamHandler()
         ]
     )
-    logger = logging.getLogger(__name__)
     """Основная функция для запуска бота."""
     try:
         token = get_token_from_dotenv_file()
 
-        # Создание application и передача post_init для асинхронной инициализации
-        application = Application.builder().token(token).post_init(
-            create_tables).post_init(load_data).build()
-
-        # Регистрация обработчиков
-        application.add_handler(CommandHandler('start', handlers.start))
-        application.add_handler(MessageHandler(filters.Regex(
-            '^Старт$'), handlers.show_wake_time_keyboard))
-        application.add_handler(CommandHandler('tips', handlers.send_tips))
-        application.add_handler(MessageHandler(
-            filters.Regex('^Советы$'), handlers.send_tips))
-        application.add_handler(CommandHandler(
-            'exercises', handlers.send_exercises))
-        application.add_handler(MessageHandler(
-            filters.Regex('^Упражнения$'), handlers.send_exercises))
-        application.add_handler(MessageHandler(filters.Regex(
-            '^Графики сна$'), handlers.show_reports_menu))
-        application.add_handler(CommandHandler(
-            'weekly_report', reports.send_weekly_report))
-        application.add_handler(MessageHandler(
-            filters.Regex('^За неделю$'), reports.send_weekly_report))
-        application.add_handler(CommandHandler(
-            'monthly_report', reports.send_monthly_report))
-        application.add_handler(MessageHandler(
-            filters.Regex('^За месяц$'), reports.send_monthly_report))
-        application.add_handler(MessageHandler(
-            filters.Regex('^Назад$'), handlers.start))
-        application.add_handler(CommandHandler(
-            'help', handlers.send_help_message))
-        application.add_handler(CommandHandler(
-            'achievements', handlers.show_achievements))
-        application.add_handler(MessageHandler(
-            filters.Regex('^Достижения$'), handlers.show_achievements))
-
-        # Добавление ConversationHandler для логирования сна
-        application.add_handler(handlers.get_log_sleep_conv_handler())
-
-        # Обработчик для inline-кнопок
-        application.add_handler(CallbackQueryHandler(handlers.show_times))
-        application.add_handler(InlineQueryHandler(handlers.share_achievement))
-
-        # Запуск бота
-        application.run_polling()
+        application = build_application(token, get_api_url_from_dotenv_file())
+
+        # Запуск бота: вебхук, если он выбран в .env, иначе long polling
+        webhook_settings = get_webhook_settings_from_dotenv_file()
+        if webhook_settings is not None:
+            asyncio.run(run_webhook(application, webhook_settings))
+        else:
+            application.run_polling()
     except InvalidToken:
         logger.error('ОШИБКА: Неверный токен Telegram-бота. Пожалуйста, проверьте ваш .env файл.')
     except Exception as e:
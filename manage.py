@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+import db
+import batch_analysis
+import transfer
+import rebalance
+from config import DB_SHARDS
+
+
+async def rebuild_stats(args: argparse.Namespace) -> None:
+    """Пересчитывает таблицу user_sleep_stats по данным о сне."""
+    await db.init_db()
+    try:
+        users = await db.rebuild_user_stats()
+        print(f'Статистика пересчитана для {users} пользователей.')
+    finally:
+        await db.close_db()
+
+
+async def refresh_advice(args: argparse.Namespace) -> None:
+    """Пересчитывает персональные советы всех пользователей."""
+    await db.init_db()
+    try:
+        users = await batch_analysis.refresh_advice()
+        print(f'Советы пересчитаны для {users} пользователей.')
+    finally:
+        await db.close_db()
+
+
+async def import_history(args: argparse.Namespace) -> None:
+    """Импортирует историю сна из файла CSV или JSON."""
+    try:
+        file_format = args.format or transfer.detect_format(args.file)
+    except transfer.ImportFormatError as e:
+        print(e)
+        return
+    await db.init_db()
+    try:
+        with open(args.file, encoding='utf-8-sig', newline='') as stream:
+            result = await transfer.import_records(transfer.iter_records(stream, file_format), args.user_id)
+        print(f'Импортировано записей: {result.imported} для {len(result.users)} пользователей, '
+              f'пропущено: {result.skipped}.')
+        for error in result.errors:
+            print(f'  Запись {error}')
+        if result.error:
+            print(f'Чтение файла остановлено: {result.error}')
+        if result.truncated:
+            print('Импорт остановлен по лимиту IMPORT_MAX_ROWS.')
+    finally:
+        await db.close_db()
+
+
+async def export_history(args: argparse.Namespace) -> None:
+    """Выгружает историю сна одного или всех пользователей."""
+    await db.init_db()
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        async for chunk in transfer.export_chunks(args.user_id, args.format or 'csv'):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await db.close_db()
+
+
+async def rebalance_shards(args: argparse.Namespace) -> None:
+    """Раскладывает данные по новому количеству шардов. Бот должен быть остановлен."""
+    try:
+        counts = await rebalance.rebalance(args.source, args.shards)
+    except rebalance.RebalanceError as e:
+        print(e)
+        return
+    for table, rows in counts.items():
+        print(f'{table}: {rows} строк')
+    print(f'Готово. Установите DB_SHARDS = {args.shards} в config.py; старые файлы '
+          f'({", ".join(rebalance.layout_files(args.source))}) можно удалить после проверки.')
+
+
+def main() -> None:
+    """Административные команды для обслуживания базы данных бота."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='Обслуживание базы данных Sleep Bot.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = subparsers.add_parser(
+        'rebuild-stats', help='пересчитать таблицу user_sleep_stats по sleep_data')
+    rebuild_parser.set_defaults(handler=rebuild_stats)
+
+    advice_parser = subparsers.add_parser(
+        'refresh-advice', help='пересчитать персональные советы для всех пользователей')
+    advice_parser.set_defaults(handler=refresh_advice)
+
+    import_parser = subparsers.add_parser(
+        'import', help='импортировать историю сна из файла CSV или JSON')
+    import_parser.add_argument('file', help='путь к файлу')
+    import_parser.add_argument('--user-id', type=int,
+                               help='владелец записей; без него user_id берется из файла')
+    import_parser.add_argument('--format', choices=('csv', 'json'), help='формат файла (по умолчанию по расширению)')
+    import_parser.set_defaults(handler=import_history)
+
+    export_parser = subparsers.add_parser(
+        'export', help='выгрузить историю сна в CSV или JSON')
+    export_parser.add_argument('--user-id', type=int, help='выгрузить одного пользователя; без него — всех')
+    export_parser.add_argument('--format', choices=('csv', 'json'), help='формат выгрузки (по умолчанию csv)')
+    export_parser.add_argument('-o', '--output', help='файл для выгрузки (по умолчанию stdout)')
+    export_parser.set_defaults(handler=export_history)
+
+    rebalance_parser = subparsers.add_parser(
+        'rebalance', help='разложить данные пользователей по другому количеству файлов SQLite')
+    rebalance_parser.add_argument('shards', type=int, help='новое количество шардов')
+    rebalance_parser.add_argument('--from', dest='source', type=int, default=DB_SHARDS,
+                                  help='текущее количество шардов (по умолчанию DB_SHARDS)')
+    rebalance_parser.set_defaults(handler=rebalance_shards)
+
+    args = parser.parse_args()
+    asyncio.run(args.handler(args))
+
+
+if __name__ == '__main__':
+    main()
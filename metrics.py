@@ -0,0 +1,324 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from telegram.ext import Application, ConversationHandler
+from config import METRICS_HOST, METRICS_PORT, PROFILER_ENABLED, PROFILER_INTERVAL, PROFILER_SLOWEST
+from http_server import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться, либо читаться из callback при выгрузке."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            self._values[()] = float(self.callback())
+        return super().render()
+
+
+class CallbackCounter(Gauge):
+    """Счетчик, значение которого хранится в другом объекте (например, в кэше)."""
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        # Последняя ячейка — +Inf
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {self._sums[labels]}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+_registry: List[_Metric] = []
+
+HANDLER_LATENCY = Histogram('sleepbot_handler_latency_seconds', 'Время обработки обновления', ('handler',))
+HANDLER_ERRORS = Counter('sleepbot_handler_errors_total', 'Ошибки в обработчиках', ('handler',))
+HANDLER_IN_FLIGHT = Gauge('sleepbot_handler_in_flight', 'Обновления, обрабатываемые прямо сейчас')
+DB_LATENCY = Histogram('sleepbot_db_latency_seconds', 'Время вызова функций db.py', ('function',))
+DB_ERRORS = Counter('sleepbot_db_errors_total', 'Ошибки в функциях db.py', ('function',))
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def instrument_db(func: Callable) -> Callable:
+    """Декоратор для асинхронных функций db.py: время вызова и ошибки."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(name)
+            raise
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+class _RequestRecord:
+    __slots__ = ('handler', 'elapsed', 'samples')
+
+    def __init__(self, handler: str) -> None:
+        self.handler = handler
+        self.elapsed = 0.0
+        self.samples: _StackCounter = _StackCounter()
+
+
+class SamplingProfiler:
+    """Периодически снимает стек главного потока и относит его к выполняющемуся обработчику.
+
+    Хранит PROFILER_SLOWEST самых медленных обработок с разбивкой
+    процессорного времени по стекам.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, keep: int = PROFILER_SLOWEST) -> None:
+        self.interval = interval
+        self.keep = keep
+        self._active: Dict[Any, _RequestRecord] = {}
+        self._slowest: List[Tuple[float, int, _RequestRecord]] = []
+        self._sequence = itertools.count()
+        self._thread_id = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def begin(self, frame: Any, handler: str) -> _RequestRecord:
+        record = _RequestRecord(handler)
+        self._active[frame] = record
+        return record
+
+    def finish(self, frame: Any, record: _RequestRecord, elapsed: float) -> None:
+        self._active.pop(frame, None)
+        record.elapsed = elapsed
+        entry = (elapsed, next(self._sequence), record)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif elapsed > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                record = self._active.get(frame)
+                if record is not None:
+                    record.samples[';'.join(reversed(stack))] += 1
+                    break
+                code = frame.f_code
+                stack.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+
+    def report(self) -> str:
+        lines = []
+        for elapsed, _, record in sorted(self._slowest, reverse=True):
+            total = sum(record.samples.values())
+            lines.append(f'{record.handler}: {elapsed * 1000:.1f} ms, '
+                         f'{total} samples ({total * self.interval * 1000:.1f} ms on CPU)')
+            for stack, count in record.samples.most_common(10):
+                lines.append(f'    {count:5d}  {stack}')
+        return '\n'.join(lines) + '\n'
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def instrument_handler(callback: Callable, name: str) -> Callable:
+    """Оборачивает обработчик: время, ошибки, количество одновременных обработок."""
+
+    @functools.wraps(callback)
+    async def instrumented(update: Any, context: Any) -> Any:
+        profiler = _profiler
+        if profiler is not None:
+            frame = sys._getframe()
+            record = profiler.begin(frame, name)
+        HANDLER_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_LATENCY.observe(elapsed, name)
+            HANDLER_IN_FLIGHT.dec()
+            if profiler is not None:
+                profiler.finish(frame, record, elapsed)
+
+    return instrumented
+
+
+def _instrument_handlers(handlers: Sequence[Any]) -> None:
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            _instrument_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                _instrument_handlers(state_handlers)
+            _instrument_handlers(handler.fallbacks)
+        elif hasattr(handler, 'callback'):
+            callback = handler.callback
+            handler.callback = instrument_handler(callback, f'{callback.__module__}.{callback.__name__}')
+
+
+def instrument_application(application: Application) -> None:
+    """Подключает метрики ко всем зарегистрированным обработчикам."""
+    for group_handlers in application.handlers.values():
+        _instrument_handlers(group_handlers)
+
+
+_server: Optional[HttpServer] = None
+
+
+async def _metrics_endpoint(_: Request) -> Response:
+    return Response(body=render_metrics().encode('utf-8'), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def _slowest_endpoint(_: Request) -> Response:
+    if _profiler is None:
+        return Response(404, b'Profiler is disabled.')
+    return Response(body=_profiler.report().encode('utf-8'))
+
+
+async def start_metrics(_: Optional[Application] = None) -> None:
+    """Запускает профилировщик и HTTP-эндпоинт метрик, если они включены в config.py."""
+    global _server, _profiler
+    if PROFILER_ENABLED and _profiler is None:
+        _profiler = SamplingProfiler()
+        _profiler.start()
+        logger.info(f"Sampling profiler started with {PROFILER_INTERVAL * 1000:.0f} ms interval.")
+    if METRICS_PORT is not None and _server is None:
+        _server = HttpServer(METRICS_HOST, METRICS_PORT)
+        _server.route('GET', '/metrics', _metrics_endpoint)
+        _server.route('GET', '/debug/slowest', _slowest_endpoint)
+        await _server.start()
+
+
+async def stop_metrics(_: Optional[Application] = None) -> None:
+    global _server, _profiler
+    if _server is not None:
+        await _server.stop()
+        _server = None
+    if _profiler is not None:
+        profiler, _profiler = _profiler, None
+        await asyncio.get_running_loop().run_in_executor(None, profiler.stop)
+        logger.info(f"Slowest requests:\n{profiler.report()}")
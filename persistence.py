@@ -0,0 +1,185 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from telegram.ext import Application, BasePersistence, PersistenceInput
+from config import PERSISTENCE_HOT_USERS, PERSISTENCE_FLUSH_INTERVAL, PERSISTENCE_CONVERSATION_TTL
+from db import (init_db, get_user_state, save_user_states, delete_user_state, get_conversation_states,
+                save_conversation_state)
+from metrics import Gauge, CallbackCounter
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+
+class _HotUser:
+    """user_data активного пользователя и JSON, который последним записан в базу."""
+    __slots__ = ('data', 'saved')
+
+    def __init__(self, data: Dict, saved: str) -> None:
+        self.data = data
+        self.saved = saved
+
+
+class SqlitePersistence(BasePersistence[Dict, Dict, Dict]):
+    """Хранит context.user_data и состояния ConversationHandler в базе бота.
+
+    user_data загружается лениво, при первом обновлении пользователя после
+    запуска, поэтому запуск не зависит от числа пользователей. В памяти
+    остаются только PERSISTENCE_HOT_USERS недавно активных пользователей:
+    при вытеснении user_data дописывается в базу и удаляется из application.
+    Изменения пишутся раз в PERSISTENCE_FLUSH_INTERVAL секунд, все
+    изменившиеся пользователи — одной транзакцией очереди записи.
+    """
+
+    def __init__(self, hot_users: int = PERSISTENCE_HOT_USERS,
+                 update_interval: float = PERSISTENCE_FLUSH_INTERVAL) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.hot_users = hot_users
+        self.application: Optional[Application] = None
+        self._hot: 'OrderedDict[int, _HotUser]' = OrderedDict()
+        # Записи, поставленные в очередь, но еще не закоммиченные
+        self._unsaved: Dict[int, str] = {}
+        # Пользователи, удаленные из application при вытеснении, а не по drop_user_data
+        self._evicted: Set[int] = set()
+        self.evictions = 0
+
+    @property
+    def hot_count(self) -> int:
+        # Не __len__: Application проверяет persistence на истинность
+        return len(self._hot)
+
+    def set_application(self, application: Application) -> None:
+        """Приложение нужно, чтобы удалять вытесненных пользователей из application.user_data."""
+        self.application = application
+
+    async def _save(self, user_id: int, data: str) -> None:
+        self._unsaved[user_id] = data
+        try:
+            await save_user_states([(user_id, data)])
+        finally:
+            if self._unsaved.get(user_id) is data:
+                del self._unsaved[user_id]
+
+    async def _evict(self) -> None:
+        while len(self._hot) > self.hot_users:
+            user_id, hot = self._hot.popitem(last=False)
+            data = _dumps(hot.data)
+            # Сначала убираем пользователя из application: если он вернется во время
+            # записи, его user_data загрузится из _unsaved в новый словарь
+            self._evicted.add(user_id)
+            self.application.drop_user_data(user_id)
+            self.evictions += 1
+            if data != hot.saved:
+                await self._save(user_id, data)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        """Вызывается перед каждым обновлением пользователя: загружает user_data при первом обращении."""
+        hot = self._hot.get(user_id)
+        if hot is not None and hot.data is user_data:
+            self._hot.move_to_end(user_id)
+            return
+
+        saved = self._unsaved.get(user_id)
+        if saved is None:
+            saved = await get_user_state(user_id)
+        if saved is not None:
+            for key, value in json.loads(saved).items():
+                user_data.setdefault(key, value)
+        # Пустой user_data в базу не пишется
+        self._hot[user_id] = _HotUser(user_data, saved if saved is not None else '{}')
+        self._hot.move_to_end(user_id)
+        if self.application is not None:
+            await self._evict()
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        serialized = _dumps(data)
+        hot = self._hot.get(user_id)
+        if hot is not None and hot.saved == serialized:
+            return
+        await self._save(user_id, serialized)
+        hot = self._hot.get(user_id)
+        if hot is not None:
+            hot.saved = serialized
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if user_id in self._evicted:
+            self._evicted.discard(user_id)
+            # Пользователь вернулся до записи: application отбросило его изменения вместе с удалением
+            if user_id in self._hot and self.application is not None:
+                self.application.mark_data_for_update_persistence(user_ids=user_id)
+            return
+        self._hot.pop(user_id, None)
+        self._unsaved.pop(user_id, None)
+        await delete_user_state(user_id)
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        # Ничего не загружаем при запуске: user_data читается в refresh_user_data
+        return {}
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        # Диалоги загружаются в Application.initialize(), раньше post_init
+        await init_db()
+        rows = await get_conversation_states(name, int(time.time()) - PERSISTENCE_CONVERSATION_TTL)
+        conversations = {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+        logger.info(f"Restored {len(conversations)} {name} conversations.")
+        return conversations
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        state = None if new_state is None else json.dumps(new_state)
+        await save_conversation_state(name, json.dumps(list(key)), state, int(time.time()))
+
+    async def flush(self) -> None:
+        # Application.shutdown() перед flush уже записал все изменения через update_*
+        pass
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
+
+
+_persistence: Optional[SqlitePersistence] = None
+
+
+def get_persistence() -> SqlitePersistence:
+    global _persistence
+    if _persistence is None:
+        _persistence = SqlitePersistence()
+    return _persistence
+
+
+Gauge('sleepbot_persistence_hot_users', 'Пользователи, чей user_data сейчас в памяти',
+      callback=lambda: _persistence.hot_count if _persistence is not None else 0)
+CallbackCounter('sleepbot_persistence_evictions_total', 'Пользователи, вытесненные из памяти в базу',
+                callback=lambda: _persistence.evictions if _persistence is not None else 0)
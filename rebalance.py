@@ -0,0 +1,111 @@
+"""Офлайн-перенос данных между раскладками шардов: один файл -> N шардов, N -> M, N -> один файл.
+
+Бот во время переноса должен быть остановлен. Исходные файлы не изменяются
+и не удаляются: после проверки нужно выставить DB_SHARDS в config.py и
+удалить старые файлы вручную.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+from typing import Dict, List, Sequence, Tuple
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Таблица, переносимые столбцы и столбец, по которому выбирается шард.
+# Автоинкрементные id не переносятся: в разных исходных файлах они пересекаются.
+_TABLES: Tuple[Tuple[str, Tuple[str, ...], str], ...] = (
+    ('sleep_data', ('user_id', 'day', 'sleep_min', 'wake_min', 'duration_min'), 'user_id'),
+    ('achievements', ('user_id', 'achievement'), 'user_id'),
+    ('user_sleep_stats', ('user_id', 'entry_count', 'duration_sum_7', 'duration_sum_30', 'last_duration',
+                          'schedule_streak', 'bed_min', 'bed_max', 'wake_min', 'wake_max',
+                          'wake_delta_sum_7', 'late_bed_count_7', 'data_version'), 'user_id'),
+    ('advice_cache', ('user_id', 'data_version', 'tip'), 'user_id'),
+    ('reminders', ('user_id', 'chat_id', 'wake_min', 'bed_min', 'log_min'), 'user_id'),
+    ('user_state', ('user_id', 'data'), 'user_id'),
+    ('conversation_state', ('name', 'key', 'state', 'updated_at'), 'key'),
+)
+
+
+class RebalanceError(Exception):
+    """Перенос невозможен: нет исходных файлов или целевые уже существуют."""
+
+
+async def _prepare(path: str) -> None:
+    """Создает недостающие таблицы и переводит файл на текущую схему."""
+    manager = db.ConnectionManager(path, readers=0)
+    await manager.start()
+    try:
+        await db.create_tables(manager)
+    finally:
+        await manager.close()
+
+
+def _count_rows(paths: Sequence[str]) -> Dict[str, int]:
+    counts = dict.fromkeys((table for table, _, _ in _TABLES), 0)
+    for path in paths:
+        conn = sqlite3.connect(path)
+        try:
+            for table in counts:
+                counts[table] += conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        finally:
+            conn.close()
+    return counts
+
+
+def _copy_shard(sources: Sequence[str], target: str, index: int, shards: int) -> None:
+    """Переносит в шард index строки всех исходных файлов, которые ему принадлежат."""
+    conn = sqlite3.connect(target)
+    conn.create_function('shard_of', 1, lambda key: db.shard_index(key, shards), deterministic=True)
+    try:
+        for source in sources:
+            conn.execute('ATTACH DATABASE ? AS source', (source,))
+            for table, columns, key in _TABLES:
+                names = ', '.join(columns)
+                # ORDER BY rowid сохраняет порядок вставки, например порядок достижений пользователя
+                conn.execute(f'''
+                INSERT INTO main.{table} ({names})
+                SELECT {names} FROM source.{table}
+                WHERE shard_of({key}) = ?
+                ORDER BY rowid
+                ''', (index,))
+            conn.commit()
+            conn.execute('DETACH DATABASE source')
+    finally:
+        conn.close()
+
+
+async def rebalance(source_shards: int, target_shards: int) -> Dict[str, int]:
+    """Раскладывает данные из source_shards файлов по target_shards новым файлам.
+
+    Возвращает количество перенесенных строк по таблицам.
+    """
+    if source_shards == target_shards:
+        raise RebalanceError(f'Данные уже разложены на {target_shards} шард(ов).')
+    sources = [db.shard_path(index, source_shards) for index in range(source_shards)]
+    targets = [db.shard_path(index, target_shards) for index in range(target_shards)]
+    missing = [path for path in sources if not os.path.exists(path)]
+    if missing:
+        raise RebalanceError(f'Нет исходных файлов: {", ".join(missing)}.')
+    existing = [path for path in targets if os.path.exists(path)]
+    if existing:
+        raise RebalanceError(f'Целевые файлы уже существуют: {", ".join(existing)}.')
+
+    for path in sources + targets:
+        await _prepare(path)
+    await asyncio.gather(*(asyncio.to_thread(_copy_shard, sources, target, index, target_shards)
+                           for index, target in enumerate(targets)))
+
+    before, after = await asyncio.gather(asyncio.to_thread(_count_rows, sources),
+                                         asyncio.to_thread(_count_rows, targets))
+    if before != after:
+        raise RebalanceError(f'Количество строк не совпало после переноса: было {before}, стало {after}.')
+    logger.info(f"Rebalanced {source_shards} -> {target_shards} shards: {after}.")
+    return after
+
+
+def layout_files(shards: int) -> List[str]:
+    """Файлы раскладки на shards шардов (для сообщений manage.py)."""
+    return [db.shard_path(index, shards) for index in range(shards)]
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.error import Forbidden, TelegramError
+from telegram.ext import Application, ContextTypes
+from config import (SLEEP_SCHEDULE, REMINDER_LEAD_MINUTES, REMINDER_LOG_DELAY_MINUTES, REMINDER_SPREAD_SECONDS,
+                    REMINDER_MAX_PER_SECOND, REMINDER_CATCH_UP_MINUTES)
+from db import (get_reminder, upsert_reminder, delete_reminder, get_bedtime_reminders, get_log_reminders,
+                count_reminder_buckets)
+from utils import time_to_minutes, format_minutes, date_to_day
+from metrics import Gauge
+from sender import Priority, get_sender
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+CALLBACK_PREFIX = 'remind:'
+
+
+class ReminderWheel:
+    """Колесо из минутных ячеек суток: сколько напоминаний приходится на каждую минуту.
+
+    Сами получатели хранятся только в SQLite и читаются по индексу, когда
+    ячейка срабатывает; в памяти — лишь счетчики, чтобы не ходить в базу
+    за пустыми минутами.
+    """
+
+    def __init__(self) -> None:
+        self.bedtime = [0] * MINUTES_PER_DAY
+        self.log = [0] * MINUTES_PER_DAY
+
+    def __len__(self) -> int:
+        return sum(self.bedtime)
+
+    def load(self, bedtime: Dict[int, int], log: Dict[int, int]) -> None:
+        self.bedtime = [bedtime.get(minute, 0) for minute in range(MINUTES_PER_DAY)]
+        self.log = [log.get(minute, 0) for minute in range(MINUTES_PER_DAY)]
+
+    def add(self, bed_min: int, log_min: int) -> None:
+        self.bedtime[bed_min] += 1
+        self.log[log_min] += 1
+
+    def remove(self, bed_min: int, log_min: int) -> None:
+        self.bedtime[bed_min] = max(self.bedtime[bed_min] - 1, 0)
+        self.log[log_min] = max(self.log[log_min] - 1, 0)
+
+
+_wheel = ReminderWheel()
+# Последняя обработанная минута (номер минуты от 1970-01-01 по локальному времени)
+_last_minute: Optional[int] = None
+
+Gauge('sleepbot_reminders', 'Пользователи с включенными напоминаниями', callback=lambda: len(_wheel))
+
+
+def reminder_times(wake_time: str, sleep_time: str) -> Tuple[int, int, int]:
+    """Возвращает (wake_min, bed_min, log_min): минуты суток пробуждения и обоих напоминаний."""
+    wake_min = time_to_minutes(wake_time)
+    bed_min = (time_to_minutes(sleep_time) - REMINDER_LEAD_MINUTES) % MINUTES_PER_DAY
+    log_min = (wake_min + REMINDER_LOG_DELAY_MINUTES) % MINUTES_PER_DAY
+    return wake_min, bed_min, log_min
+
+
+async def enable_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Включает напоминания по кнопке под рекомендованным временем сна."""
+    query = update.callback_query
+    await query.answer()
+
+    wake_time, _, sleep_time = query.data[len(CALLBACK_PREFIX):].partition('|')
+    if sleep_time not in SLEEP_SCHEDULE.get(wake_time, []):
+        logger.warning(f"Unexpected reminder callback data: {query.data}")
+        return
+
+    user_id = update.effective_user.id
+    wake_min, bed_min, log_min = reminder_times(wake_time, sleep_time)
+    previous = await get_reminder(user_id)
+    await upsert_reminder(user_id, update.effective_chat.id, wake_min, bed_min, log_min)
+    if previous is not None:
+        _wheel.remove(*previous)
+    _wheel.add(bed_min, log_min)
+    logger.info(f"User {user_id} enabled reminders for {sleep_time} (wake {wake_time}).")
+
+    await query.edit_message_text(
+        f'{query.message.text}\n\n'
+        f'Напомню за {REMINDER_LEAD_MINUTES} минут до {sleep_time}, что пора ложиться, '
+        f'а утром — записать сон. Отключить напоминания: /reminders_off'
+    )
+
+
+async def reminders_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отключает напоминания пользователя."""
+    user_id = update.effective_user.id
+    previous = await get_reminder(user_id)
+    if previous is None:
+        await update.message.reply_text('Напоминания не включены. Включить их можно после выбора времени в меню «Старт».')
+        return
+    await delete_reminder(user_id)
+    _wheel.remove(*previous)
+    await update.message.reply_text('Напоминания отключены.')
+
+
+async def _collect_due(minute: int, day: int) -> List[Tuple[int, int, str]]:
+    """Собирает (user_id, chat_id, текст) напоминаний, которые должны сработать в minute дня day."""
+    messages = []
+    if _wheel.bedtime[minute]:
+        for user_id, chat_id, wake_min, bed_min in await get_bedtime_reminders(minute):
+            sleep_time = format_minutes((bed_min + REMINDER_LEAD_MINUTES) % MINUTES_PER_DAY)
+            messages.append((user_id, chat_id,
+                             f'Через {REMINDER_LEAD_MINUTES} минут пора спать: ложитесь в {sleep_time}, '
+                             f'чтобы легко проснуться в {format_minutes(wake_min)}.'))
+    if _wheel.log[minute]:
+        for user_id, chat_id in await get_log_reminders(minute, day):
+            messages.append((user_id, chat_id,
+                             'Доброе утро! Не забудьте записать, как вы спали: кнопка «Записать сон».'))
+    return messages
+
+
+async def _send_spread(messages: List[Tuple[int, int, str]]) -> None:
+    """Рассылает напоминания равномерно в течение REMINDER_SPREAD_SECONDS, а не одной пачкой.
+
+    Лимиты Telegram и повтор после RetryAfter обеспечивает sender; здесь — только
+    растягивание пачки, чтобы напоминания не вытесняли ответы пользователям.
+    """
+    interval = max(REMINDER_SPREAD_SECONDS / len(messages), 1 / REMINDER_MAX_PER_SECOND)
+    for user_id, chat_id, text in messages:
+        try:
+            await get_sender().send_text(chat_id, text, Priority.NOTIFICATION)
+        except Forbidden:
+            # Пользователь заблокировал бота — напоминания больше не нужны
+            previous = await get_reminder(user_id)
+            if previous is not None:
+                await delete_reminder(user_id)
+                _wheel.remove(*previous)
+        except TelegramError as e:
+            logger.warning(f"Failed to send reminder to {chat_id}: {e}")
+        await asyncio.sleep(interval)
+
+
+async def reminder_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задача JobQueue, срабатывающая раз в минуту: отправляет напоминания из текущей ячейки."""
+    global _last_minute
+    now = datetime.now()
+    current = date_to_day(now.date()) * MINUTES_PER_DAY + now.hour * 60 + now.minute
+    first = current if _last_minute is None else max(_last_minute + 1, current - REMINDER_CATCH_UP_MINUTES + 1)
+    _last_minute = current
+
+    # Минуты, пропущенные из-за задержки задачи, обрабатываются с опозданием, но не теряются
+    for absolute in range(first, current + 1):
+        day, minute = divmod(absolute, MINUTES_PER_DAY)
+        try:
+            messages = await _collect_due(minute, day)
+        except Exception as e:
+            logger.error(f"Failed to load reminders for minute {minute}: {e}", exc_info=True)
+            continue
+        if messages:
+            logger.info(f"Sending {len(messages)} reminders for {format_minutes(minute)}.")
+            context.application.create_task(_send_spread(messages), name=f'reminders:{minute}')
+
+
+async def start_reminders(application: Application) -> None:
+    """Восстанавливает ячейки напоминаний из базы и запускает минутную задачу."""
+    bedtime, log = await count_reminder_buckets()
+    _wheel.load(bedtime, log)
+    now = datetime.now()
+    # Первый запуск выравнивается на начало следующей минуты
+    first = 60 - now.second - now.microsecond / 1_000_000
+    application.job_queue.run_repeating(reminder_tick, interval=60, first=first, name='reminders')
+    logger.info(f"Reminders loaded: {len(bedtime)} bedtime and {len(log)} log buckets.")
@@ -0,0 +1,234 @@
+"""Рендереры графиков отчетов. Выполняются в рабочих процессах charts.py.
+
+pillow рисует линию, сетку и подписи прямо в PNG поверх заранее
+подготовленного фона; matplotlib строит полноценную фигуру и используется,
+если pillow недоступен.
+"""
+import importlib.util
+import io
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+from config import CHART_FONT
+
+logger = logging.getLogger(__name__)
+
+
+class ChartRenderer:
+    """Интерфейс рендерера графика продолжительности сна."""
+    name = ''
+
+    def load(self) -> None:
+        """Загружает библиотеки и шрифты заранее, до первого графика."""
+
+    def render_durations(self, durations: Sequence[float], title: str, xticks: Sequence[int],
+                         xlabels: Optional[Sequence[str]] = None, xlabel: str = 'Дни') -> bytes:
+        """Рисует продолжительность сна (часы) по точкам 1..len(durations) и возвращает PNG.
+
+        xlabels — подписи делений xticks (по умолчанию их номера), xlabel — подпись оси.
+        """
+        raise NotImplementedError
+
+
+class MatplotlibRenderer(ChartRenderer):
+    name = 'matplotlib'
+
+    def load(self) -> None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.figure  # noqa: F401
+
+    def render_durations(self, durations: Sequence[float], title: str, xticks: Sequence[int],
+                         xlabels: Optional[Sequence[str]] = None, xlabel: str = 'Дни') -> bytes:
+        from matplotlib.figure import Figure
+
+        # Объектный API не использует глобальное состояние pyplot
+        fig = Figure(figsize=(10, 5))
+        ax = fig.subplots()
+        ax.plot(range(1, len(durations) + 1), durations, marker='o')
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel('Часы сна')
+        ax.grid(True)
+        ax.set_xticks(list(xticks), labels=list(xlabels) if xlabels is not None else None)
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+        return buffer.getvalue()
+
+
+# Геометрия совпадает с фигурой matplotlib 10x5 дюймов при 100 dpi
+_WIDTH, _HEIGHT = 1000, 500
+_LEFT, _RIGHT, _TOP, _BOTTOM = 125, 900, 60, 445
+_LINE_COLOR = (31, 119, 180)
+_GRID_COLOR = 176
+_LINE_INDEX = 255              # Номер цвета линии в палитре фона
+_WHITE_INDEX = 254
+_PALETTE = bytes(value for gray in range(_WHITE_INDEX) for value in (gray, gray, gray)) + bytes((255, 255, 255)) \
+    + bytes(_LINE_COLOR)
+_MARKER_RADIUS = 4
+# Шаги делений оси часов; выбирается наименьший, при котором делений не больше _MAX_YTICKS
+_YTICK_STEPS = (0.5, 1, 2, 3, 4, 6, 12)
+_MAX_YTICKS = 8
+# Сколько разных фонов хранить: их немного — недельный и месячный отчет при разных шкалах часов
+_BACKGROUND_CACHE_SIZE = 32
+
+# (ymin, ymax, шаг) оси часов
+YAxis = Tuple[float, float, float]
+
+
+def find_font() -> Optional[str]:
+    """Путь к шрифту с кириллицей: CHART_FONT, DejaVuSans из matplotlib или из системы."""
+    candidates = [CHART_FONT] if CHART_FONT else []
+    # find_spec находит пакет, не импортируя сам matplotlib
+    spec = importlib.util.find_spec('matplotlib')
+    if spec is not None and spec.submodule_search_locations:
+        for location in spec.submodule_search_locations:
+            candidates.append(os.path.join(location, 'mpl-data', 'fonts', 'ttf', 'DejaVuSans.ttf'))
+    candidates.append('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+    return next((path for path in candidates if os.path.exists(path)), None)
+
+
+def y_axis(durations: Sequence[float]) -> YAxis:
+    """Границы и шаг оси часов, кратные шагу: фон графика зависит только от них."""
+    low, high = min(durations), max(durations)
+    if high - low < 1:
+        low, high = low - 0.5, high + 0.5
+    for step in _YTICK_STEPS:
+        ymin, ymax = math.floor(low / step) * step, math.ceil(high / step) * step
+        if (ymax - ymin) / step <= _MAX_YTICKS:
+            break
+    return ymin, ymax, step
+
+
+class PillowRenderer(ChartRenderer):
+    name = 'pillow'
+
+    def __init__(self) -> None:
+        self._fonts: Dict[int, object] = {}
+        self._font_path: Optional[str] = None
+        self._backgrounds: Dict[tuple, object] = {}
+
+    def load(self) -> None:
+        from PIL import Image, ImageDraw, ImageFont  # noqa: F401
+
+        self._font_path = find_font()
+        if self._font_path is None:
+            raise RuntimeError('No font with Cyrillic glyphs found, set CHART_FONT.')
+        self._font(14)
+
+    def _font(self, size: int):
+        font = self._fonts.get(size)
+        if font is None:
+            from PIL import ImageFont
+            font = self._fonts[size] = ImageFont.truetype(self._font_path, size)
+        return font
+
+    @staticmethod
+    def _x_scale(count: int) -> Tuple[float, float]:
+        """Границы оси дней с полями 5%, как у matplotlib."""
+        pad = 0.05 * (count - 1) if count > 1 else 0.5
+        return 1 - pad, count + pad
+
+    def _background(self, title: str, xticks: Tuple[int, ...], xlabels: Tuple[str, ...], xlabel: str,
+                    count: int, axis: YAxis):
+        """Фон графика: рамка, сетка, деления и подписи. Кэшируется по виду осей."""
+        key = (title, xticks, xlabels, xlabel, count, axis)
+        image = self._backgrounds.get(key)
+        if image is None:
+            if len(self._backgrounds) >= _BACKGROUND_CACHE_SIZE:
+                self._backgrounds.clear()
+            image = self._backgrounds[key] = self._draw_background(*key)
+        return image
+
+    def _draw_background(self, title: str, xticks: Tuple[int, ...], xlabels: Tuple[str, ...], xlabel: str,
+                         count: int, axis: YAxis):
+        from PIL import Image, ImageDraw
+
+        # Фон рисуется в оттенках серого: номер цвета в палитре совпадает с яркостью
+        image = Image.new('L', (_WIDTH, _HEIGHT), 255)
+        draw = ImageDraw.Draw(image)
+        font = self._font(14)
+        xmin, xmax = self._x_scale(count)
+        ymin, ymax, step = axis
+
+        for tick, tick_label in zip(xticks, xlabels):
+            x = round(_LEFT + (tick - xmin) / (xmax - xmin) * (_RIGHT - _LEFT))
+            draw.line([(x, _TOP), (x, _BOTTOM)], fill=_GRID_COLOR)
+            draw.line([(x, _BOTTOM), (x, _BOTTOM + 5)], fill=0)
+            draw.text((x, _BOTTOM + 8), tick_label, fill=0, font=font, anchor='mt')
+
+        ticks = round((ymax - ymin) / step)
+        for i in range(ticks + 1):
+            value = ymin + i * step
+            y = round(_BOTTOM - i / ticks * (_BOTTOM - _TOP))
+            draw.line([(_LEFT, y), (_RIGHT, y)], fill=_GRID_COLOR)
+            draw.line([(_LEFT - 5, y), (_LEFT, y)], fill=0)
+            label = f'{value:.1f}' if step < 1 else f'{value:g}'
+            draw.text((_LEFT - 8, y), label, fill=0, font=font, anchor='rm')
+
+        draw.rectangle([(_LEFT, _TOP), (_RIGHT, _BOTTOM)], outline=0)
+        draw.text(((_LEFT + _RIGHT) // 2, _TOP - 10), title, fill=0, font=self._font(17), anchor='ms')
+        draw.text(((_LEFT + _RIGHT) // 2, _BOTTOM + 32), xlabel, fill=0, font=font, anchor='mt')
+
+        # Подпись оси часов рисуется горизонтально и поворачивается
+        ylabel = 'Часы сна'
+        left, top, right, bottom = font.getbbox(ylabel)
+        label = Image.new('L', (right - left + 2, bottom - top + 2), 255)
+        ImageDraw.Draw(label).text((1 - left, 1 - top), ylabel, fill=0, font=font)
+        label = label.rotate(90, expand=True)
+        image.paste(label, (_LEFT - 38 - label.width, (_TOP + _BOTTOM - label.height) // 2))
+
+        # Палитра вместо RGB: PNG кодируется в несколько раз быстрее и весит меньше.
+        # Последний цвет палитры отдан линии графика, поэтому белый сдвигается на 254.
+        image = image.point(lambda value: min(value, _WHITE_INDEX))
+        image.putpalette(_PALETTE, rawmode='RGB')
+        return image
+
+    def render_durations(self, durations: Sequence[float], title: str, xticks: Sequence[int],
+                         xlabels: Optional[Sequence[str]] = None, xlabel: str = 'Дни') -> bytes:
+        from PIL import ImageDraw
+
+        axis = y_axis(durations)
+        xticks = tuple(xticks)
+        xlabels = tuple(xlabels) if xlabels is not None else tuple(str(tick) for tick in xticks)
+        image = self._background(title, xticks, xlabels, xlabel, len(durations), axis).copy()
+        draw = ImageDraw.Draw(image)
+        xmin, xmax = self._x_scale(len(durations))
+        ymin, ymax, _ = axis
+        points: List[Tuple[float, float]] = [
+            (_LEFT + (day - xmin) / (xmax - xmin) * (_RIGHT - _LEFT),
+             _BOTTOM - (hours - ymin) / (ymax - ymin) * (_BOTTOM - _TOP))
+            for day, hours in enumerate(durations, start=1)
+        ]
+        if len(points) > 1:
+            draw.line(points, fill=_LINE_INDEX, width=2, joint='curve')
+        for x, y in points:
+            draw.ellipse([(x - _MARKER_RADIUS, y - _MARKER_RADIUS), (x + _MARKER_RADIUS, y + _MARKER_RADIUS)],
+                         fill=_LINE_INDEX)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', compress_level=1)
+        return buffer.getvalue()
+
+
+RENDERERS: Dict[str, Type[ChartRenderer]] = {
+    'pillow': PillowRenderer,
+    'matplotlib': MatplotlibRenderer,
+}
+
+
+def create_renderer(name: str) -> ChartRenderer:
+    """Создает и загружает рендерер name; если он недоступен — matplotlib."""
+    renderer = RENDERERS[name]()
+    try:
+        renderer.load()
+    except Exception as e:
+        if name == 'matplotlib':
+            raise
+        logger.warning(f"Chart renderer {name} is unavailable ({e}), falling back to matplotlib.")
+        renderer = MatplotlibRenderer()
+        renderer.load()
+    return renderer
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from config import REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_MAX_BYTES
+from metrics import Gauge, CallbackCounter
+
+CacheKey = Tuple[int, str, int, int]
+
+# Примерный размер служебных данных одной записи в кэше, байты
+_ENTRY_OVERHEAD = 256
+
+
+@dataclass
+class CachedReport:
+    """Готовый отчет: текст и изображение (PNG или file_id уже загруженного фото)."""
+    text: str
+    png: Optional[bytes] = None
+    file_id: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return _ENTRY_OVERHEAD + len(self.text) * 2 + (len(self.png) if self.png else 0)
+
+
+class ReportCache:
+    """LRU-кэш отчетов с ключом (user_id, period, data_version, start_day).
+
+    data_version меняется при каждой записи о сне пользователя, поэтому
+    устаревшие отчеты никогда не отдаются; invalidate_user освобождает их сразу.
+    start_day — первый день окна отчета, который сдвигается каждый день
+    (0 для отчетов, окно которых от даты не зависит).
+    """
+
+    def __init__(self, max_entries: int = REPORT_CACHE_MAX_ENTRIES,
+                 max_bytes: int = REPORT_CACHE_MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[CacheKey, CachedReport]' = OrderedDict()
+        self._user_keys: Dict[int, Set[CacheKey]] = {}
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int, period: str, data_version: int, start_day: int = 0) -> Optional[CachedReport]:
+        key = (user_id, period, data_version, start_day)
+        report = self._entries.get(key)
+        if report is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return report
+
+    def put(self, user_id: int, period: str, data_version: int, report: CachedReport, start_day: int = 0) -> None:
+        key = (user_id, period, data_version, start_day)
+        self._remove(key)
+        # Отчеты за прошлые версии данных и прошлые окна больше не понадобятся
+        for old_key in [k for k in self._user_keys.get(user_id, ()) if k[1] == period]:
+            self._remove(old_key)
+        self._entries[key] = report
+        self._user_keys.setdefault(user_id, set()).add(key)
+        self._bytes += report.size
+        self._evict()
+
+    def set_file_id(self, user_id: int, period: str, data_version: int, file_id: str, start_day: int = 0) -> None:
+        """Запоминает file_id загруженного фото и освобождает память из-под PNG."""
+        key = (user_id, period, data_version, start_day)
+        report = self._entries.get(key)
+        if report is None:
+            return
+        self._bytes -= report.size
+        report.file_id = file_id
+        report.png = None
+        self._bytes += report.size
+
+    def invalidate_user(self, user_id: int) -> None:
+        for key in list(self._user_keys.get(user_id, ())):
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._user_keys.clear()
+        self._bytes = 0
+
+    def _remove(self, key: CacheKey) -> None:
+        report = self._entries.pop(key, None)
+        if report is None:
+            return
+        self._bytes -= report.size
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+
+report_cache = ReportCache()
+
+CallbackCounter('sleepbot_report_cache_hits_total', 'Попадания в кэш отчетов', callback=lambda: report_cache.hits)
+CallbackCounter('sleepbot_report_cache_misses_total', 'Промахи кэша отчетов', callback=lambda: report_cache.misses)
+Gauge('sleepbot_report_cache_entries', 'Отчеты в кэше', callback=lambda: len(report_cache))
+Gauge('sleepbot_report_cache_bytes', 'Объем кэша отчетов, байты', callback=lambda: report_cache.size_bytes)
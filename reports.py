@@ -1,70 +1,189 @@
-import matplotlib.pyplot as plt
 import logging
-import os
+import math
+from typing import List, NamedTuple, Optional, Sequence, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
-from db import get_sleep_data
-from utils import calculate_sleep_duration
+from db import get_recent_sleep_data, get_user_stats, get_sleep_summary, get_sleep_trend
+from utils import day_to_date, format_minutes, today_day
+from charts import get_chart_service, ChartQueueFullError
+from report_cache import report_cache, CachedReport
 
 logger = logging.getLogger(__name__)
 
 
-async def send_weekly_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def _send_duration_report(update: Update, period: str, days: int, title: str,
+                                xticks: Sequence[int], not_enough_text: str, avg_text: str) -> None:
+    """Отправляет среднюю продолжительность сна и график за последние days записей."""
     user_id = update.message.from_user.id
-    logger.info(f"User {user_id} requested a weekly report.")
-    user_data = await get_sleep_data(user_id)
-    if len(user_data) < 7:
+    logger.info(f"User {user_id} requested a {period} report.")
+    stats = await get_user_stats(user_id)
+    entry_count = stats.entry_count if stats else 0
+    if entry_count < days:
         logger.warning(
-            f"Not enough data for weekly report for user {user_id}. Data points: {len(user_data)}")
-        await update.message.reply_text('Недостаточно данных для формирования недельного отчета.')
+            f"Not enough data for {period} report for user {user_id}. Data points: {entry_count}")
+        await update.message.reply_text(not_enough_text)
         return
 
-    last_week_data = user_data[-7:]
-    durations = [calculate_sleep_duration(
-        entry[0], entry[1]) for entry in last_week_data]
-    avg_duration = sum(durations) / len(durations)
+    # Повторный запрос без новых данных отдает тот же отчет без рендеринга и загрузки
+    cached = report_cache.get(user_id, period, stats.data_version)
+    if cached is None:
+        duration_sum = stats.duration_sum_7 if days == 7 else stats.duration_sum_30
+        avg_duration = duration_sum / days / 60
+        recent_data = await get_recent_sleep_data(user_id, days)
+        durations = [entry[2] / 60 for entry in recent_data]
+
+        try:
+            chart = await get_chart_service().render_durations(durations, title, xticks)
+        except ChartQueueFullError:
+            logger.warning(f"Chart queue is full, rejecting {period} report for user {user_id}.")
+            await update.message.reply_text('Сейчас строится слишком много графиков. Попробуйте через минуту.')
+            return
+
+        cached = CachedReport(text=f'{avg_text}: {avg_duration:.2f} часов.', png=chart)
+        report_cache.put(user_id, period, stats.data_version, cached)
+
+    await _send_cached_report(update, user_id, period, stats.data_version, cached)
 
-    plt.figure(figsize=(10, 5))
-    plt.plot(range(1, 8), durations, marker='o')
-    plt.title('Продолжительность сна за последнюю неделю')
-    plt.xlabel('Дни')
-    plt.ylabel('Часы сна')
-    plt.grid(True)
-    plt.xticks(range(1, 8))
-    plt.savefig(f'weekly_report_{user_id}.png')
-    plt.close()
 
-    await update.message.reply_text(f'Средняя продолжительность сна за последнюю неделю: {avg_duration:.2f} часов.')
-    with open(f'weekly_report_{user_id}.png', 'rb') as f:
-        await update.message.reply_photo(photo=f)
-    os.remove(f'weekly_report_{user_id}.png')
+async def _send_cached_report(update: Update, user_id: int, period: str, data_version: int,
+                              cached: CachedReport, start_day: int = 0) -> None:
+    """Отправляет текст и график; после первой загрузки фото запоминает его file_id."""
+    await update.message.reply_text(cached.text)
+    message = await update.message.reply_photo(photo=cached.file_id or cached.png)
+    if cached.file_id is None and message.photo:
+        report_cache.set_file_id(user_id, period, data_version, message.photo[-1].file_id, start_day)
+
+
+async def send_weekly_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _send_duration_report(
+        update, 'weekly', 7,
+        title='Продолжительность сна за последнюю неделю',
+        xticks=range(1, 8),
+        not_enough_text='Недостаточно данных для формирования недельного отчета.',
+        avg_text='Средняя продолжительность сна за последнюю неделю'
+    )
 
 
 async def send_monthly_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _send_duration_report(
+        update, 'monthly', 30,
+        title='Продолжительность сна за последний месяц',
+        xticks=range(1, 31, 2),
+        not_enough_text='Недостаточно данных для формирования месячного отчета.',
+        avg_text='Средняя продолжительность сна за последний месяц'
+    )
+
+
+class LongReport(NamedTuple):
+    """Долгосрочный отчет: days последних дней (None — вся история) с точками по периодам bucket."""
+    days: Optional[int]
+    bucket: Optional[str]
+    title: str
+    not_enough_text: str
+
+
+LONG_REPORTS = {
+    'quarterly': LongReport(91, 'week', 'за последний квартал',
+                            'Недостаточно данных для отчета за квартал: нужны записи хотя бы за две недели.'),
+    'yearly': LongReport(365, 'month', 'за последний год',
+                         'Недостаточно данных для отчета за год: нужны записи хотя бы за два месяца.'),
+    'all_time': LongReport(None, None, 'за все время',
+                           'Недостаточно данных для отчета за все время: нужны записи хотя бы за две недели.'),
+}
+
+# Для отчета за все время шаг выбирается по длине истории, чтобы точек было не больше нескольких десятков
+_ALL_TIME_BUCKETS = ((26 * 7, 'week'), (3 * 365, 'month'))
+# Сколько подписей оставлять на оси периодов
+_MAX_XLABELS = 13
+
+_MONTHS = ('янв', 'фев', 'мар', 'апр', 'май', 'июн', 'июл', 'авг', 'сен', 'окт', 'ноя', 'дек')
+_BUCKET_AXIS = {'week': 'Недели', 'month': 'Месяцы', 'quarter': 'Кварталы'}
+_BUCKET_TITLE = {'week': 'по неделям', 'month': 'по месяцам', 'quarter': 'по кварталам'}
+
+
+def _bucket_label(bucket: str, number: int) -> str:
+    """Подпись периода из номера db.TREND_BUCKETS: начало недели, месяц или квартал."""
+    if bucket == 'week':
+        return day_to_date(number * 7 - 3).strftime('%d.%m')
+    if bucket == 'month':
+        return f'{_MONTHS[number % 12]} {number // 12 % 100:02d}'
+    return f'{number % 4 + 1} кв. {number // 4 % 100:02d}'
+
+
+def _trend_axis(bucket: str, numbers: Sequence[int]) -> Tuple[List[int], List[str]]:
+    """Деления и подписи оси периодов: не больше _MAX_XLABELS, с равным шагом."""
+    step = math.ceil(len(numbers) / _MAX_XLABELS)
+    ticks = list(range(1, len(numbers) + 1, step))
+    return ticks, [_bucket_label(bucket, numbers[tick - 1]) for tick in ticks]
+
+
+def _format_bedtime(minutes: int) -> str:
+    return format_minutes(minutes % (24 * 60))
+
+
+async def _send_long_report(update: Update, period: str) -> None:
+    """Отправляет сводку и график средних значений за длинный период.
+
+    Агрегаты и точки графика считаются в SQLite, поэтому стоимость отчета не
+    зависит от длины истории.
+    """
+    report = LONG_REPORTS[period]
     user_id = update.message.from_user.id
-    logger.info(f"User {user_id} requested a monthly report.")
-    user_data = await get_sleep_data(user_id)
-    if len(user_data) < 30:
-        logger.warning(
-            f"Not enough data for monthly report for user {user_id}. Data points: {len(user_data)}")
-        await update.message.reply_text('Недостаточно данных для формирования месячного отчета.')
+    logger.info(f"User {user_id} requested a {period} report.")
+    stats = await get_user_stats(user_id)
+    if stats is None:
+        await update.message.reply_text(report.not_enough_text)
         return
 
-    last_month_data = user_data[-30:]
-    durations = [calculate_sleep_duration(
-        entry[0], entry[1]) for entry in last_month_data]
-    avg_duration = sum(durations) / len(durations)
-
-    plt.figure(figsize=(10, 5))
-    plt.plot(range(1, 31), durations, marker='o')
-    plt.title('Продолжительность сна за последний месяц')
-    plt.xlabel('Дни')
-    plt.ylabel('Часы сна')
-    plt.grid(True)
-    plt.xticks(range(1, 31, 2))
-    plt.savefig(f'monthly_report_{user_id}.png')
-    plt.close()
-
-    await update.message.reply_text(f'Средняя продолжительность сна за последний месяц: {avg_duration:.2f} часов.')
-    with open(f'monthly_report_{user_id}.png', 'rb') as f:
-        await update.message.reply_photo(photo=f)
+    # Окно квартального и годового отчетов сдвигается каждый день, поэтому входит в ключ кэша
+    start_day = today_day() - report.days + 1 if report.days is not None else 0
+    cached = report_cache.get(user_id, period, stats.data_version, start_day)
+    if cached is None:
+        summary = await get_sleep_summary(user_id, start_day)
+        bucket = report.bucket
+        if bucket is None and summary is not None:
+            span = today_day() - summary.first_day
+            bucket = next((name for days, name in _ALL_TIME_BUCKETS if span <= days), 'quarter')
+        trend = await get_sleep_trend(user_id, start_day, bucket) if summary is not None else []
+        if len(trend) < 2:
+            logger.warning(f"Not enough data for {period} report for user {user_id}. Periods: {len(trend)}")
+            await update.message.reply_text(report.not_enough_text)
+            return
+
+        numbers = [row[0] for row in trend]
+        xticks, xlabels = _trend_axis(bucket, numbers)
+        try:
+            chart = await get_chart_service().render_durations(
+                [row[2] / 60 for row in trend],
+                f'Средняя продолжительность сна {_BUCKET_TITLE[bucket]} {report.title}',
+                xticks, xlabels, _BUCKET_AXIS[bucket])
+        except ChartQueueFullError:
+            logger.warning(f"Chart queue is full, rejecting {period} report for user {user_id}.")
+            await update.message.reply_text('Сейчас строится слишком много графиков. Попробуйте через минуту.')
+            return
+
+        text = (
+            f'Отчет {report.title}: записано ночей — {summary.nights}.\n'
+            f'Средняя продолжительность сна: {summary.avg_duration / 60:.2f} часов.\n'
+            f'Ночей с 7–9 часами сна: {summary.target_share:.0%}.\n'
+            f'Отход ко сну: обычно в {_format_bedtime(summary.bed_p50)}, половина ночей '
+            f'с {_format_bedtime(summary.bed_p25)} до {_format_bedtime(summary.bed_p75)}.\n'
+            f'Подъем: обычно в {format_minutes(summary.wake_p50)}, половина ночей '
+            f'с {format_minutes(summary.wake_p25)} до {format_minutes(summary.wake_p75)}.'
+        )
+        cached = CachedReport(text=text, png=chart)
+        report_cache.put(user_id, period, stats.data_version, cached, start_day)
+
+    await _send_cached_report(update, user_id, period, stats.data_version, cached, start_day)
+
+
+async def send_quarterly_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _send_long_report(update, 'quarterly')
+
+
+async def send_yearly_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _send_long_report(update, 'yearly')
+
+
+async def send_all_time_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _send_long_report(update, 'all_time')
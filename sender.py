@@ -0,0 +1,275 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Tuple, Union
+
+from telegram import Bot, Message
+from telegram.error import RetryAfter
+from telegram.ext import Application, BaseRateLimiter
+from config import (SENDER_GLOBAL_RATE, SENDER_GLOBAL_BURST, SENDER_CHAT_RATE, SENDER_CHAT_BURST,
+                    SENDER_GROUP_RATE, SENDER_GROUP_BURST, SENDER_MAX_RETRIES, SENDER_MAX_CHAT_BUCKETS)
+from metrics import Counter, Gauge, CallbackCounter
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+RETRY_AFTER_TOTAL = Counter('sleepbot_sender_retry_after_total', 'Ответы RetryAfter от Telegram')
+
+
+class Priority(IntEnum):
+    """Чем меньше значение, тем раньше запрос получает квоту на отправку."""
+    INTERACTIVE = 0   # Ответы на действия пользователя
+    NOTIFICATION = 1  # Напоминания
+    BULK = 2          # Рассылки
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до появления токена (0 — токен есть)."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+def _is_limited(endpoint: str) -> bool:
+    """Квоты Telegram считаются по отправке и редактированию сообщений."""
+    return endpoint.startswith(('send', 'edit', 'copy', 'forward'))
+
+
+class TelegramRateLimiter(BaseRateLimiter[int]):
+    """Ограничитель запросов к Bot API: общий лимит и лимит на чат, приоритеты и повтор после RetryAfter.
+
+    rate_limit_args — приоритет запроса (Priority); без него запрос считается
+    интерактивным. Квота общего лимита выдается в порядке приоритета, поэтому
+    напоминания и рассылки не задерживают ответы пользователям.
+    """
+
+    def __init__(self, global_rate: float = SENDER_GLOBAL_RATE, global_burst: float = SENDER_GLOBAL_BURST,
+                 max_retries: int = SENDER_MAX_RETRIES) -> None:
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._granter: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._granter is not None:
+            self._granter.cancel()
+            self._granter = None
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= SENDER_MAX_CHAT_BUCKETS:
+                # Полное ведро ничем не отличается от нового, его можно выбросить
+                self._chats = {key: value for key, value in self._chats.items() if not value.full}
+            # Группы и каналы (отрицательные id и @username) ограничены строже личных чатов
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = self._chats[chat_id] = (TokenBucket(SENDER_GROUP_RATE, SENDER_GROUP_BURST) if is_group
+                                             else TokenBucket(SENDER_CHAT_RATE, SENDER_CHAT_BURST))
+        return bucket
+
+    async def _acquire_chat(self, chat_id: Union[int, str]) -> None:
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            delay = bucket.delay()
+            if delay <= 0:
+                bucket.take()
+                return
+            await asyncio.sleep(delay)
+
+    async def _acquire_global(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._granter is None or self._granter.done():
+            self._granter = asyncio.create_task(self._grant())
+        await future
+
+    async def _grant(self) -> None:
+        while self._waiters:
+            delay = max(self._paused_until - time.monotonic(), self._global.delay())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._global.take()
+                future.set_result(None)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        priority = Priority.INTERACTIVE if rate_limit_args is None else rate_limit_args
+        chat_id = data.get('chat_id')
+        limited = _is_limited(endpoint)
+        attempt = 0
+        while True:
+            if limited:
+                if chat_id is not None:
+                    await self._acquire_chat(chat_id)
+                await self._acquire_global(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                RETRY_AFTER_TOTAL.inc()
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                # Флуд-контроль Telegram действует на весь бот: приостанавливаем все отправки
+                retry_after = float(e.retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                logger.warning(f"{endpoint} hit flood control, retrying in {retry_after:.0f} s.")
+                await asyncio.sleep(retry_after)
+
+
+@dataclass
+class _OutgoingText:
+    chat_id: int
+    text: str
+    priority: int
+    kwargs: Dict[str, Any]
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+    def can_merge(self, text: str, kwargs: Dict[str, Any]) -> bool:
+        return not self.kwargs and not kwargs and len(self.text) + 2 + len(text) <= MAX_MESSAGE_LENGTH
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # Ошибки уже записаны в лог; вызывающий код может не ждать результата
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundSender:
+    """Очередь исходящих текстов с объединением подряд идущих сообщений в один чат.
+
+    Сообщения в один чат уходят по одному и по порядку. Тексты, поставленные
+    в очередь, пока предыдущее сообщение этого чата еще не отправлено (или в
+    одном шаге обработчика), склеиваются в одно сообщение.
+    """
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        self._queues: Dict[int, Deque[_OutgoingText]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def send_text(self, chat_id: int, text: str, priority: int = Priority.INTERACTIVE,
+                  **kwargs: Any) -> 'asyncio.Future[Message]':
+        """Ставит текст в очередь; future завершается отправленным сообщением."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve_exception)
+        queue = self._queues.setdefault(chat_id, deque())
+        if queue and queue[-1].can_merge(text, kwargs):
+            last = queue[-1]
+            last.text = f'{last.text}\n\n{text}'
+            last.priority = min(last.priority, priority)
+            last.futures.append(future)
+            self.coalesced += 1
+        else:
+            queue.append(_OutgoingText(chat_id, text, priority, kwargs, [future]))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain_chat(chat_id))
+        return future
+
+    async def _drain_chat(self, chat_id: int) -> None:
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                # Отправляемый текст уже не меняется: новые тексты склеиваются со следующим
+                item = queue.popleft()
+                try:
+                    message = await self.bot.send_message(
+                        item.chat_id, item.text, rate_limit_args=item.priority, **item.kwargs)
+                except Exception as e:
+                    logger.warning(f"Failed to send message to {chat_id}: {e}")
+                    for future in item.futures:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for future in item.futures:
+                    if not future.done():
+                        future.set_result(message)
+        finally:
+            del self._workers[chat_id]
+            del self._queues[chat_id]
+
+    async def stop(self) -> None:
+        """Дожидается отправки всего, что уже стоит в очереди."""
+        while self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+
+_sender: Optional[OutboundSender] = None
+
+
+def sender_queue_depth() -> int:
+    return len(_sender) if _sender is not None else 0
+
+
+Gauge('sleepbot_sender_queue_depth', 'Исходящие сообщения, ожидающие отправки', callback=sender_queue_depth)
+CallbackCounter('sleepbot_sender_coalesced_total', 'Тексты, склеенные с предыдущим сообщением в тот же чат',
+                callback=lambda: _sender.coalesced if _sender is not None else 0)
+
+
+def get_sender() -> OutboundSender:
+    if _sender is None:
+        raise RuntimeError('Sender is not started. Call start_sender() first.')
+    return _sender
+
+
+async def start_sender(application: Application) -> None:
+    """Создает очередь исходящих сообщений для бота приложения."""
+    global _sender
+    if _sender is None:
+        _sender = OutboundSender(application.bot)
+
+
+async def stop_sender(_: Optional[Application] = None) -> None:
+    """Досылает сообщения из очереди; вызывается до остановки бота."""
+    global _sender
+    if _sender is None:
+        return
+    sender, _sender = _sender, None
+    await sender.stop()
@@ -0,0 +1,108 @@
+import logging
+from collections import OrderedDict
+from typing import List, Tuple
+
+from telegram import InlineQueryResultArticle, InlineQueryResultsButton, InputTextMessageContent, Update
+from telegram.ext import ContextTypes
+from config import INLINE_CACHE_TIME, INLINE_CACHE_SIZE
+from db import UserSleepStats, get_user_stats
+import achievements
+from metrics import Gauge, CallbackCounter
+
+logger = logging.getLogger(__name__)
+
+# (data_version, маска достижений) — при изменении любого из них карточки строятся заново
+ShareVersion = Tuple[int, int]
+
+
+def _stats_card(stats: UserSleepStats, earned: int) -> InlineQueryResultArticle:
+    days = min(stats.entry_count, 7)
+    avg_hours = stats.duration_sum_7 / days / 60
+    text = (f'📊 Мой сон: {stats.entry_count} записей, в среднем {avg_hours:.1f} ч за последние {days} ночей, '
+            f'достижений: {earned} из {len(achievements.RULES)}.')
+    return InlineQueryResultArticle(
+        id=f'stats-v{stats.data_version}',
+        title='Моя статистика сна',
+        description=text[2:],
+        input_message_content=InputTextMessageContent(text),
+    )
+
+
+def build_share_results(stats: UserSleepStats, mask: int) -> List[InlineQueryResultArticle]:
+    """Карточки для inline-режима: по одной на каждое полученное достижение и карточка статистики.
+
+    id стабильны (ach-<ключ правила>, stats-v<data_version>), поэтому Telegram
+    может кэшировать их между запросами.
+    """
+    rules = achievements.earned_rules(mask)
+    results = [
+        InlineQueryResultArticle(
+            id=f'ach-{rule.key}',
+            title=f'Достижение «{rule.name}»',
+            description='Поделиться достижением',
+            input_message_content=InputTextMessageContent(
+                f'🎉 Я получил достижение «{rule.name}» в боте для отслеживания сна!'),
+        )
+        for rule in rules
+    ]
+    results.append(_stats_card(stats, len(rules)))
+    return results
+
+
+class ShareCache:
+    """LRU готовых карточек по пользователям: user_id -> (версия, карточки)."""
+
+    def __init__(self, max_entries: int = INLINE_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self.builds = 0
+        self._entries: 'OrderedDict[int, Tuple[ShareVersion, List[InlineQueryResultArticle]]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int, stats: UserSleepStats, mask: int) -> List[InlineQueryResultArticle]:
+        version = (stats.data_version, mask)
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(user_id)
+            return entry[1]
+        results = build_share_results(stats, mask)
+        self.builds += 1
+        self._entries[user_id] = (version, results)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return results
+
+
+share_cache = ShareCache()
+
+Gauge('sleepbot_share_cache_entries', 'Пользователи с готовыми карточками inline-режима', callback=lambda: len(share_cache))
+CallbackCounter('sleepbot_share_cache_builds_total', 'Сколько раз карточки inline-режима строились заново',
+                callback=lambda: share_cache.builds)
+
+
+def _filter(results: List[InlineQueryResultArticle], query: str) -> List[InlineQueryResultArticle]:
+    """Оставляет карточки, в заголовке которых есть все слова запроса; если таких нет — все карточки."""
+    words = query.lower().split()
+    if not words:
+        return results
+    matched = [result for result in results if all(word in result.title.lower() for word in words)]
+    return matched or results
+
+
+async def share_achievement(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отвечает на inline-запрос готовыми карточками достижений и статистики пользователя."""
+    inline_query = update.inline_query
+    user_id = inline_query.from_user.id
+    stats = await get_user_stats(user_id)
+    if stats is None:
+        # Пустой ответ не кэшируется: после первой записи о сне карточки должны появиться сразу
+        await inline_query.answer(
+            [], cache_time=0, is_personal=True,
+            button=InlineQueryResultsButton(text='Записать первый сон', start_parameter='share'))
+        return
+
+    mask = await achievements.get_earned_mask(user_id)
+    results = _filter(share_cache.get(user_id, stats, mask), inline_query.query)
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
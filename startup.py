@@ -0,0 +1,53 @@
+import logging
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Длительности последовательных этапов запуска: импорты, создание application, шаги post_init."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        # Время по часам системы, чтобы внешний процесс мог посчитать запуск вместе с интерпретатором
+        self.started_wall = time.time()
+        self.stages: List[Tuple[str, float]] = []
+        self._last = self.started
+        self.finished: Optional[float] = None
+
+    def lap(self, name: str) -> None:
+        """Завершает этап name: его длительность — время с конца предыдущего этапа."""
+        now = time.perf_counter()
+        self.stages.append((name, now - self._last))
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def finish(self, budget: Optional[float] = None) -> None:
+        """Отмечает готовность бота и пишет отчет в лог; при превышении бюджета — предупреждение."""
+        self.finished = time.time()
+        level = logging.WARNING if budget is not None and self.total > budget else logging.INFO
+        logger.log(level, self.report(budget))
+
+    def report(self, budget: Optional[float] = None) -> str:
+        lines = [f'Startup took {self.total * 1000:.0f} ms'
+                 + (f' (budget {budget * 1000:.0f} ms):' if budget is not None else ':')]
+        for name, seconds in self.stages:
+            lines.append(f'  {name:<32} {seconds * 1000:8.1f} ms')
+        return '\n'.join(lines)
+
+    def as_dict(self) -> dict:
+        return {
+            'started_wall': self.started_wall,
+            'finished_wall': self.finished,
+            'total_s': self.total,
+            'stages': {name: seconds for name, seconds in self.stages},
+        }
+
+
+# Модуль импортируется в main.py первым и не зависит от модулей бота,
+# поэтому отсчет начинается до загрузки telegram и остальных зависимостей
+startup_timer = StartupTimer()
@@ -0,0 +1,43 @@
+"""Колоды советов: без повторов и пропусков, версия переживает перезапуск."""
+import asyncio
+
+from content import ContentStore
+
+COUNT = 7
+
+
+def _store(path) -> ContentStore:
+    store = ContentStore({'tips': (str(path), 'lines')})
+    asyncio.run(store.load())
+    return store
+
+
+def test_every_deck_is_a_full_permutation(tmp_path) -> None:
+    path = tmp_path / 'tips.txt'
+    path.write_text('\n'.join(f'Совет {i}' for i in range(COUNT)), encoding='utf-8')
+    store = _store(path)
+    state, drawn = None, []
+    for _ in range(COUNT * 50):
+        tip, state = store.draw('tips', state)
+        drawn.append(tip)
+    for start in range(0, len(drawn), COUNT):
+        assert sorted(drawn[start:start + COUNT]) == sorted(store.lines('tips'))
+        if start:
+            assert drawn[start] != drawn[start - 1]
+
+
+def test_deck_survives_restart_only_while_file_is_unchanged(tmp_path) -> None:
+    path = tmp_path / 'tips.txt'
+    path.write_text('\n'.join(f'Совет {i}' for i in range(COUNT)), encoding='utf-8')
+    state = None
+    drawn = []
+    for _ in range(3):
+        tip, state = _store(path).draw('tips', state)
+        drawn.append(tip)
+    assert len(set(drawn)) == 3
+
+    path.write_text('\n'.join(f'Новый совет {i}' for i in range(COUNT)), encoding='utf-8')
+    store = _store(path)
+    _, new_state = store.draw('tips', state)
+    # Колода начата заново: позиция 1, а не продолжение со старой позиции 4
+    assert new_state & 0xFFFFF == 1
@@ -0,0 +1,60 @@
+"""HttpServer отвечает на некорректные запросы и не зависает на молчащих клиентах."""
+import asyncio
+
+import http_server
+from http_server import HttpServer, Response
+
+
+async def _ok(request) -> Response:
+    return Response(200, b'ok')
+
+
+async def _request(server: HttpServer, data: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def test_oversized_header_gets_431() -> None:
+    async def scenario() -> bytes:
+        server = HttpServer('127.0.0.1', 0)
+        server.route('GET', '/', _ok)
+        await server.start()
+        try:
+            return await _request(server, b'GET / HTTP/1.1\r\nX-Big: ' + b'a' * 200 * 1024 + b'\r\n\r\n')
+        finally:
+            await server.stop()
+
+    assert asyncio.run(scenario()).startswith(b'HTTP/1.1 431 ')
+
+
+def test_silent_client_gets_408(monkeypatch) -> None:
+    monkeypatch.setattr(http_server, 'READ_TIMEOUT', 0.2)
+
+    async def scenario() -> bytes:
+        server = HttpServer('127.0.0.1', 0)
+        server.route('GET', '/', _ok)
+        await server.start()
+        try:
+            return await _request(server, b'')
+        finally:
+            await server.stop()
+
+    assert asyncio.run(scenario()).startswith(b'HTTP/1.1 408 ')
+
+
+def test_stop_does_not_wait_for_silent_client(monkeypatch) -> None:
+    monkeypatch.setattr(http_server, 'STOP_TIMEOUT', 0.2)
+
+    async def scenario() -> None:
+        server = HttpServer('127.0.0.1', 0)
+        server.route('GET', '/', _ok)
+        await server.start()
+        await asyncio.open_connection(server.host, server.port)
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(server.stop(), 2)
+
+    asyncio.run(scenario())
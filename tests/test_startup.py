@@ -0,0 +1,22 @@
+"""Холодный запуск бота укладывается в бюджет STARTUP_BUDGET."""
+import os
+
+from benchmarks.coldstart import measure_cold_start, summarize
+from benchmarks.datagen import generate_database
+from config import STARTUP_BUDGET
+
+RUNS = 3
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_cold_start_within_budget(tmp_path, monkeypatch) -> None:
+    # Бот запускается в дочерних процессах через python -c: модули ищутся в текущем каталоге
+    monkeypatch.chdir(ROOT)
+    path = str(tmp_path / 'sleepbot.db')
+    generate_database(path, 1000)
+
+    summary = summarize(measure_cold_start(path, RUNS))
+
+    stages = ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, seconds in summary['stages'].items())
+    assert summary['wall_s'] <= STARTUP_BUDGET, (
+        f"Холодный запуск {summary['wall_s']:.2f} с превышает бюджет {STARTUP_BUDGET:.2f} с: {stages}")
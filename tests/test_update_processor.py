@@ -0,0 +1,148 @@
+"""PerUserUpdateProcessor с настоящими Application и ConversationHandler: перемешанные обновления многих пользователей."""
+import asyncio
+import json
+import random
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ConversationHandler, ContextTypes, MessageHandler, filters
+from telegram.request import BaseRequest, RequestData
+
+from update_processor import PerUserUpdateProcessor
+
+USERS = 40
+ROUNDS = 3
+TIPS = 12
+LOGGING_SLEEP, LOGGING_WAKE = range(2)
+
+
+class OfflineRequest(BaseRequest):
+    """Отвечает на getMe без сети; другие запросы тесту не нужны."""
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         *args, **kwargs) -> Tuple[int, bytes]:
+        bot = {'id': 1, 'is_bot': True, 'first_name': 'Test', 'username': 'test_bot'}
+        return 200, json.dumps({'ok': True, 'result': bot}).encode()
+
+
+def _message(user_id: int, message_id: int, text: str) -> dict:
+    message = {'message_id': message_id, 'date': 0, 'text': text,
+               'from': {'id': user_id, 'is_bot': False, 'first_name': 'U'},
+               'chat': {'id': user_id, 'type': 'private'}}
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return message
+
+
+def _scripts() -> Dict[int, List[str]]:
+    """ROUNDS полных записей сна с советами между шагами и одна незавершенная запись в конце."""
+    scripts = {}
+    for user_id in range(1, USERS + 1):
+        steps = []
+        for round_ in range(ROUNDS):
+            steps += ['/log_sleep', f'23:{user_id % 60:02d}', '/tips', f'0{round_ + 6}:{user_id % 60:02d}', '/tips']
+        steps += ['/log_sleep', f'22:{user_id % 60:02d}']
+        scripts[user_id] = steps
+    return scripts
+
+
+def _interleave(scripts: Dict[int, List[str]], rng: random.Random) -> List[Update]:
+    """Перемешивает шаги пользователей, сохраняя порядок шагов каждого; message_id — номер шага пользователя."""
+    positions = {user_id: 0 for user_id in scripts}
+    updates = []
+    while positions:
+        user_id = rng.choice(list(positions))
+        step = positions[user_id]
+        updates.append({'update_id': len(updates) + 1,
+                        'message': _message(user_id, step, scripts[user_id][step])})
+        if step + 1 == len(scripts[user_id]):
+            del positions[user_id]
+        else:
+            positions[user_id] = step + 1
+    return updates
+
+
+def test_interleaved_conversations_keep_per_user_order() -> None:
+    rng = random.Random(0)
+    scripts = _scripts()
+    seen: Dict[int, List[int]] = defaultdict(list)
+    saved: Dict[int, List[Tuple[str, str]]] = defaultdict(list)
+
+    async def pause() -> None:
+        # Случайные паузы внутри обработчиков дают другим обновлениям шанс вклиниться
+        await asyncio.sleep(rng.uniform(0, 0.002))
+
+    def record(update: Update) -> None:
+        seen[update.effective_user.id].append(update.message.message_id)
+
+    async def log_sleep(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        record(update)
+        await pause()
+        return LOGGING_SLEEP
+
+    async def log_wake(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        record(update)
+        await pause()
+        context.user_data['sleep_time'] = update.message.text
+        return LOGGING_WAKE
+
+    async def save_sleep_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        record(update)
+        sleep_time = context.user_data['sleep_time']
+        await pause()
+        saved[update.effective_user.id].append((sleep_time, update.message.text))
+        del context.user_data['sleep_time']
+        return ConversationHandler.END
+
+    async def send_tips(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        # Чтение и запись колоды разделены await, как в handlers.send_tips: конкурентный вызов потерял бы совет
+        record(update)
+        deck = context.user_data.get('tip_deck') or list(range(TIPS))
+        await pause()
+        context.user_data.setdefault('tips_drawn', []).append(deck[0])
+        context.user_data['tip_deck'] = deck[1:]
+
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler('log_sleep', log_sleep)],
+        states={
+            LOGGING_SLEEP: [MessageHandler(filters.TEXT & ~filters.COMMAND, log_wake)],
+            LOGGING_WAKE: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_sleep_data)],
+        },
+        fallbacks=[CommandHandler('log_sleep', log_sleep)],
+    )
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8, max_pending_updates=64)
+    application = (Application.builder().token('1:test').request(OfflineRequest())
+                   .get_updates_request(OfflineRequest()).concurrent_updates(processor).build())
+    application.add_handler(conversation)
+    application.add_handler(CommandHandler('tips', send_tips), group=1)
+
+    async def run() -> None:
+        async with application:
+            await application.start()
+            for data in _interleave(scripts, rng):
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            while sum(map(len, seen.values())) < sum(map(len, scripts.values())):
+                await asyncio.sleep(0.01)
+            await application.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 60))
+
+    for user_id, steps in scripts.items():
+        # Каждый шаг обработан ровно один раз и в порядке отправки
+        assert seen[user_id] == list(range(len(steps)))
+        minute = f'{user_id % 60:02d}'
+        assert saved[user_id] == [(f'23:{minute}', f'0{round_ + 6}:{minute}') for round_ in range(ROUNDS)]
+        user_data = application.user_data[user_id]
+        # Незавершенная запись: ждем время пробуждения, время отхода ко сну сохранено
+        assert conversation._conversations[(user_id, user_id)] == LOGGING_WAKE
+        assert user_data['sleep_time'] == f'22:{minute}'
+        assert user_data['tips_drawn'] == list(range(2 * ROUNDS))
+        assert user_data['tip_deck'] == list(range(2 * ROUNDS, TIPS))
+    assert processor.waiting == 0
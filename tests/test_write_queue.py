@@ -0,0 +1,23 @@
+"""Очередь записи сохраняет порядок разных запросов внутри одной транзакции."""
+import asyncio
+
+import db
+
+
+def test_writes_keep_submission_order(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(db, 'DB_FILE', str(tmp_path / 'sleepbot.db'))
+
+    async def scenario():
+        await db.init_db()
+        try:
+            # Все три записи попадают в одну пачку: последняя должна победить
+            await asyncio.gather(
+                db.upsert_reminder(1, 1, 420, 1380, 480),
+                db.delete_reminder(1),
+                db.upsert_reminder(1, 1, 450, 1410, 510),
+            )
+            return await db.get_reminder(1)
+        finally:
+            await db.close_db()
+
+    assert tuple(asyncio.run(scenario())) == (1410, 510)
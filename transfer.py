@@ -0,0 +1,317 @@
+import csv
+import io
+import itertools
+import json
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
+from config import IMPORT_MAX_FILE_SIZE, IMPORT_MAX_ROWS, IMPORT_CHUNK_SIZE, EXPORT_FETCH_SIZE
+from db import import_sleep_rows, stream_sleep_data, get_user_stats
+from utils import is_valid_time, time_to_minutes, format_minutes, date_to_day, day_to_date, today_day
+from report_cache import report_cache
+import achievements
+
+logger = logging.getLogger(__name__)
+
+# Состояние ConversationHandler импорта
+WAITING_FILE = 0
+
+# Колонки файла; экспорт пишет их же, поэтому выгрузку можно загрузить обратно
+FIELDS = ('date', 'sleep_time', 'wake_time')
+
+_COLUMN_ALIASES = {
+    'user_id': 'user_id',
+    'date': 'date', 'day': 'date', 'дата': 'date',
+    'sleep_time': 'sleep_time', 'sleep': 'sleep_time', 'bedtime': 'sleep_time', 'отход': 'sleep_time',
+    'wake_time': 'wake_time', 'wake': 'wake_time', 'подъем': 'wake_time',
+}
+
+_JSON_SEPARATORS = ' \t\r\n,[]'
+_JSON_READ_SIZE = 64 * 1024
+# Сколько ошибок в строках показывать пользователю
+_MAX_REPORTED_ERRORS = 5
+
+
+class ImportFormatError(ValueError):
+    """Файл нельзя разобрать целиком: неизвестный формат, битый JSON и т. п."""
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    skipped: int = 0
+    truncated: bool = False
+    # Ошибка формата, на которой чтение файла остановилось
+    error: Optional[str] = None
+    errors: List[str] = field(default_factory=list)
+    users: Set[int] = field(default_factory=set)
+    new_achievements: Dict[int, List[str]] = field(default_factory=dict)
+
+
+def detect_format(filename: str) -> str:
+    """Формат файла по расширению: 'csv' или 'json' (JSON-массив или JSON Lines)."""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('csv', 'txt'):
+        return 'csv'
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'json'
+    raise ImportFormatError('Поддерживаются файлы CSV и JSON.')
+
+
+def iter_csv_records(stream: TextIO) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Читает CSV построчно и отдает (номер строки, запись).
+
+    Первая строка — заголовок с названиями колонок; если в ней нет колонки
+    с датой, колонки считаются позиционными: дата, отход ко сну, подъем.
+    Разделитель — запятая или точка с запятой (как сохраняет Excel).
+    """
+    first = stream.readline()
+    delimiter = ';' if first.count(';') > first.count(',') else ','
+    header = next(csv.reader([first], delimiter=delimiter), [])
+    columns = [_COLUMN_ALIASES.get(name.strip().lower()) for name in header]
+    reader = csv.reader(stream, delimiter=delimiter)
+    # Заголовок прочитан до reader, поэтому его номера строк сдвинуты на одну
+    rows: Iterator[Tuple[int, List[str]]] = ((reader.line_num + 1, row) for row in reader)
+    if 'date' not in columns:
+        columns = list(FIELDS)
+        rows = itertools.chain([(1, header)], rows)
+    for line, row in rows:
+        if not any(cell.strip() for cell in row):
+            continue
+        yield line, {column: cell.strip() for column, cell in zip(columns, row) if column}
+
+
+def iter_json_records(stream: TextIO) -> Iterator[Tuple[int, Dict]]:
+    """Читает JSON-массив объектов или JSON Lines по частям и отдает (номер записи, объект).
+
+    Файл не разбирается целиком: объекты декодируются по одному из буфера,
+    который дочитывается блоками по мере необходимости.
+    """
+    decoder = json.JSONDecoder()
+    buffer, index, number, eof = '', 0, 0, False
+    while True:
+        while index < len(buffer) and buffer[index] in _JSON_SEPARATORS:
+            index += 1
+        if index < len(buffer):
+            try:
+                record, index = decoder.raw_decode(buffer, index)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ImportFormatError(f'Некорректный JSON после записи {number}: {e.msg}.')
+            else:
+                number += 1
+                yield number, record
+                continue
+        elif eof:
+            return
+        chunk = stream.read(_JSON_READ_SIZE)
+        eof = not chunk
+        buffer = buffer[index:] + chunk
+        index = 0
+
+
+def iter_records(stream: TextIO, file_format: str) -> Iterator[Tuple[int, Dict]]:
+    if file_format == 'csv':
+        return iter_csv_records(stream)
+    return iter_json_records(stream)
+
+
+def _parse_date(value: str) -> date:
+    for pattern in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, pattern).date()
+        except ValueError:
+            continue
+    raise ValueError(f'некорректная дата «{value}»')
+
+
+def parse_record(record: object, user_id: Optional[int] = None) -> Tuple[int, int, int, int]:
+    """Проверяет запись и возвращает (user_id, day, sleep_min, wake_min).
+
+    user_id — владелец импорта; если он не задан, берется из колонки user_id.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('ожидался объект с полями date, sleep_time, wake_time')
+    values = {_COLUMN_ALIASES.get(str(key).lower()): str(value).strip() for key, value in record.items()}
+    missing = [name for name in FIELDS if not values.get(name)]
+    if missing:
+        raise ValueError(f'нет полей {", ".join(missing)}')
+
+    day = date_to_day(_parse_date(values['date']))
+    if day > today_day():
+        raise ValueError(f'дата {values["date"]} еще не наступила')
+    for name in ('sleep_time', 'wake_time'):
+        if not is_valid_time(values[name]):
+            raise ValueError(f'некорректное время «{values[name]}»')
+
+    if user_id is None:
+        try:
+            user_id = int(values.get('user_id') or '')
+        except ValueError:
+            raise ValueError('нет user_id') from None
+    return user_id, day, time_to_minutes(values['sleep_time']), time_to_minutes(values['wake_time'])
+
+
+async def _recompute_after_import(result: ImportResult) -> None:
+    """Один пересчет достижений и сброс кэшей на пользователя после всего импорта."""
+    for user_id in result.users:
+        report_cache.invalidate_user(user_id)
+        achievements.forget_user(user_id)
+        new_achievements = await achievements.check_achievements(user_id)
+        if new_achievements:
+            result.new_achievements[user_id] = new_achievements
+
+
+async def import_records(records: Iterator[Tuple[int, Dict]], user_id: Optional[int] = None,
+                         chunk_size: int = IMPORT_CHUNK_SIZE, max_rows: int = IMPORT_MAX_ROWS) -> ImportResult:
+    """Импортирует записи пачками по chunk_size, каждая пачка — одна транзакция.
+
+    Запись за уже существующий день заменяет ее (upsert по idx_sleep_unique_user_date).
+    Некорректные записи пропускаются. Если файл оборвался с ошибкой формата,
+    уже прочитанные записи остаются сохраненными, а ошибка попадает в result.error.
+    """
+    result = ImportResult()
+    chunk: List[Tuple[int, int, int, int]] = []
+    try:
+        for number, record in records:
+            try:
+                row = parse_record(record, user_id)
+            except ValueError as e:
+                result.skipped += 1
+                if len(result.errors) < _MAX_REPORTED_ERRORS:
+                    result.errors.append(f'{number}: {e}')
+                continue
+            if result.imported + len(chunk) >= max_rows:
+                result.truncated = True
+                break
+            chunk.append(row)
+            result.users.add(row[0])
+            if len(chunk) >= chunk_size:
+                await import_sleep_rows(chunk)
+                result.imported += len(chunk)
+                chunk = []
+    except ImportFormatError as e:
+        result.error = str(e)
+    except UnicodeDecodeError:
+        result.error = 'Файл должен быть в кодировке UTF-8.'
+    finally:
+        if chunk:
+            await import_sleep_rows(chunk)
+            result.imported += len(chunk)
+        await _recompute_after_import(result)
+    logger.info(f"Imported {result.imported} sleep entries for {len(result.users)} users, skipped {result.skipped}.")
+    return result
+
+
+async def export_chunks(user_id: Optional[int], file_format: str = 'csv',
+                        batch_size: int = EXPORT_FETCH_SIZE) -> AsyncIterator[str]:
+    """Отдает выгрузку истории сна частями текста, не загружая историю целиком.
+
+    user_id=None — все пользователи, с дополнительной колонкой user_id.
+    """
+    columns = FIELDS if user_id is not None else ('user_id',) + FIELDS
+    if file_format == 'csv':
+        yield ','.join(columns) + '\n'
+    else:
+        yield '['
+    separator = '\n'
+    async for rows in stream_sleep_data(user_id, batch_size):
+        lines = []
+        for row_user_id, sleep_min, wake_min, _, day in rows:
+            values = (day_to_date(day).isoformat(), format_minutes(sleep_min), format_minutes(wake_min))
+            if user_id is None:
+                values = (row_user_id,) + values
+            if file_format == 'csv':
+                lines.append(','.join(map(str, values)) + '\n')
+            else:
+                lines.append(separator + json.dumps(dict(zip(columns, values))))
+                separator = ',\n'
+        yield ''.join(lines)
+    if file_format != 'csv':
+        yield '\n]\n'
+
+
+async def import_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text(
+        'Пришлите файл CSV или JSON с историей сна.\n\n'
+        'CSV: колонки date, sleep_time, wake_time, например\n'
+        '2024-05-01,23:30,07:15\n'
+        'JSON: [{"date": "2024-05-01", "sleep_time": "23:30", "wake_time": "07:15"}, ...]\n\n'
+        'Записи за уже заполненные дни будут заменены. Отмена: /cancel'
+    )
+    return WAITING_FILE
+
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Импортирует присланный файл в историю сна пользователя."""
+    user_id = update.effective_user.id
+    document = update.message.document
+    try:
+        file_format = detect_format(document.file_name or '')
+    except ImportFormatError as e:
+        await update.message.reply_text(f'{e} Пришлите другой файл или /cancel.')
+        return WAITING_FILE
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await update.message.reply_text(
+            f'Файл слишком большой: максимум {IMPORT_MAX_FILE_SIZE // 1024 ** 2} МБ.')
+        return WAITING_FILE
+
+    # Bot API отдает файл целиком; разбор и запись идут потоково по пачкам
+    telegram_file = await document.get_file()
+    data = await telegram_file.download_as_bytearray()
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+    logger.info(f"User {user_id} is importing {document.file_name} ({len(data)} bytes).")
+    result = await import_records(iter_records(stream, file_format), user_id)
+
+    lines = [f'Импортировано записей: {result.imported}.']
+    if result.error:
+        lines.append(f'Чтение файла остановлено: {result.error}')
+    if result.skipped:
+        lines.append(f'Пропущено некорректных: {result.skipped}.')
+        lines.extend(f'  Запись {error}' for error in result.errors)
+    if result.truncated:
+        lines.append(f'Импорт остановлен на {IMPORT_MAX_ROWS} записях.')
+    if result.new_achievements.get(user_id):
+        lines.append(f'Новые достижения: {", ".join(result.new_achievements[user_id])}')
+    await update.message.reply_text('\n'.join(lines))
+    return ConversationHandler.END
+
+
+async def import_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.message.reply_text('Импорт отменен.')
+    return ConversationHandler.END
+
+
+def get_import_conv_handler() -> ConversationHandler:
+    """Возвращает ConversationHandler для импорта истории сна из файла."""
+    return ConversationHandler(
+        entry_points=[CommandHandler('import', import_start)],
+        states={
+            WAITING_FILE: [MessageHandler(filters.Document.ALL, import_document)],
+        },
+        fallbacks=[CommandHandler('cancel', import_cancel)],
+        name='import',
+        persistent=True,
+    )
+
+
+async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отправляет пользователю всю его историю сна файлом CSV."""
+    user_id = update.effective_user.id
+    if await get_user_stats(user_id) is None:
+        await update.message.reply_text('История сна пока пуста.')
+        return
+
+    # Небольшие выгрузки остаются в памяти, большие уходят во временный файл
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_MAX_FILE_SIZE) as file:
+        async for chunk in export_chunks(user_id):
+            file.write(chunk.encode('utf-8'))
+        file.seek(0)
+        await update.message.reply_document(
+            document=file, filename=f'sleep_history_{date.today().isoformat()}.csv',
+            caption='Ваша история сна. Этот файл можно загрузить обратно командой /import.')
@@ -0,0 +1,92 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import UPDATE_CONCURRENCY, UPDATE_MAX_PENDING
+from metrics import Gauge
+
+
+def _update_key(update: object) -> Optional[Hashable]:
+    """Ключ сериализации: пользователь, а для обновлений без пользователя — чат."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return ('user', update.effective_user.id)
+    if update.effective_chat is not None:
+        return ('chat', update.effective_chat.id)
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных пользователей параллельно, а одного пользователя — строго по очереди.
+
+    Обновления одного пользователя выполняются в порядке поступления, поэтому
+    состояние ConversationHandler и context.user_data (включая колоды советов
+    и упражнений) не меняются конкурентно. Ограничение на число одновременных обработок
+    проверяется уже после очереди пользователя: ждущие обновления одного
+    пользователя не занимают слоты остальных.
+    """
+
+    def __init__(self, max_concurrent_updates: int = UPDATE_CONCURRENCY,
+                 max_pending_updates: int = UPDATE_MAX_PENDING) -> None:
+        self._running_limit = max_concurrent_updates
+        # Семафор базового класса ограничивает только количество принятых в работу обновлений
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._queued: Dict[Hashable, int] = {}
+        self.waiting = 0
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._running_limit
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = _update_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        # Блокировка берется до первого await, поэтому обновления встают в очередь пользователя в порядке поступления
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._queued[key] = self._queued.get(key, 0) + 1
+        self.waiting += 1
+        started = False
+        try:
+            async with lock:
+                async with self._slots:
+                    self.waiting -= 1
+                    started = True
+                    await coroutine
+        finally:
+            if not started:
+                self.waiting -= 1
+            if self._queued[key] == 1:
+                del self._queued[key]
+                del self._locks[key]
+            else:
+                self._queued[key] -= 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+_processor: Optional[PerUserUpdateProcessor] = None
+
+
+def get_update_processor() -> PerUserUpdateProcessor:
+    global _processor
+    if _processor is None:
+        _processor = PerUserUpdateProcessor()
+    return _processor
+
+
+Gauge('sleepbot_updates_waiting', 'Обновления, ожидающие своей очереди на обработку',
+      callback=lambda: _processor.waiting if _processor is not None else 0)
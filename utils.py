@@ -1,53 +1,52 @@
 import os
-import random
 import re
-from datetime import datetime, timedelta
-from typing import List
+from datetime import date
+from typing import Optional
 from dotenv import load_dotenv, dotenv_values
-import aiofiles
 
 
-async def load_lines(filename: str) -> List[str]:
-    try:
-        async with aiofiles.open(filename, 'r', encoding='utf-8') as file:
-            lines = [line.strip() for line in await file.readlines() if line.strip()]
-        return lines
-    except FileNotFoundError:
-        return []
+def is_valid_time(time_str: str) -> bool:
+    match = re.match(r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$', time_str)
+    return bool(match)
 
 
-async def load_tips(filename: str = 'sleep_tips.txt') -> List[str]:
-    return await load_lines(filename)
+def time_to_minutes(time_str: str) -> int:
+    """Переводит 'ЧЧ:ММ' в минуты от полуночи."""
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
 
 
-async def load_exercises(filename: str = 'sleep_exercises.txt') -> List[str]:
-    return await load_lines(filename)
+def format_minutes(minutes: int) -> str:
+    """Переводит минуты от полуночи в 'ЧЧ:ММ'."""
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
 
 
-def is_valid_time(time_str: str) -> bool:
-    match = re.match(r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$', time_str)
-    return bool(match)
+def shift_morning_minutes(minutes: int) -> int:
+    """Сдвигает утренние часы (до 12:00) на сутки вперед для сравнения с вечерними."""
+    if minutes < 12 * 60:
+        return minutes + 24 * 60
+    return minutes
+
+
+def sleep_duration_minutes(sleep_minutes: int, wake_minutes: int) -> int:
+    """Длительность сна в минутах с учетом перехода через полночь."""
+    return (wake_minutes - sleep_minutes) % (24 * 60)
 
 
-def choose_random_non_repeating(user_last_map: dict, user_id: int, items: List[str]) -> str | None:
-    if not items:
-        return None
-    choice = random.choice(items)
-    # Avoid repeating previous item for the same user
-    if user_id in user_last_map and len(items) > 1:
-        while choice == user_last_map[user_id]:
-            choice = random.choice(items)
-    user_last_map[user_id] = choice
-    return choice
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
 
 
-def calculate_sleep_duration(sleep_time: str, wake_time: str) -> float:
-    sleep_dt = datetime.strptime(sleep_time, '%H:%M')
-    wake_dt = datetime.strptime(wake_time, '%H:%M')
-    if wake_dt < sleep_dt:
-        wake_dt += timedelta(days=1)
-    duration = (wake_dt - sleep_dt).seconds / 3600
-    return duration
+def date_to_day(value: date) -> int:
+    """Номер дня от 1970-01-01, в котором даты хранятся в базе."""
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def day_to_date(day: int) -> date:
+    return date.fromordinal(day + _EPOCH_ORDINAL)
+
+
+def today_day() -> int:
+    return date_to_day(date.today())
 
 
 def get_token_from_dotenv_file() -> str:
@@ -57,3 +56,9 @@ def get_token_from_dotenv_file() -> str:
         return token
     raise RuntimeError('Telegram bot token is not set in .env file.')
 
+
+def get_api_url_from_dotenv_file() -> Optional[str]:
+    """Адрес Bot API из TELEGRAM_API_URL (например, локальный сервер для нагрузочных тестов); None — api.telegram.org."""
+    config = dotenv_values(".env")
+    return config.get('TELEGRAM_API_URL') or None
+
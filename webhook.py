@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import signal
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import dotenv_values
+from telegram import Update
+from telegram.ext import Application
+
+from config import WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_MAX_CONNECTIONS
+from http_server import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+@dataclass
+class WebhookSettings:
+    url: Optional[str]           # Публичный адрес для setWebhook; None — не регистрировать вебхук
+    listen: str = WEBHOOK_LISTEN
+    port: int = WEBHOOK_PORT
+    path: str = WEBHOOK_PATH
+    secret_token: Optional[str] = None
+    max_connections: int = WEBHOOK_MAX_CONNECTIONS
+
+
+def get_webhook_settings_from_dotenv_file() -> Optional[WebhookSettings]:
+    """Возвращает настройки вебхука, если в .env выбран BOT_MODE=webhook."""
+    config = dotenv_values(".env")
+    if (config.get('BOT_MODE') or 'polling').lower() != 'webhook':
+        return None
+    return WebhookSettings(
+        url=config.get('WEBHOOK_URL') or None,
+        listen=config.get('WEBHOOK_LISTEN') or WEBHOOK_LISTEN,
+        port=int(config.get('WEBHOOK_PORT') or WEBHOOK_PORT),
+        path=config.get('WEBHOOK_PATH') or WEBHOOK_PATH,
+        secret_token=config.get('WEBHOOK_SECRET_TOKEN') or None,
+        max_connections=int(config.get('WEBHOOK_MAX_CONNECTIONS') or WEBHOOK_MAX_CONNECTIONS),
+    )
+
+
+class WebhookServer:
+    """Принимает обновления от Telegram по HTTP и передает их в очередь Application."""
+
+    def __init__(self, application: Application, settings: WebhookSettings) -> None:
+        self.application = application
+        self.settings = settings
+        self.draining = False
+        self.http = HttpServer(settings.listen, settings.port)
+        self.http.route('POST', settings.path, self._receive_update)
+        self.http.route('GET', '/healthz', self._health)
+
+    async def _receive_update(self, request: Request) -> Response:
+        if self.settings.secret_token and request.headers.get(SECRET_TOKEN_HEADER) != self.settings.secret_token:
+            logger.warning("Rejected webhook request with invalid secret token.")
+            return Response(403, b'')
+        if self.draining:
+            # Telegram повторит доставку, когда бот поднимется снова
+            return Response(503, b'')
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return Response(400, b'')
+        await self.application.update_queue.put(update)
+        return Response(200, b'')
+
+    async def _health(self, _: Request) -> Response:
+        status = {
+            'status': 'draining' if self.draining else 'ok',
+            'running': self.application.running,
+            'pending_updates': self.application.update_queue.qsize(),
+        }
+        body = json.dumps(status).encode('utf-8')
+        ok = self.application.running and not self.draining
+        return Response(200 if ok else 503, body, content_type='application/json')
+
+
+async def run_webhook(application: Application, settings: WebhookSettings) -> None:
+    """Запускает бота в режиме вебхука и корректно останавливает его по SIGINT/SIGTERM.
+
+    При остановке сервер перестает принимать обновления, дожидается уже
+    полученных и только после этого завершает Application.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: остановка по Ctrl+C через KeyboardInterrupt
+            pass
+
+    server = WebhookServer(application, settings)
+    await application.initialize()
+    try:
+        # post_init внутри try: если он упадет на середине, уже запущенные ресурсы все равно освободятся
+        if application.post_init:
+            await application.post_init(application)
+        if settings.url:
+            await application.bot.set_webhook(
+                url=settings.url.rstrip('/') + settings.path,
+                secret_token=settings.secret_token,
+                max_connections=settings.max_connections,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Webhook registered at {settings.url}.")
+        await application.start()
+        await server.http.start()
+
+        await stop_event.wait()
+        logger.info("Stopping webhook server, draining pending updates.")
+    finally:
+        server.draining = True
+        await server.http.stop()
+        if application.running:
+            # Application.stop дорабатывает все обновления, уже стоящие в очереди
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)